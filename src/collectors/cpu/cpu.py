@@ -13,6 +13,7 @@ import diamond.collector
 import os
 import time
 from diamond.collector import str_to_bool
+from diamond.procfs import parse_table
 
 try:
     import psutil
@@ -26,6 +27,10 @@ class CPUCollector(diamond.collector.Collector):
     PROC = '/proc/stat'
     INTERVAL = 1
 
+    # Fields of the cpu lines of /proc/stat, in order
+    FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+              'steal', 'guest', 'guest_nice']
+
     MAX_VALUES = {
         'user': diamond.collector.MAX_COUNTER,
         'nice': diamond.collector.MAX_COUNTER,
@@ -73,12 +78,8 @@ class CPUCollector(diamond.collector.Collector):
             get cpu time list
             """
 
-            statFile = open(self.PROC, "r")
-            timeList = statFile.readline().split(" ")[2:6]
-            for i in range(len(timeList)):
-                timeList[i] = int(timeList[i])
-            statFile.close()
-            return timeList
+            rows = parse_table(self.read_proc(self.PROC), prefix='cpu ')
+            return list(rows[0][1][:4])
 
         def cpu_delta_time(interval):
             """
@@ -100,70 +101,31 @@ class CPUCollector(diamond.collector.Collector):
                 self.publish('percent', str('%.4f' % cpuPct))
                 return True
 
-            results = {}
-            # Open file
-            file = open(self.PROC)
-
-            ncpus = -1  # dont want to count the 'cpu'(total) cpu.
-            for line in file:
-                if not line.startswith('cpu'):
-                    continue
-
-                ncpus += 1
-                elements = line.split()
-
-                cpu = elements[0]
+            rows = parse_table(self.read_proc(self.PROC), prefix='cpu')
+            percore = str_to_bool(self.config['percore'])
 
+            ncpus = len(rows) - 1  # dont want to count the 'cpu'(total) cpu.
+            labels = []
+            values = []
+            for cpu, row in rows:
                 if cpu == 'cpu':
                     cpu = 'total'
-                elif not str_to_bool(self.config['percore']):
+                elif not percore:
                     continue
+                labels.append(cpu)
+                values.append(row[:len(self.FIELDS)])
 
-                results[cpu] = {}
-
-                if len(elements) >= 2:
-                    results[cpu]['user'] = elements[1]
-                if len(elements) >= 3:
-                    results[cpu]['nice'] = elements[2]
-                if len(elements) >= 4:
-                    results[cpu]['system'] = elements[3]
-                if len(elements) >= 5:
-                    results[cpu]['idle'] = elements[4]
-                if len(elements) >= 6:
-                    results[cpu]['iowait'] = elements[5]
-                if len(elements) >= 7:
-                    results[cpu]['irq'] = elements[6]
-                if len(elements) >= 8:
-                    results[cpu]['softirq'] = elements[7]
-                if len(elements) >= 9:
-                    results[cpu]['steal'] = elements[8]
-                if len(elements) >= 10:
-                    results[cpu]['guest'] = elements[9]
-                if len(elements) >= 11:
-                    results[cpu]['guest_nice'] = elements[10]
-
-            # Close File
-            file.close()
+            # The rates of all the fields of all the cpus, in one pass
+            rates = self.derivative_table('cpu', labels, values,
+                                          diamond.collector.MAX_COUNTER)
 
+            normalize = str_to_bool(self.config['normalize']) and ncpus > 0
             metrics = {}
-
-            for cpu in results.keys():
-                stats = results[cpu]
-                for s in stats.keys():
-                    # Get Metric Name
-                    metric_name = '.'.join([cpu, s])
-                    # Get actual data
-                    if (str_to_bool(self.config['normalize'])
-                            and cpu == 'total' and ncpus > 0):
-                        metrics[metric_name] = self.derivative(
-                            metric_name,
-                            long(stats[s]),
-                            self.MAX_VALUES[s]) / ncpus
-                    else:
-                        metrics[metric_name] = self.derivative(
-                            metric_name,
-                            long(stats[s]),
-                            self.MAX_VALUES[s])
+            for cpu, cpu_rates in zip(labels, rates):
+                if normalize and cpu == 'total':
+                    cpu_rates = [rate / ncpus for rate in cpu_rates]
+                for field, rate in zip(self.FIELDS, cpu_rates):
+                    metrics[cpu + '.' + field] = rate
 
             # Check for a bug in xen where the idle time is doubled for guest
             # See https://bugzilla.redhat.com/show_bug.cgi?id=624756
@@ -184,9 +146,7 @@ class CPUCollector(diamond.collector.Collector):
                     self.config['xenfix'] = False
 
             # Publish Metric Derivative
-            for metric_name in metrics.keys():
-                self.publish(metric_name,
-                             metrics[metric_name])
+            self.publish_many(metrics)
             return True
 
         else:
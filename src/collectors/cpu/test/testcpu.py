@@ -8,12 +8,6 @@ from test import unittest
 from mock import Mock
 from mock import patch
 
-try:
-    from cStringIO import StringIO
-    StringIO  # workaround for pyflakes issue #13
-except ImportError:
-    from StringIO import StringIO
-
 from diamond.collector import Collector
 from cpu import CPUCollector
 
@@ -32,18 +26,18 @@ class TestCPUCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(CPUCollector)
 
-    @patch('__builtin__.open')
+    @patch.object(Collector, 'read_proc')
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
-    def test_should_open_proc_stat(self, publish_mock, open_mock):
+    def test_should_open_proc_stat(self, publish_mock, read_mock):
         CPUCollector.PROC = '/proc/stat'
-        open_mock.return_value = StringIO('')
+        read_mock.return_value = ''
         self.collector.collect()
-        open_mock.assert_called_once_with('/proc/stat')
+        read_mock.assert_called_once_with('/proc/stat')
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_synthetic_data(self, publish_mock):
-        patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
+        patch_open = patch.object(Collector, 'read_proc', Mock(return_value=(
             'cpu 100 200 300 400 500 0 0 0 0 0')))
 
         patch_open.start()
@@ -52,7 +46,7 @@ class TestCPUCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
+        patch_open = patch.object(Collector, 'read_proc', Mock(return_value=(
             'cpu 110 220 330 440 550 0 0 0 0 0')))
 
         patch_open.start()
@@ -204,7 +198,7 @@ class TestCPUCollectorNormalize(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_work_proc_stat(self, publish_mock):
-        patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
+        patch_open = patch.object(Collector, 'read_proc', Mock(return_value=(
             "\n".join([self.input_dict_to_proc_string('', self.input_base),
                        self.input_dict_to_proc_string('0', self.input_base),
                        self.input_dict_to_proc_string('1', self.input_base),
@@ -217,7 +211,7 @@ class TestCPUCollectorNormalize(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
+        patch_open = patch.object(Collector, 'read_proc', Mock(return_value=(
             "\n".join([self.input_dict_to_proc_string('', self.input_next),
                        self.input_dict_to_proc_string('0', self.input_next),
                        self.input_dict_to_proc_string('1', self.input_next),
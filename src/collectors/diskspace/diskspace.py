@@ -3,6 +3,12 @@
 """
 Uses /proc/mounts and os.statvfs() to get disk space usage
 
+The calls to os.stat() and os.statvfs() run in threads, all mounts at once,
+and are given statvfs_timeout seconds: a mount not answering in time (a
+stale NFS or CIFS mount) is skipped until the call that hung returns, instead
+of blocking the collector. The mounts and the disk labels are only read
+again when /proc/mounts signals a change.
+
 #### Dependencies
 
  * /proc/mounts
@@ -24,6 +30,10 @@ import diamond.collector
 import diamond.convertor
 import os
 import re
+import select
+import threading
+
+from diamond.util import monotonic
 
 try:
     import psutil
@@ -31,6 +41,29 @@ try:
 except ImportError:
     psutil = None
 
+MOUNTS = '/proc/mounts'
+
+
+class PathCall(threading.Thread):
+    """
+    A call to func(path) in a thread of its own, which may never return
+    """
+
+    def __init__(self, func, path):
+        threading.Thread.__init__(self, name='%s(%s)' % (
+            getattr(func, '__name__', 'call'), path))
+        self.daemon = True
+        self.func = func
+        self.path = path
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.func(self.path)
+        except (IOError, OSError), e:
+            self.error = e
+
 
 class DiskSpaceCollector(diamond.collector.Collector):
 
@@ -41,6 +74,9 @@ class DiskSpaceCollector(diamond.collector.Collector):
             'exclude_filters': "A list of regex patterns. Any filesystem"
             + " matching any of these patterns will be excluded from disk"
             + " space metrics collection",
+            'statvfs_timeout': "Seconds to wait for the stat() and statvfs()"
+            + " of the mounts, a mount not answering in time is skipped until"
+            + " its call returns",
         })
         return config_help
 
@@ -76,7 +112,10 @@ class DiskSpaceCollector(diamond.collector.Collector):
             'method': 'Threaded',
 
             # Default numeric output
-            'byte_unit': ['byte']
+            'byte_unit': ['byte'],
+
+            # Seconds to wait for the stat() and statvfs() of the mounts
+            'statvfs_timeout': 5,
         })
         return config
 
@@ -97,6 +136,78 @@ class DiskSpaceCollector(diamond.collector.Collector):
         elif isinstance(self.config['filesystems'], list):
             self.filesystems = self.config['filesystems']
 
+        # Calls that did not return in time, by mount point, see call_paths
+        self.hung = {}
+
+        # Mounts and labels, read again when /proc/mounts changes
+        self.mounts_poll = None
+        self.file_systems = None
+        self.labels = None
+
+    def mounts_changed(self):
+        """
+        Return True if the mounts may have changed since the last call: on
+        the first call, when /proc/mounts signals a change (POLLPRI), or
+        always if it can't be polled
+        """
+        if self.mounts_poll is None:
+            try:
+                fd = os.open(MOUNTS, os.O_RDONLY)
+            except OSError:
+                return True
+            try:
+                self.mounts_poll = select.poll()
+            except AttributeError:
+                os.close(fd)
+                return True
+            self.mounts_poll.register(fd, select.POLLERR | select.POLLPRI)
+            self.mounts_fd = fd
+            return True
+        return bool(self.mounts_poll.poll(0))
+
+    def call_paths(self, func, paths):
+        """
+        Call func on each path, all at once, and return a dict of path to
+        (result, error) of the calls that returned within statvfs_timeout.
+        The paths whose call doesn't return in time are skipped until it
+        does.
+        """
+        timeout = float(self.config['statvfs_timeout'])
+        if timeout <= 0:
+            results = {}
+            for path in paths:
+                call = PathCall(func, path)
+                call.run()
+                results[path] = (call.result, call.error)
+            return results
+
+        calls = []
+        for path in paths:
+            hung = self.hung.get(path)
+            if hung is not None:
+                if hung.is_alive():
+                    self.log.warning("Skipping %s, %s has not returned yet",
+                                     path, hung.name)
+                    continue
+                del self.hung[path]
+                self.log.info("%s returned, polling %s again",
+                              hung.name, path)
+            call = PathCall(func, path)
+            call.start()
+            calls.append(call)
+
+        results = {}
+        deadline = monotonic() + timeout
+        for call in calls:
+            call.join(max(deadline - monotonic(), 0))
+            if call.is_alive():
+                self.log.error("%s did not return within %ss, skipping %s "
+                               "until it does", call.name, timeout, call.path)
+                self.hung[call.path] = call
+                continue
+            results[call.path] = (call.result, call.error)
+        return results
+
     def get_disk_labels(self):
         """
         Creates a mapping of device nodes to filesystem labels
@@ -123,8 +234,9 @@ class DiskSpaceCollector(diamond.collector.Collector):
           (major, minor) -> FileSystem(device, mount_point)
         """
         result = {}
-        if os.access('/proc/mounts', os.R_OK):
-            file = open('/proc/mounts')
+        if os.access(MOUNTS, os.R_OK):
+            mounts = []
+            file = open(MOUNTS)
             for line in file:
                 try:
                     mount = line.split()
@@ -154,26 +266,32 @@ class DiskSpaceCollector(diamond.collector.Collector):
                     continue
 
                 if '/' in device and mount_point.startswith('/'):
-                    try:
-                        stat = os.stat(mount_point)
-                        major = os.major(stat.st_dev)
-                        minor = os.minor(stat.st_dev)
-                    except OSError:
-                        self.log.debug("Path %s is not mounted - skipping.",
-                                       mount_point)
-                        continue
-
-                    if (major, minor) in result:
-                        continue
-
-                    result[(major, minor)] = {
-                        'device': device,
-                        'mount_point': mount_point,
-                        'fs_type': fs_type
-                    }
+                    mounts.append((device, mount_point, fs_type))
 
             file.close()
 
+            stats = self.call_paths(os.stat, [m[1] for m in mounts])
+            for device, mount_point, fs_type in mounts:
+                if mount_point not in stats:
+                    # Hung
+                    continue
+                stat, error = stats[mount_point]
+                if error is not None:
+                    self.log.debug("Path %s is not mounted - skipping.",
+                                   mount_point)
+                    continue
+                major = os.major(stat.st_dev)
+                minor = os.minor(stat.st_dev)
+
+                if (major, minor) in result:
+                    continue
+
+                result[(major, minor)] = {
+                    'device': device,
+                    'mount_point': mount_point,
+                    'fs_type': fs_type
+                }
+
         else:
             if not psutil:
                 self.log.error('Unable to import psutil')
@@ -191,12 +309,21 @@ class DiskSpaceCollector(diamond.collector.Collector):
         return result
 
     def collect(self):
-        labels = self.get_disk_labels()
-        results = self.get_file_systems()
+        # Read the mounts again when they changed, or some were skipped
+        if self.mounts_changed() or self.file_systems is None or self.hung:
+            self.labels = self.get_disk_labels()
+            self.file_systems = self.get_file_systems()
+        labels = self.labels
+        results = self.file_systems
         if not results:
             self.log.error('No diskspace metrics retrieved')
             return None
 
+        if hasattr(os, 'statvfs'):  # POSIX
+            statvfs = self.call_paths(
+                os.statvfs, [info['mount_point']
+                             for info in results.itervalues()])
+
         for key, info in results.iteritems():
             if info['device'] in labels:
                 name = labels[info['device']]
@@ -207,10 +334,12 @@ class DiskSpaceCollector(diamond.collector.Collector):
                     name = 'root'
 
             if hasattr(os, 'statvfs'):  # POSIX
-                try:
-                    data = os.statvfs(info['mount_point'])
-                except OSError, e:
-                    self.log.exception(e)
+                if info['mount_point'] not in statvfs:
+                    # Hung
+                    continue
+                data, error = statvfs[info['mount_point']]
+                if error is not None:
+                    self.log.error(error)
                     continue
 
                 block_size = data.f_bsize
@@ -2,6 +2,9 @@
 # coding=utf-8
 ################################################################################
 
+import os
+import threading
+
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
@@ -26,6 +29,11 @@ def run_only_if_major_is_available(func):
     return run_only(func, pred)
 
 
+def run_only_if_proc_mounts_is_available(func):
+    pred = lambda: os.access('/proc/mounts', os.R_OK)
+    return run_only(func, pred)
+
+
 class TestDiskSpaceCollector(CollectorTestCase):
     def setUp(self):
         config = get_collector_config('DiskSpaceCollector', {
@@ -137,6 +145,64 @@ class TestDiskSpaceCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    def test_call_paths_skips_hung_paths(self):
+        self.collector.config['statvfs_timeout'] = 0.2
+        release = threading.Event()
+        calls = []
+
+        def statvfs(path):
+            calls.append(path)
+            if path == '/hung':
+                release.wait()
+            elif path == '/gone':
+                raise OSError(2, 'No such file or directory')
+            return path.upper()
+
+        paths = ['/', '/hung', '/gone']
+        results = self.collector.call_paths(statvfs, paths)
+        self.assertEqual(sorted(results), ['/', '/gone'])
+        self.assertEqual(results['/'], ('/', None))
+        self.assertEqual(results['/gone'][1].errno, 2)
+
+        # Not called again while the first call hangs
+        results = self.collector.call_paths(statvfs, paths)
+        self.assertEqual(sorted(results), ['/', '/gone'])
+        self.assertEqual(calls.count('/hung'), 1)
+
+        release.set()
+        self.collector.hung['/hung'].join()
+        results = self.collector.call_paths(statvfs, paths)
+        self.assertEqual(results['/hung'], ('/HUNG', None))
+        self.assertEqual(self.collector.hung, {})
+
+    @patch.object(Collector, 'publish')
+    @patch('os.statvfs')
+    def test_mounts_are_cached(self, statvfs_mock, publish_mock):
+        statvfs_mock.return_value = os.statvfs_result(
+            (4096, 4096, 100, 50, 50, 10, 5, 5, 4096, 255))
+        get_file_systems = Mock(return_value={
+            (9, 0): {'device': '/dev/sda1', 'fs_type': 'ext4',
+                     'mount_point': '/'}})
+        self.collector.get_file_systems = get_file_systems
+        self.collector.get_disk_labels = Mock(return_value={})
+
+        with patch.object(DiskSpaceCollector, 'mounts_changed',
+                          Mock(return_value=False)):
+            self.collector.collect()
+            self.collector.collect()
+        self.assertEqual(get_file_systems.call_count, 1)
+        self.assertEqual(statvfs_mock.call_count, 2)
+
+        with patch.object(DiskSpaceCollector, 'mounts_changed',
+                          Mock(return_value=True)):
+            self.collector.collect()
+        self.assertEqual(get_file_systems.call_count, 2)
+
+    @run_only_if_proc_mounts_is_available
+    def test_mounts_changed(self):
+        self.assertTrue(self.collector.mounts_changed())
+        self.assertFalse(self.collector.mounts_changed())
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
@@ -19,6 +19,7 @@ import diamond.convertor
 import time
 import os
 import re
+from diamond.procfs import parse_table
 
 try:
     import psutil
@@ -84,43 +85,35 @@ class DiskUsageCollector(diamond.collector.Collector):
 
         if os.access('/proc/diskstats', os.R_OK):
             self.proc_diskstats = True
-            fp = open('/proc/diskstats')
-
-            try:
-                for line in fp:
-                    try:
-                        columns = line.split()
-                        # On early linux v2.6 versions, partitions have only 4
-                        # output fields not 11. From linux 2.6.25 partitions
-                        # have the full stats set.
-                        if len(columns) < 14:
-                            continue
-                        major = int(columns[0])
-                        minor = int(columns[1])
-                        device = columns[2]
-
-                        if (device.startswith('ram')
-                                or device.startswith('loop')):
-                            continue
-
-                        result[(major, minor)] = {
-                            'device': device,
-                            'reads': float(columns[3]),
-                            'reads_merged': float(columns[4]),
-                            'reads_sectors': float(columns[5]),
-                            'reads_milliseconds': float(columns[6]),
-                            'writes': float(columns[7]),
-                            'writes_merged': float(columns[8]),
-                            'writes_sectors': float(columns[9]),
-                            'writes_milliseconds': float(columns[10]),
-                            'io_in_progress': float(columns[11]),
-                            'io_milliseconds': float(columns[12]),
-                            'io_milliseconds_weighted': float(columns[13])
-                        }
-                    except ValueError:
-                        continue
-            finally:
-                fp.close()
+
+            # On early linux v2.6 versions, partitions have only 4 output
+            # fields not 11. From linux 2.6.25 partitions have the full
+            # stats set.
+            rows = parse_table(self.read_proc('/proc/diskstats'), labels=3,
+                               min_values=11)
+            for (major, minor, device), columns in rows:
+                if device.startswith('ram') or device.startswith('loop'):
+                    continue
+                try:
+                    major = int(major)
+                    minor = int(minor)
+                except ValueError:
+                    continue
+
+                result[(major, minor)] = {
+                    'device': device,
+                    'reads': float(columns[0]),
+                    'reads_merged': float(columns[1]),
+                    'reads_sectors': float(columns[2]),
+                    'reads_milliseconds': float(columns[3]),
+                    'writes': float(columns[4]),
+                    'writes_merged': float(columns[5]),
+                    'writes_sectors': float(columns[6]),
+                    'writes_milliseconds': float(columns[7]),
+                    'io_in_progress': float(columns[8]),
+                    'io_milliseconds': float(columns[9]),
+                    'io_milliseconds_weighted': float(columns[10])
+                }
         else:
             self.proc_diskstats = False
             if not psutil:
@@ -281,7 +274,7 @@ class DiskUsageCollector(diamond.collector.Collector):
 
             # Only publish when we have io figures
             if (metrics['io'] > 0 or self.config['send_zero']):
-                for key in metrics:
-                    metric_name = '.'.join([info['device'], key]).replace(
-                        '/', '_')
-                    self.publish(metric_name, metrics[key])
+                self.publish_many(
+                    ('.'.join([info['device'], key]).replace('/', '_'),
+                     metrics[key])
+                    for key in metrics)
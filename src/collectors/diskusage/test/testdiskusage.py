@@ -33,15 +33,15 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch('os.access', Mock(return_value=True))
     def test_get_disk_statistics(self):
 
-        patch_open = patch(
-            '__builtin__.open',
-            Mock(return_value=self.getFixture('diskstats')))
+        patch_open = patch.object(
+            Collector, 'read_proc',
+            Mock(return_value=self.getFixture('diskstats').getvalue()))
 
-        open_mock = patch_open.start()
+        read_mock = patch_open.start()
         result = self.collector.get_disk_statistics()
         patch_open.stop()
 
-        open_mock.assert_called_once_with('/proc/diskstats')
+        read_mock.assert_called_once_with('/proc/diskstats')
 
         self.assertEqual(
             sorted(result.keys()),
@@ -54,10 +54,10 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
-                return_value=self.getFixture('proc_diskstats_1')))
+                return_value=self.getFixture('proc_diskstats_1').getvalue()))
         patch_time = patch('time.time', Mock(return_value=10))
 
         patch_open.start()
@@ -68,10 +68,10 @@ class TestDiskUsageCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
-                return_value=self.getFixture('proc_diskstats_2')))
+                return_value=self.getFixture('proc_diskstats_2').getvalue()))
         patch_time = patch('time.time', Mock(return_value=20))
 
         patch_open.start()
@@ -90,11 +90,11 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_verify_supporting_vda_and_xvdb(self, publish_mock):
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_1_vda_xvdb')))
+                    'proc_diskstats_1_vda_xvdb').getvalue()))
         patch_time = patch('time.time', Mock(return_value=10))
 
         patch_open.start()
@@ -105,11 +105,11 @@ class TestDiskUsageCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_2_vda_xvdb')))
+                    'proc_diskstats_2_vda_xvdb').getvalue()))
         patch_time = patch('time.time', Mock(return_value=20))
 
         patch_open.start()
@@ -126,11 +126,11 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_verify_supporting_md_dm(self, publish_mock):
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_1_md_dm')))
+                    'proc_diskstats_1_md_dm').getvalue()))
         patch_time = patch('time.time', Mock(return_value=10))
 
         patch_open.start()
@@ -141,11 +141,11 @@ class TestDiskUsageCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_2_md_dm')))
+                    'proc_diskstats_2_md_dm').getvalue()))
         patch_time = patch('time.time', Mock(return_value=20))
 
         patch_open.start()
@@ -161,11 +161,11 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_verify_supporting_disk(self, publish_mock):
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_1_disk')))
+                    'proc_diskstats_1_disk').getvalue()))
         patch_time = patch('time.time', Mock(return_value=10))
 
         patch_open.start()
@@ -176,11 +176,11 @@ class TestDiskUsageCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_2_disk')))
+                    'proc_diskstats_2_disk').getvalue()))
         patch_time = patch('time.time', Mock(return_value=20))
 
         patch_open.start()
@@ -195,11 +195,11 @@ class TestDiskUsageCollector(CollectorTestCase):
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_service_Time(self, publish_mock):
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_1_service_time')))
+                    'proc_diskstats_1_service_time').getvalue()))
         patch_time = patch('time.time', Mock(return_value=10))
 
         patch_open.start()
@@ -210,11 +210,11 @@ class TestDiskUsageCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {})
 
-        patch_open = patch(
-            '__builtin__.open',
+        patch_open = patch.object(
+            Collector, 'read_proc',
             Mock(
                 return_value=self.getFixture(
-                    'proc_diskstats_2_service_time')))
+                    'proc_diskstats_2_service_time').getvalue()))
         patch_time = patch('time.time', Mock(return_value=70))
 
         patch_open.start()
@@ -7,14 +7,18 @@ Supports multiple instances. When using the 'instances'
 parameter the instance alias will be appended to the
 'path' parameter.
 
+The stats are parsed as they are read, keeping only the values published,
+so that the index stats of large clusters don't have to be loaded whole.
+Set 'index_patterns' to collect the stats of some of the indices only.
+
 #### Dependencies
 
  * urlib2
 
 """
 
-import urllib2
 import re
+import urllib
 from diamond.collector import str_to_bool
 
 try:
@@ -25,8 +29,40 @@ except ImportError:
 
 import diamond.collector
 
+from diamond import jsonstream
+from diamond.httpclient import HTTPClient
+
 RE_LOGSTASH_INDEX = re.compile('^(.*)-\d\d\d\d\.\d\d\.\d\d$')
 
+# Parts of the stats of the node that are published
+NODE_PATHS = [
+    'http.current_open',
+    'indices.docs',
+    'indices.store.size_in_bytes',
+    'indices.cache',
+    'indices.filter_cache',
+    'indices.id_cache',
+    'indices.fielddata',
+    'transport',
+    'process.cpu.percent',
+    'process.mem',
+    'fs.data.0',
+    'network',
+]
+NODE_STATS_PATHS = {
+    'jvm': ['jvm.mem', 'jvm.threads.count', 'jvm.gc'],
+    'thread_pool': ['thread_pool'],
+}
+
+# Stats of an index that are published
+INDEX_PATHS = [
+    'docs.count',
+    'docs.deleted',
+    'store.size_in_bytes',
+    '*.*total',
+    '*.*time_in_millis',
+]
+
 
 class ElasticSearchCollector(diamond.collector.Collector):
 
@@ -60,6 +96,32 @@ class ElasticSearchCollector(diamond.collector.Collector):
 
             self.instances[alias] = (host, int(port))
 
+        self.http = HTTPClient(timeout=float(self.config['timeout']))
+
+        index_patterns = self.config['index_patterns']
+        if isinstance(index_patterns, basestring):
+            index_patterns = index_patterns.split(',')
+        self.index_patterns = [pattern.strip() for pattern in index_patterns
+                               if pattern.strip()]
+
+        node_paths = list(NODE_PATHS)
+        for stat, paths in NODE_STATS_PATHS.iteritems():
+            if stat in self.config['stats']:
+                node_paths.extend(paths)
+        self.node_paths = jsonstream.build_paths(
+            ['nodes.*.' + path for path in node_paths])
+
+        index_paths = []
+        for pattern in self.index_patterns or ['*']:
+            for path in INDEX_PATHS:
+                path = path.split('.')
+                index_paths.append(['_all', 'primaries'] + path)
+                index_paths.append(['indices', pattern, 'primaries'] + path)
+                # elasticsearch < 0.90RC2
+                index_paths.append(['_all', 'indices', pattern,
+                                    'primaries'] + path)
+        self.index_paths = jsonstream.build_paths(index_paths)
+
     def get_default_config_help(self):
         config_help = super(ElasticSearchCollector,
                             self).get_default_config_help()
@@ -77,6 +139,11 @@ class ElasticSearchCollector(diamond.collector.Collector):
             + "the YYYY.MM.DD suffix from the index name "
             + "(e.g. logstash-adm-syslog-2014.01.03) and use that "
             + "as a bucket for all 'day' index stats.",
+            'index_patterns': "Patterns of the names of the indices "
+            + "whose stats are collected, all of them by default "
+            + "(e.g. logstash-*,users). indices._all then sums the "
+            + "stats of these indices only.",
+            'timeout': "Seconds to wait for a response",
         })
         return config_help
 
@@ -93,27 +160,36 @@ class ElasticSearchCollector(diamond.collector.Collector):
             'stats':          ['jvm', 'thread_pool', 'indices'],
             'logstash_mode': False,
             'cluster':       False,
+            'timeout':       10,
+            'index_patterns': [],
         })
         return config
 
-    def _get(self, host, port, path, assert_key=None):
+    def _get(self, host, port, path, assert_key=None, paths=None):
         """
         Execute a ES API call. Convert response into JSON and
-        optionally assert its structure.
+        optionally assert its structure. With paths, the tree of the
+        paths built by jsonstream, keep only the values on those.
         """
         url = 'http://%s:%i/%s' % (host, port, path)
         try:
-            response = urllib2.urlopen(url)
+            response = self.http.urlopen(url)
         except Exception, err:
             self.log.error("%s: %s", url, err)
             return False
 
         try:
-            doc = json.load(response)
+            if paths is None:
+                doc = json.load(response)
+            else:
+                doc = jsonstream.load(response, paths)
         except (TypeError, ValueError):
             self.log.error("Unable to parse response from elasticsearch as a"
                            + " json object")
             return False
+        except IOError, err:
+            self.log.error("%s: %s", url, err)
+            return False
 
         if assert_key and not assert_key in doc:
             self.log.error("Bad response from elasticsearch, expected key "
@@ -196,9 +272,12 @@ class ElasticSearchCollector(diamond.collector.Collector):
                          result, ['initializing_shards'])
 
     def collect_instance_index_stats(self, host, port, metrics):
-        result = self._get(host, port,
-                           '_stats?clear=true&docs=true&store=true&'
-                           + 'indexing=true&get=true&search=true', '_all')
+        path = ('_stats?clear=true&docs=true&store=true&'
+                + 'indexing=true&get=true&search=true')
+        if self.index_patterns:
+            indices = urllib.quote(','.join(self.index_patterns), safe='*,')
+            path = '%s/%s' % (indices, path)
+        result = self._get(host, port, path, '_all', self.index_paths)
         if not result:
             return
 
@@ -217,7 +296,8 @@ class ElasticSearchCollector(diamond.collector.Collector):
                                 index['primaries'])
 
     def collect_instance(self, alias, host, port):
-        result = self._get(host, port, '_nodes/_local/stats?all=true', 'nodes')
+        result = self._get(host, port, '_nodes/_local/stats?all=true',
+                           'nodes', self.node_paths)
         if not result:
             return
 
@@ -56,7 +56,7 @@ class TestElasticSearchCollector(CollectorTestCase):
             self.getFixture('cluster_stats'),
             self.getFixture('indices_stats'),
         ]
-        urlopen_mock = patch('urllib2.urlopen', Mock(
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             side_effect=lambda *args: returns.pop(0)))
 
         self.collector.config['cluster'] = True
@@ -112,7 +112,7 @@ class TestElasticSearchCollector(CollectorTestCase):
             self.getFixture('stats'),
             self.getFixture('logstash_indices_stats'),
         ]
-        urlopen_mock = patch('urllib2.urlopen', Mock(
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             side_effect=lambda *args: returns.pop(0)))
 
         self.collector.config['logstash_mode'] = True
@@ -184,7 +184,7 @@ class TestElasticSearchCollector(CollectorTestCase):
             self.getFixture('stats0.90'),
             self.getFixture('indices_stats'),
         ]
-        urlopen_mock = patch('urllib2.urlopen', Mock(
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             side_effect=lambda *args: returns.pop(0)))
 
         urlopen_mock.start()
@@ -208,9 +208,41 @@ class TestElasticSearchCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_index_patterns(self, publish_mock):
+        config = get_collector_config('ElasticSearchCollector', {
+            'index_patterns': '*-2014.01.01, *-2014.01.02',
+        })
+        self.collector = ElasticSearchCollector(config, None)
+
+        returns = [
+            self.getFixture('stats'),
+            self.getFixture('logstash_indices_stats'),
+        ]
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
+            side_effect=lambda *args: returns.pop(0)))
+
+        urlopen_mock.start()
+        self.collector.collect()
+        urlopen_mock.stop()
+
+        # Only the stats of those indices are asked for
+        url = urlopen_mock.new.call_args[0][0]
+        self.assertTrue(url.startswith(
+            'http://127.0.0.1:9200/*-2014.01.01,*-2014.01.02/_stats?'), url)
+
+        # and parsed
+        self.assertUnpublished(
+            publish_mock, 'indices.logstash-adm-syslog-2014.01.03.docs.count',
+            0)
+        self.assertPublishedMany(publish_mock, {
+            'indices.logstash-adm-syslog-2014.01.01.docs.count': 667738,
+            'indices.logstash-adm-syslog-2014.01.02.docs.count': 18498734,
+        })
+
     @patch.object(Collector, 'publish')
     def test_should_fail_gracefully(self, publish_mock):
-        urlopen_mock = patch('urllib2.urlopen', Mock(
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
                              return_value=self.getFixture('stats_blank')))
 
         urlopen_mock.start()
@@ -235,7 +267,7 @@ class TestElasticSearchCollector(CollectorTestCase):
             self.getFixture('stats2'),
             self.getFixture('indices_stats2'),
         ]
-        urlopen_mock = patch('urllib2.urlopen', Mock(
+        urlopen_mock = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             side_effect=lambda *args: returns.pop(0)))
 
         urlopen_mock.start()
@@ -1,7 +1,13 @@
 # coding=utf-8
 
 """
-Uses lsof to collect data on number of open files per user per type
+Collect the number of open files, and of open files per user per type
+
+The open files of the users are counted by walking /proc/<pid>/fd once,
+instead of running lsof for each user. Each file descriptor is classified
+like lsof does: REG, DIR, CHR, BLK, FIFO, IPv4, IPv6, unix, netlink, sock
+(other sockets) and a_inode. Unlike lsof, the current directories, program
+texts and memory mapped files of the processes are not counted.
 
 #### Config Options
 
@@ -40,27 +46,68 @@ Uses lsof to collect data on number of open files per user per type
  * collect_user_data - This enables or disables the collection of user specific
     file handles. (default = False)
 
+ * cache_users - Keep the names and groups of the users between runs, instead
+    of looking them up on every run. (default = True)
+
 #### Dependencies
 
  * /proc/sys/fs/file-nr
- * /usr/sbin/lsof
+ * /proc/<pid>/fd, readable for all the processes when run as root
 
 """
 
 import diamond.collector
+import grp
+import pwd
 import re
 import os
+import stat
 
 _RE = re.compile(r'(\d+)\s+(\d+)\s+(\d+)')
 
+# lsof type of the files, by stat.S_IFMT
+FILE_TYPES = {
+    stat.S_IFREG: 'REG',
+    stat.S_IFDIR: 'DIR',
+    stat.S_IFCHR: 'CHR',
+    stat.S_IFBLK: 'BLK',
+    stat.S_IFIFO: 'FIFO',
+    stat.S_IFSOCK: 'sock',
+    stat.S_IFLNK: 'LINK',
+}
+
+# lsof type of the sockets listed in /proc/net/<file>, and the column of
+# their inode
+SOCKET_TABLES = [
+    ('tcp', 'IPv4', 9),
+    ('udp', 'IPv4', 9),
+    ('raw', 'IPv4', 9),
+    ('tcp6', 'IPv6', 9),
+    ('udp6', 'IPv6', 9),
+    ('raw6', 'IPv6', 9),
+    ('unix', 'unix', 6),
+    ('netlink', 'netlink', 9),
+]
+
 
 class FilestatCollector(diamond.collector.Collector):
 
     PROC = '/proc/sys/fs/file-nr'
+    PROC_PIDS = '/proc'
+
+    def __init__(self, *args, **kwargs):
+        super(FilestatCollector, self).__init__(*args, **kwargs)
+        # uid to user name, and user name to groups, see cache_users
+        self.user_names = {}
+        self.user_groups = {}
 
     def get_default_config_help(self):
         config_help = super(FilestatCollector, self).get_default_config_help()
         config_help.update({
+            'collect_user_data': 'Collect the number of open files per ' +
+                                 'user per type',
+            'cache_users': 'Keep the names and groups of the users ' +
+                           'between runs',
         })
         return config_help
 
@@ -80,14 +127,117 @@ class FilestatCollector(diamond.collector.Collector):
             'uid_max': 65536,
             'type_include': None,
             'type_exclude': None,
-            'collect_user_data': False
+            'collect_user_data': False,
+            'cache_users': True,
         })
         return config
 
-    def get_userlist(self):
+    def get_user_name(self, uid):
+        """
+        Return the name of the user of a uid, the uid if it has none
+        """
+        name = self.user_names.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self.user_names[uid] = name
+        return name
+
+    def get_user_groups(self, user):
+        """
+        Return the names of the groups of a user, like `id -Gn`
         """
-        This collects all the users with open files on the system, and filters
-        based on the variables user_include and user_exclude
+        groups = self.user_groups.get(user)
+        if groups is None:
+            groups = []
+            try:
+                gid = pwd.getpwnam(user).pw_gid
+            except KeyError:
+                gid = None
+            for group in grp.getgrall():
+                if group.gr_gid == gid or user in group.gr_mem:
+                    groups.append(group.gr_name)
+            self.user_groups[user] = groups
+        return groups
+
+    def get_uid(self, user):
+        try:
+            return pwd.getpwnam(user).pw_uid
+        except KeyError:
+            # Named after its uid, see get_user_name
+            return int(user)
+
+    def get_socket_types(self):
+        """
+        Return the lsof type of the sockets by inode, from /proc/net
+        """
+        types = {}
+        for name, socket_type, column in SOCKET_TABLES:
+            path = os.path.join(self.PROC_PIDS, 'net', name)
+            try:
+                lines = self.read_proc(path).splitlines()[1:]
+            except (IOError, OSError):
+                continue
+            for line in lines:
+                fields = line.split()
+                if len(fields) > column:
+                    types[fields[column]] = socket_type
+        return types
+
+    def scan_fds(self):
+        """
+        Walk /proc/<pid>/fd once, and return the number of open files by
+        user name and type
+        """
+        socket_types = self.get_socket_types()
+        counts = {}
+        for pid in os.listdir(self.PROC_PIDS):
+            if not pid.isdigit():
+                continue
+            pid_path = os.path.join(self.PROC_PIDS, pid)
+            fd_path = os.path.join(pid_path, 'fd')
+            try:
+                uid = os.stat(pid_path).st_uid
+                fds = os.listdir(fd_path)
+            except OSError:
+                # Exited, or not ours to look at
+                continue
+            user_counts = counts.setdefault(uid, {})
+            for fd in fds:
+                path = os.path.join(fd_path, fd)
+                try:
+                    target = os.readlink(path)
+                except OSError:
+                    continue
+                if target.startswith('socket:['):
+                    file_type = socket_types.get(target[8:-1], 'sock')
+                elif target.startswith('pipe:['):
+                    file_type = 'FIFO'
+                elif target.startswith('anon_inode:'):
+                    file_type = 'a_inode'
+                else:
+                    # Through the fd, to stat deleted files too
+                    try:
+                        mode = os.stat(path).st_mode
+                    except OSError:
+                        continue
+                    file_type = FILE_TYPES.get(stat.S_IFMT(mode), 'unknown')
+                user_counts[file_type] = user_counts.get(file_type, 0) + 1
+
+        if not diamond.collector.str_to_bool(self.config['cache_users']):
+            self.user_names = {}
+            self.user_groups = {}
+        data = {}
+        for uid, user_counts in counts.iteritems():
+            data[self.get_user_name(uid)] = user_counts
+        return data
+
+    def get_userlist(self, rawusers):
+        """
+        This filters the users with open files on the system based on the
+        variables user_include and user_exclude
         """
     # convert user/group  lists to arrays if strings
         if isinstance(self.config['user_include'], basestring):
@@ -99,14 +249,12 @@ class FilestatCollector(diamond.collector.Collector):
         if isinstance(self.config['group_exclude'], basestring):
             self.config['group_exclude'] = self.config['group_exclude'].split()
 
-        rawusers = os.popen("lsof | awk '{ print $3 }' | sort | uniq -d"
-                            ).read().split()
         userlist = []
 
         # remove any not on the user include list
         if (self.config['user_include'] is None
                 or len(self.config['user_include']) == 0):
-            userlist = rawusers
+            userlist = list(rawusers)
         else:
             # only work with specified include list, which is added at the end
             userlist = []
@@ -116,9 +264,8 @@ class FilestatCollector(diamond.collector.Collector):
         if (self.config['group_include'] is not None
                 and len(self.config['group_include']) > 0):
             for u in rawusers:
-                self.log.info(u)
                 # get list of groups of user
-                user_groups = os.popen("id -Gn %s" % (u)).read().split()
+                user_groups = self.get_user_groups(u)
                 for gi in self.config['group_include']:
                     if gi in user_groups and u not in userlist:
                         userlist.append(u)
@@ -132,7 +279,7 @@ class FilestatCollector(diamond.collector.Collector):
             tmplist = userlist[:]
             for u in tmplist:
                 # get list of groups of user
-                groups = os.popen("id -Gn %s" % (u)).read().split()
+                groups = self.get_user_groups(u)
                 for gi in self.config['group_exclude']:
                     if gi in groups:
                         userlist.remove(u)
@@ -147,7 +294,7 @@ class FilestatCollector(diamond.collector.Collector):
             if (self.config['user_include'] is None
                     or u not in self.config['user_include']):
                 if u not in addedByGroup:
-                    uid = int(os.popen("id -u %s" % (u)).read())
+                    uid = self.get_uid(u)
                     if (uid < self.config['uid_min']
                             and self.config['uid_min'] is not None
                             and u in userlist):
@@ -173,9 +320,10 @@ class FilestatCollector(diamond.collector.Collector):
 
         return userlist
 
-    def get_typelist(self):
+    def get_typelist(self, rawtypes):
         """
-        This collects all avaliable types and applies include/exclude filters
+        This filters the types of the open files and applies include/exclude
+        filters
         """
         typelist = []
 
@@ -188,32 +336,36 @@ class FilestatCollector(diamond.collector.Collector):
         # remove any not in include list
         if self.config['type_include'] is None or len(
                 self.config['type_include']) == 0:
-            typelist = os.popen("lsof | awk '{ print $5 }' | sort | uniq -d"
-                                ).read().split()
+            typelist = sorted(rawtypes)
         else:
-            typelist = self.config['type_include']
+            typelist = list(self.config['type_include'])
 
         # remove any in the exclude list
         if self.config['type_exclude'] is not None and len(
-                self.config['type_include']) > 0:
+                self.config['type_exclude']) > 0:
             for t in self.config['type_exclude']:
                 if t in typelist:
                     typelist.remove(t)
 
         return typelist
 
-    def process_lsof(self, users, types):
+    def process_fds(self):
         """
-        Get the list of users and file types to collect for and collect the
-        data from lsof
+        Collect the number of open files of the users and types to collect
+        for, in a single walk of /proc
         """
+        counts = self.scan_fds()
+        rawtypes = set()
+        for user_counts in counts.itervalues():
+            rawtypes.update(user_counts)
+        users = self.get_userlist(counts.keys())
+        types = self.get_typelist(rawtypes)
+
         d = {}
         for u in users:
             d[u] = {}
-            tmp = os.popen("lsof -bu %s | awk '{ print $5 }'" % (
-                u)).read().split()
             for t in types:
-                d[u][t] = tmp.count(t)
+                d[u][t] = counts[u].get(t, 0)
         return d
 
     def collect(self):
@@ -231,8 +383,8 @@ class FilestatCollector(diamond.collector.Collector):
         file.close()
 
         # collect open files per user per type
-        if self.config['collect_user_data']:
-            data = self.process_lsof(self.get_userlist(), self.get_typelist())
+        if diamond.collector.str_to_bool(self.config['collect_user_data']):
+            data = self.process_fds()
             for ukey in data.iterkeys():
                 for tkey in data[ukey].iterkeys():
                     self.log.debug('files.user.%s.%s %s' % (
@@ -2,6 +2,11 @@
 # coding=utf-8
 ################################################################################
 
+import os
+import pwd
+import shutil
+import tempfile
+
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
@@ -55,6 +60,62 @@ class TestFilestatCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+
+class TestFilestatScan(CollectorTestCase):
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        fd_path = os.path.join(self.proc, '1234', 'fd')
+        os.makedirs(fd_path)
+        os.makedirs(os.path.join(self.proc, 'self'))
+        os.makedirs(os.path.join(self.proc, 'net'))
+        open(os.path.join(self.proc, 'net', 'tcp'), 'w').write(
+            '  sl  local_address rem_address   st tx_queue rx_queue tr '
+            'tm->when retrnsmt   uid  timeout inode\n'
+            '   0: 0100007F:BC8F 00000000:0000 0A 00000000:00000000 '
+            '00:00000000 00000000 65534        0 907 1 0000 100 0 0 10 0\n')
+        open(os.path.join(self.proc, 'net', 'unix'), 'w').write(
+            'Num       RefCount Protocol Flags    Type St Inode Path\n'
+            '00000000ed8f19a8: 00000003 00000000 00000000 0001 03   658\n')
+
+        regular = os.path.join(self.proc, 'file')
+        open(regular, 'w').close()
+        for fd, target in enumerate([regular, regular, self.proc,
+                                     '/dev/null', 'pipe:[1]',
+                                     'socket:[907]', 'socket:[658]',
+                                     'socket:[1]', 'anon_inode:[eventfd]']):
+            os.symlink(target, os.path.join(fd_path, str(fd)))
+
+        config = get_collector_config('FilestatCollector', {
+            'collect_user_data': True,
+        })
+        self.collector = FilestatCollector(config, None)
+        self.collector.PROC_PIDS = self.proc
+        self.user = pwd.getpwuid(os.getuid()).pw_name
+
+    def tearDown(self):
+        shutil.rmtree(self.proc)
+
+    def test_scan_fds(self):
+        self.assertEqual(self.collector.scan_fds(), {self.user: {
+            'REG': 2,
+            'DIR': 1,
+            'CHR': 1,
+            'FIFO': 1,
+            'IPv4': 1,
+            'unix': 1,
+            'sock': 1,
+            'a_inode': 1,
+        }})
+
+    def test_process_fds(self):
+        self.collector.config['type_include'] = 'REG sock'
+        self.collector.config['uid_max'] = os.getuid()
+        self.assertEqual(self.collector.process_fds(),
+                         {self.user: {'REG': 2, 'sock': 1}})
+
+        self.collector.config['user_exclude'] = self.user
+        self.assertEqual(self.collector.process_fds(), {})
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
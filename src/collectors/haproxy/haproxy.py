@@ -16,9 +16,15 @@ import base64
 import csv
 import diamond.collector
 
+from diamond.httpclient import HTTPClient
+
 
 class HAProxyCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(HAProxyCollector, self).__init__(*args, **kwargs)
+        self.http = HTTPClient(timeout=float(self.config['timeout']))
+
     def get_default_config_help(self):
         config_help = super(HAProxyCollector, self).get_default_config_help()
         config_help.update({
@@ -27,6 +33,7 @@ class HAProxyCollector(diamond.collector.Collector):
             'pass': "Password",
             'ignore_servers': "Ignore servers, just collect frontend and "
                               + "backend stats",
+            'timeout': "Seconds to wait for a response",
         })
         return config_help
 
@@ -41,6 +48,7 @@ class HAProxyCollector(diamond.collector.Collector):
             'user':             'admin',
             'pass':             'password',
             'ignore_servers':   False,
+            'timeout':          10,
         })
         return config
 
@@ -60,7 +68,7 @@ class HAProxyCollector(diamond.collector.Collector):
         metrics = []
         req = urllib2.Request(self._get_config_value(section, 'url'))
         try:
-            handle = urllib2.urlopen(req)
+            handle = self.http.urlopen(req)
             return handle.readlines()
         except Exception, e:
             if not hasattr(e, 'code') or e.code != 401:
@@ -95,7 +103,7 @@ class HAProxyCollector(diamond.collector.Collector):
         authheader = 'Basic %s' % base64string
         req.add_header("Authorization", authheader)
         try:
-            handle = urllib2.urlopen(req)
+            handle = self.http.urlopen(req)
             metrics = handle.readlines()
             return metrics
         except IOError, e:
@@ -33,9 +33,21 @@ import diamond.collector
 import datetime
 import urlparse
 
+from diamond.collector import str_to_bool
+from diamond.httpclient import HTTPClient
+
 
 class HttpCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(HttpCollector, self).__init__(*args, **kwargs)
+        timeout = float(self.config['timeout'])
+        if str_to_bool(self.config['keepalive']):
+            self.http = HTTPClient(timeout=timeout)
+        else:
+            # A new connection for every request, its time is measured too
+            self.http = HTTPClient(timeout=timeout, max_connections=0)
+
     def get_default_config_help(self):
         config_help = super(HttpCollector, self).get_default_config_help()
         config_help.update({
@@ -44,6 +56,9 @@ class HttpCollector(diamond.collector.Collector):
             'array of full URL to get (ex : https://www.ici.net/mypage.html)',
             'req_vhost':
             'Host header variable if needed. Will be added to every request',
+            'timeout': 'Seconds to wait for a response',
+            'keepalive': ('Keep the connection open between requests. The '
+                          'time measured then leaves out connecting'),
         })
         return config_help
 
@@ -52,6 +67,8 @@ class HttpCollector(diamond.collector.Collector):
         default_config['path'] = 'http'
         default_config['req_vhost'] = ''
         default_config['req_url'] = ['http://localhost/']
+        default_config['timeout'] = 10
+        default_config['keepalive'] = False
 
         default_config['headers'] = {'User-Agent': 'Diamond HTTP collector', }
         return default_config
@@ -67,7 +84,7 @@ class HttpCollector(diamond.collector.Collector):
                 req_start = datetime.datetime.now()
                 req = urllib2.Request(url, headers=self.config['headers'])
                 try:
-                        handle = urllib2.urlopen(req)
+                        handle = self.http.urlopen(req)
                         the_page = handle.read()
                         req_end = datetime.datetime.now()
                         req_time = req_end - req_start
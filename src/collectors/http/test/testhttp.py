@@ -31,7 +31,7 @@ class TestHttpCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen', Mock(
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             return_value=self.getFixture('index')))
 
         patch_urlopen.start()
@@ -48,6 +48,16 @@ class TestHttpCollector(CollectorTestCase):
         self.assertPublishedMany([publish_mock,
                                   ], metrics)
 
+    def test_keepalive(self):
+        # A new connection for every request by default
+        self.assertEqual(self.collector.http.max_connections, 0)
+
+        config = get_collector_config('HttpCollector', {
+            'keepalive': 'True',
+        })
+        collector = HttpCollector(config, None)
+        self.assertTrue(collector.http.max_connections > 0)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
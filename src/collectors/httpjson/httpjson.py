@@ -13,13 +13,20 @@ import urllib2
 import json
 import diamond.collector
 
+from diamond.httpclient import HTTPClient
+
 
 class HTTPJSONCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(HTTPJSONCollector, self).__init__(*args, **kwargs)
+        self.http = HTTPClient(timeout=float(self.config['timeout']))
+
     def get_default_config_help(self):
         config_help = super(HTTPJSONCollector, self).get_default_config_help()
         config_help.update({
-            'url': 'Full URL'
+            'url': 'Full URL',
+            'timeout': 'Seconds to wait for a response',
         })
         return config_help
 
@@ -27,7 +34,8 @@ class HTTPJSONCollector(diamond.collector.Collector):
         default_config = super(HTTPJSONCollector, self).get_default_config()
         default_config.update({
             'path': 'httpjson',
-            'url': 'http://localhost/stat'
+            'url': 'http://localhost/stat',
+            'timeout': 10,
         })
         return default_config
 
@@ -52,7 +60,7 @@ class HTTPJSONCollector(diamond.collector.Collector):
         req.add_header('Content-type', 'application/json')
 
         try:
-            resp = urllib2.urlopen(req)
+            resp = self.http.urlopen(req)
         except urllib2.URLError as e:
             self.log.error("Can't open url %s. %s", url, e)
         else:
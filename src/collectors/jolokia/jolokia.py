@@ -30,6 +30,9 @@ JolokiaCollector.conf
     port '8778'
     mbeans '"java.lang:name=ParNew,type=GarbageCollector | org.apache.cassandra.metrics:name=WriteTimeouts,type=ClientRequestMetrics"'
 ```
+
+The reads of the MBean domains are sent `parallelism` at a time over
+keep-alive connections.
 """
 
 import diamond.collector
@@ -38,6 +41,8 @@ import re
 import urllib
 import urllib2
 
+from diamond.httpclient import HTTPClient
+
 
 class JolokiaCollector(diamond.collector.Collector):
 
@@ -60,6 +65,8 @@ class JolokiaCollector(diamond.collector.Collector):
             "stats. If not provided, all stats will be collected",
             'host': 'Hostname',
             'port': 'Port',
+            'parallelism': 'Number of MBean domains read at once',
+            'timeout': 'Seconds to wait for a response',
         })
         return config_help
 
@@ -70,6 +77,8 @@ class JolokiaCollector(diamond.collector.Collector):
             'path': 'jmx',
             'host': 'localhost',
             'port': 8778,
+            'parallelism': 8,
+            'timeout': 10,
         })
         return config
 
@@ -83,6 +92,9 @@ class JolokiaCollector(diamond.collector.Collector):
         elif isinstance(self.config['mbeans'], list):
             self.mbeans = self.config['mbeans']
 
+        self.http = HTTPClient(timeout=float(self.config['timeout']),
+                               max_connections=int(self.config['parallelism']))
+
     def check_mbean(self, mbean):
         if mbean in self.mbeans or not self.mbeans:
             return True
@@ -93,13 +105,13 @@ class JolokiaCollector(diamond.collector.Collector):
         listing = self.list_request()
         try:
             domains = listing['value'] if listing['status'] == 200 else {}
-            for domain in domains.keys():
-                if domain not in self.IGNORE_DOMAINS:
-                    obj = self.read_request(domain)
-                    mbeans = obj['value'] if obj['status'] == 200 else {}
-                    for k, v in mbeans.iteritems():
-                        if self.check_mbean(k):
-                            self.collect_bean(k, v)
+            domains = [domain for domain in domains.keys()
+                       if domain not in self.IGNORE_DOMAINS]
+            for obj in self.read_requests(domains):
+                mbeans = obj['value'] if obj['status'] == 200 else {}
+                for k, v in mbeans.iteritems():
+                    if self.check_mbean(k):
+                        self.collect_bean(k, v)
         except KeyError:
             # The reponse was totally empty, or not an expected format
             self.log.error('Unable to retrieve MBean listing.')
@@ -112,23 +124,42 @@ class JolokiaCollector(diamond.collector.Collector):
         try:
             url = "http://%s:%s/%s" % (self.config['host'],
                                        self.config['port'], self.LIST_URL)
-            response = urllib2.urlopen(url)
+            response = self.http.urlopen(url)
             return self.read_json(response)
         except (urllib2.HTTPError, ValueError):
             self.log.error('Unable to read JSON response.')
             return {}
 
+    def read_url(self, domain):
+        url_path = self.READ_URL % urllib.quote(domain)
+        return "http://%s:%s/%s" % (self.config['host'],
+                                    self.config['port'], url_path)
+
     def read_request(self, domain):
         try:
-            url_path = self.READ_URL % urllib.quote(domain)
-            url = "http://%s:%s/%s" % (self.config['host'],
-                                       self.config['port'], url_path)
-            response = urllib2.urlopen(url)
+            response = self.http.urlopen(self.read_url(domain))
             return self.read_json(response)
         except (urllib2.HTTPError, ValueError):
             self.log.error('Unable to read JSON response.')
             return {}
 
+    def read_requests(self, domains):
+        """
+        Read the MBeans of the domains, parallelism of them at once, and
+        return the responses of the domains that could be read
+        """
+        results = self.http.fetch_all([self.read_url(domain)
+                                       for domain in domains],
+                                      parse=self.read_json)
+        objs = []
+        for domain, (obj, error) in zip(domains, results):
+            if error is not None:
+                self.log.error('Unable to read JSON response for %s: %s',
+                               domain, error)
+                continue
+            objs.append(obj)
+        return objs
+
     def clean_up(self, text):
         text = re.sub('[:,]', '.', text)
         text = re.sub('[=\s]', '_', text)
@@ -7,6 +7,7 @@ from test import get_collector_config
 from test import unittest
 from mock import Mock
 from mock import patch
+import urllib2
 
 from diamond.collector import Collector
 
@@ -31,7 +32,8 @@ class TestJolokiaCollector(CollectorTestCase):
                 return self.getFixture('listing')
             else:
                 return self.getFixture('stats')
-        patch_urlopen = patch('urllib2.urlopen', Mock(side_effect=se))
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen',
+                              Mock(side_effect=se))
 
         patch_urlopen.start()
         self.collector.collect()
@@ -45,8 +47,8 @@ class TestJolokiaCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_fail_gracefully(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen', Mock(
-                              return_value=self.getFixture('stats_blank')))
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen',
+                              Mock(return_value=self.getFixture('stats_blank')))
 
         patch_urlopen.start()
         self.collector.collect()
@@ -64,7 +66,8 @@ class TestJolokiaCollector(CollectorTestCase):
                 return self.getFixture('stats_error')
             else:
                 return self.getFixture('stats')
-        patch_urlopen = patch('urllib2.urlopen', Mock(side_effect=se))
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen',
+                              Mock(side_effect=se))
 
         patch_urlopen.start()
         self.collector.collect()
@@ -76,6 +79,25 @@ class TestJolokiaCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_skip_when_mbean_read_fails(self, publish_mock):
+        def se(url):
+            if url == 'http://localhost:8778/jolokia/list':
+                return self.getFixture('listing_with_bad_mbean')
+            elif url == ('http://localhost:8778/jolokia/?ignoreErrors=true'
+                         '&p=read/xxx.bad.package:*'):
+                raise urllib2.URLError('timed out')
+            else:
+                return self.getFixture('stats')
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen',
+                              Mock(side_effect=se))
+
+        patch_urlopen.start()
+        self.collector.collect()
+        patch_urlopen.stop()
+
+        self.assertPublishedMany(publish_mock, self.get_metrics())
+
     def get_metrics(self):
         prefix = 'java.lang.name_ParNew.type_GarbageCollector.LastGcInfo'
         return {
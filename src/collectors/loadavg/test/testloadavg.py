@@ -9,12 +9,6 @@ from test import unittest
 from mock import Mock
 from mock import patch
 
-try:
-    from cStringIO import StringIO
-    StringIO  # workaround for pyflakes issue #13
-except ImportError:
-    from StringIO import StringIO
-
 from diamond.collector import Collector
 from loadavg import LoadAverageCollector
 
@@ -32,17 +26,17 @@ class TestLoadAverageCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(LoadAverageCollector)
 
-    @patch('__builtin__.open')
+    @patch.object(Collector, 'read_proc')
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
-    def test_should_open_proc_loadavg(self, publish_mock, open_mock):
+    def test_should_open_proc_loadavg(self, publish_mock, read_mock):
         if not os.path.exists('/proc/loadavg'):
             # on platforms that don't provide /proc/loadavg: don't bother
             # testing this.
             return
-        open_mock.return_value = StringIO('')
+        read_mock.return_value = ''
         self.collector.collect()
-        open_mock.assert_called_once_with('/proc/loadavg')
+        read_mock.assert_called_once_with('/proc/loadavg')
 
     @patch('os.getloadavg')
     @patch.object(Collector, 'publish')
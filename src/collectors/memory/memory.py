@@ -73,9 +73,7 @@ class MemoryCollector(diamond.collector.Collector):
         Collect memory stats
         """
         if os.access(self.PROC, os.R_OK):
-            file = open(self.PROC)
-            data = file.read()
-            file.close()
+            data = self.read_proc(self.PROC)
 
             for line in data.splitlines():
                 try:
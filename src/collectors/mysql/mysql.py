@@ -2,6 +2,10 @@
 
 """
 
+The connections to the hosts are kept open between runs, and checked with a
+ping before each run. Up to `parallelism` hosts are polled at once, so that a
+slow host does not hold the others back.
+
 #### Grants
 
  * Normal usage
@@ -30,7 +34,9 @@ GRANT PROCESS ON *.* TO 'user'@'hostname' IDENTIFIED BY
 
 import diamond.collector
 from diamond.collector import str_to_bool
+import Queue
 import re
+import threading
 import time
 
 try:
@@ -242,7 +248,19 @@ class MySQLCollector(diamond.collector.Collector):
         self.config['slave'] = str_to_bool(self.config['slave'])
         self.config['innodb'] = str_to_bool(self.config['innodb'])
 
-        self.db = None
+        # (nickname, connection parameters) of each host
+        self.hosts = []
+        for host in self.config['hosts']:
+            parsed = self.parse_host(host)
+            if parsed is None:
+                self.log.error(
+                    'Connection string not in required format, skipping: %s',
+                    host)
+                continue
+            self.hosts.append(parsed)
+
+        # Connections kept between runs, by index in self.hosts
+        self.connections = {}
 
     def get_default_config_help(self):
         config_help = super(MySQLCollector, self).get_default_config_help()
@@ -255,7 +273,9 @@ class MySQLCollector(diamond.collector.Collector):
             'innodb': 'Collect SHOW ENGINE INNODB STATUS',
             'hosts': 'List of hosts to collect from. Format is '
             + 'yourusername:yourpassword@host:port/db[/nickname]'
-            + 'use db "None" to avoid connecting to a particular db'
+            + 'use db "None" to avoid connecting to a particular db',
+            'parallelism': 'Number of hosts polled at once',
+            'connect_timeout': 'Seconds to wait for a connection to a host',
         })
         return config_help
 
@@ -277,11 +297,46 @@ class MySQLCollector(diamond.collector.Collector):
             'slave':    False,
             'master':   False,
             'innodb':   False,
+
+            'parallelism': 8,
+            'connect_timeout': 10,
         })
         return config
 
-    def get_db_stats(self, query):
-        cursor = self.db.cursor(cursorclass=MySQLdb.cursors.DictCursor)
+    def parse_host(self, host):
+        """
+        Return the nickname and the connection parameters of a connection
+        string, None if it is not valid
+        """
+        matches = re.search(
+            '^([^:]*):([^@]*)@([^:]*):?([^/]*)/([^/]*)/?(.*)', host)
+
+        if not matches:
+            return None
+
+        params = {}
+
+        params['host'] = matches.group(3)
+        try:
+            params['port'] = int(matches.group(4))
+        except ValueError:
+            params['port'] = 3306
+        params['db'] = matches.group(5)
+        params['user'] = matches.group(1)
+        params['passwd'] = matches.group(2)
+        params['connect_timeout'] = int(self.config['connect_timeout'])
+
+        nickname = matches.group(6)
+        if len(nickname):
+            nickname += '.'
+
+        if params['db'] == 'None':
+            del params['db']
+
+        return nickname, params
+
+    def get_db_stats(self, db, query):
+        cursor = db.cursor(cursorclass=MySQLdb.cursors.DictCursor)
 
         try:
             cursor.execute(query)
@@ -289,38 +344,64 @@ class MySQLCollector(diamond.collector.Collector):
         except MySQLError, e:
             self.log.error('MySQLCollector could not get db stats', e)
             return ()
+        finally:
+            cursor.close()
 
     def connect(self, params):
+        """
+        Return a new connection to a host, None if it fails
+        """
         try:
-            self.db = MySQLdb.connect(**params)
+            db = MySQLdb.connect(**params)
             self.log.debug('MySQLCollector: Connected to database.')
         except MySQLError, e:
             self.log.error('MySQLCollector couldnt connect to database %s', e)
-            return False
-        return True
+            return None
+        return db
 
-    def disconnect(self):
-        self.db.close()
+    def disconnect(self, db):
+        try:
+            db.close()
+        except MySQLError:
+            pass
 
-    def get_db_global_status(self):
-        return self.get_db_stats('SHOW GLOBAL STATUS')
+    def get_connection(self, index, params):
+        """
+        Return the connection to a host kept from the previous runs if it
+        is still alive, a new one otherwise
+        """
+        db = self.connections.get(index)
+        if db is not None:
+            try:
+                db.ping()
+                return db
+            except MySQLError, e:
+                self.log.debug('MySQLCollector: Connection to %s lost (%s), '
+                               'reconnecting', params['host'], e)
+                del self.connections[index]
+                self.disconnect(db)
 
-    def get_db_master_status(self):
-        return self.get_db_stats('SHOW MASTER STATUS')
+        db = self.connect(params)
+        if db:
+            self.connections[index] = db
+        return db
 
-    def get_db_slave_status(self):
-        return self.get_db_stats('SHOW SLAVE STATUS')
+    def get_db_global_status(self, db):
+        return self.get_db_stats(db, 'SHOW GLOBAL STATUS')
 
-    def get_db_innodb_status(self):
-        return self.get_db_stats('SHOW ENGINE INNODB STATUS')
+    def get_db_master_status(self, db):
+        return self.get_db_stats(db, 'SHOW MASTER STATUS')
 
-    def get_stats(self, params):
-        metrics = {'status': {}}
+    def get_db_slave_status(self, db):
+        return self.get_db_stats(db, 'SHOW SLAVE STATUS')
+
+    def get_db_innodb_status(self, db):
+        return self.get_db_stats(db, 'SHOW ENGINE INNODB STATUS')
 
-        if not self.connect(params):
-            return metrics
+    def get_stats(self, db):
+        metrics = {'status': {}}
 
-        rows = self.get_db_global_status()
+        rows = self.get_db_global_status(db)
         for row in rows:
             try:
                 metrics['status'][row['Variable_name']] = float(row['Value'])
@@ -330,7 +411,7 @@ class MySQLCollector(diamond.collector.Collector):
         if self.config['master']:
             metrics['master'] = {}
             try:
-                rows = self.get_db_master_status()
+                rows = self.get_db_master_status(db)
                 for row_master in rows:
                     for key, value in row_master.items():
                         if key in self._IGNORE_KEYS:
@@ -346,7 +427,7 @@ class MySQLCollector(diamond.collector.Collector):
         if self.config['slave']:
             metrics['slave'] = {}
             try:
-                rows = self.get_db_slave_status()
+                rows = self.get_db_slave_status(db)
                 for row_slave in rows:
                     for key, value in row_slave.items():
                         if key in self._IGNORE_KEYS:
@@ -363,7 +444,7 @@ class MySQLCollector(diamond.collector.Collector):
             metrics['innodb'] = {}
             innodb_status_timer = time.time()
             try:
-                rows = self.get_db_innodb_status()
+                rows = self.get_db_innodb_status(db)
 
                 innodb_status_output = rows[0]
 
@@ -403,8 +484,6 @@ class MySQLCollector(diamond.collector.Collector):
             subkey = "Innodb_status_process_time"
             metrics['innodb'][subkey] = Innodb_status_process_time
 
-        self.disconnect()
-
         return metrics
 
     def _publish_stats(self, nickname, metrics):
@@ -426,48 +505,58 @@ class MySQLCollector(diamond.collector.Collector):
                 else:
                     self.publish(nickname + metric_name, metric_value)
 
+    def poll_host(self, index):
+        """
+        Return the metrics of a host, None if it can't be polled
+        """
+        nickname, params = self.hosts[index]
+        db = self.get_connection(index, params)
+        if not db:
+            return None
+        try:
+            return self.get_stats(db)
+        except Exception, e:
+            # Start from a new connection next time
+            if self.connections.pop(index, None) is not None:
+                self.disconnect(db)
+            self.log.error('Collection failed for %s %s', nickname, e)
+            return None
+
+    def _poll_hosts(self, queue, results):
+        while True:
+            try:
+                index = queue.get_nowait()
+            except Queue.Empty:
+                return
+            results[index] = self.poll_host(index)
+
     def collect(self):
 
         if MySQLdb is None:
             self.log.error('Unable to import MySQLdb')
             return False
 
-        for host in self.config['hosts']:
-            matches = re.search(
-                '^([^:]*):([^@]*)@([^:]*):?([^/]*)/([^/]*)/?(.*)', host)
-
-            if not matches:
-                self.log.error(
-                    'Connection string not in required format, skipping: %s',
-                    host)
-                continue
-
-            params = {}
-
-            params['host'] = matches.group(3)
-            try:
-                params['port'] = int(matches.group(4))
-            except ValueError:
-                params['port'] = 3306
-            params['db'] = matches.group(5)
-            params['user'] = matches.group(1)
-            params['passwd'] = matches.group(2)
-
-            nickname = matches.group(6)
-            if len(nickname):
-                nickname += '.'
-
-            if params['db'] == 'None':
-                del params['db']
-
-            try:
-                metrics = self.get_stats(params=params)
-            except Exception, e:
-                try:
-                    self.disconnect()
-                except MySQLdb.ProgrammingError:
-                    pass
-                self.log.error('Collection failed for %s %s', nickname, e)
+        # Poll the hosts, parallelism of them at once
+        queue = Queue.Queue()
+        for index in range(len(self.hosts)):
+            queue.put(index)
+        results = {}
+        threads = min(int(self.config['parallelism']), len(self.hosts))
+        if threads > 1:
+            pollers = [threading.Thread(target=self._poll_hosts,
+                                        args=(queue, results))
+                       for i in range(threads)]
+            for poller in pollers:
+                poller.start()
+            for poller in pollers:
+                poller.join()
+        else:
+            self._poll_hosts(queue, results)
+
+        # and publish their metrics from this thread
+        for index, (nickname, params) in enumerate(self.hosts):
+            metrics = results.get(index)
+            if metrics is None:
                 continue
 
             # Warn if publish contains an unknown variable
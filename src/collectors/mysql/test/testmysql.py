@@ -2,6 +2,8 @@
 # coding=utf-8
 ################################################################################
 
+import time
+
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
@@ -10,6 +12,7 @@ from mock import Mock
 from mock import patch
 
 from diamond.collector import Collector
+import mysql
 from mysql import MySQLCollector
 
 ################################################################################
@@ -40,8 +43,66 @@ class TestMySQLCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(MySQLCollector)
 
+    def test_parse_hosts(self):
+        config = get_collector_config('MySQLCollector', {
+            'hosts': ['root:secret@db1:3307/mysql/db1',
+                      'root:@db2/None',
+                      'garbage'],
+        })
+        collector = MySQLCollector(config, None)
+        self.assertEqual(collector.hosts, [
+            ('db1.', {'host': 'db1', 'port': 3307, 'db': 'mysql',
+                      'user': 'root', 'passwd': 'secret',
+                      'connect_timeout': 10}),
+            ('', {'host': 'db2', 'port': 3306, 'user': 'root',
+                  'passwd': '', 'connect_timeout': 10}),
+        ])
+
+    @patch.object(MySQLCollector, 'disconnect')
+    @patch.object(MySQLCollector, 'connect')
+    def test_keeps_connection(self, connect_mock, disconnect_mock):
+        params = self.collector.hosts[0][1]
+        db = self.collector.get_connection(0, params)
+        self.assertTrue(db is connect_mock.return_value)
+        self.assertTrue(self.collector.get_connection(0, params) is db)
+        self.assertEqual(connect_mock.call_count, 1)
+        self.assertEqual(db.ping.call_count, 1)
+
+        # Lost, connect again
+        db.ping.side_effect = mysql.MySQLError('gone away')
+        connect_mock.return_value = Mock()
+        self.assertTrue(self.collector.get_connection(0, params)
+                        is connect_mock.return_value)
+        disconnect_mock.assert_called_once_with(db)
+        self.assertEqual(connect_mock.call_count, 2)
+
+    @patch.object(mysql, 'MySQLdb', Mock())
+    @patch.object(MySQLCollector, 'connect', Mock())
+    @patch.object(MySQLCollector, '_publish_stats')
+    def test_polls_hosts_at_once(self, publish_stats_mock):
+        config = get_collector_config('MySQLCollector', {
+            'hosts': ['root:@db%d:3306/mysql/db%d' % (i, i)
+                      for i in range(4)],
+            'parallelism': 4,
+        })
+        collector = MySQLCollector(config, None)
+
+        def get_stats(db):
+            time.sleep(0.3)
+            return {'status': {}}
+
+        with patch.object(collector, 'get_stats', get_stats):
+            start = time.time()
+            collector.collect()
+            self.assertTrue(time.time() - start < 1)
+
+        # Published in the order of the hosts
+        self.assertEqual([call[0][0] for call
+                          in publish_stats_mock.call_args_list],
+                         ['db0.', 'db1.', 'db2.', 'db3.'])
+
     @run_only_if_MySQLdb_is_available
-    @patch.object(MySQLCollector, 'connect', Mock(return_value=True))
+    @patch.object(MySQLCollector, 'connect', Mock(return_value=Mock()))
     @patch.object(MySQLCollector, 'disconnect', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_real_data(self, publish_mock):
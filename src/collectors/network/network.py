@@ -57,8 +57,6 @@ class NetworkCollector(diamond.collector.Collector):
 
         if os.access(self.PROC, os.R_OK):
 
-            # Open File
-            file = open(self.PROC)
             # Build Regular Expression
             greed = ''
             if self.config['greedy'].lower() == 'true':
@@ -84,13 +82,11 @@ class NetworkCollector(diamond.collector.Collector):
                 ('|'.join(self.config['interfaces'])), greed)
             reg = re.compile(exp)
             # Match Interfaces
-            for line in file:
+            for line in self.read_proc(self.PROC).splitlines():
                 match = reg.match(line)
                 if match:
                     device = match.group(1)
                     results[device] = match.groupdict()
-            # Close File
-            file.close()
         else:
             if not psutil:
                 self.log.error('Unable to import psutil')
@@ -31,15 +31,22 @@ import urllib2
 import re
 import diamond.collector
 
+from diamond.httpclient import HTTPClient
+
 
 class NginxCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(NginxCollector, self).__init__(*args, **kwargs)
+        self.http = HTTPClient(timeout=float(self.config['timeout']))
+
     def get_default_config_help(self):
         config_help = super(NginxCollector, self).get_default_config_help()
         config_help.update({
             'req_host': 'Hostname',
             'req_port': 'Port',
             'req_path': 'Path',
+            'timeout': 'Seconds to wait for a response',
         })
         return config_help
 
@@ -49,6 +56,7 @@ class NginxCollector(diamond.collector.Collector):
         default_config['req_port'] = 8080
         default_config['req_path'] = '/nginx_status'
         default_config['path'] = 'nginx'
+        default_config['timeout'] = 10
         return default_config
 
     def collect(self):
@@ -62,7 +70,7 @@ class NginxCollector(diamond.collector.Collector):
                                                   int(self.config['req_port']),
                                                   self.config['req_path']))
         try:
-            handle = urllib2.urlopen(req)
+            handle = self.http.urlopen(req)
             for l in handle.readlines():
                 l = l.rstrip('\r\n')
                 if activeConnectionsRE.match(l):
@@ -29,7 +29,7 @@ class TestNginxCollector(CollectorTestCase):
     @patch.object(Collector, 'publish_counter')
     def test_should_work_with_real_data(self, publish_counter_mock,
                                         publish_gauge_mock, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen', Mock(
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             return_value=self.getFixture('status')))
 
         patch_urlopen.start()
@@ -56,7 +56,7 @@ class TestNginxCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_fail_gracefully(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen', Mock(
+        patch_urlopen = patch('diamond.httpclient.HTTPClient.urlopen', Mock(
             return_value=self.getFixture('status_blank')))
 
         patch_urlopen.start()
@@ -3,6 +3,9 @@
 """
 Collect metrics from postgresql
 
+One connection per database is kept open between runs, and all the queries
+of a database are run on it.
+
 #### Dependencies
 
  * psycopg2
@@ -25,6 +28,11 @@ class PostgresqlCollector(diamond.collector.Collector):
     PostgreSQL collector class
     """
 
+    def __init__(self, *args, **kwargs):
+        super(PostgresqlCollector, self).__init__(*args, **kwargs)
+        # Connections kept between runs, by database name
+        self.connections = {}
+
     def get_default_config_help(self):
         """
         Return help text for collector
@@ -94,29 +102,58 @@ class PostgresqlCollector(diamond.collector.Collector):
         else:
             metrics = registry['basic']
 
-        # Iterate every QueryStats class
-        for metric_name in set(metrics):
-            if metric_name not in metrics_registry:
+        klasses = [metrics_registry[metric_name]
+                   for metric_name in sorted(set(metrics))
+                   if metric_name in metrics_registry]
+
+        # Run every QueryStats class of a database on the same connection
+        for index, dbase in enumerate(dbs):
+            # Setting multi_db to True will run this query on all known
+            # databases. This is bad for queries that hit views like
+            # pg_database, which are shared across databases.
+            #
+            # If multi_db is False, only run it on the first database.
+            db_klasses = [klass for klass in klasses
+                          if klass.multi_db or index == 0]
+            if not db_klasses:
                 continue
-
-            for dbase in dbs:
-                conn = self._connect(database=dbase)
-                klass = metrics_registry[metric_name]
-                stat = klass(dbase, conn,
-                             underscore=self.config['underscore'])
-                stat.fetch(self.config['pg_version'])
+            try:
+                stats = self._fetch(dbase, db_klasses)
+            except psycopg2.Error, e:
+                self.log.error("Failed to collect stats of database %s: %s",
+                               dbase, e)
+                continue
+            for stat in stats:
                 for metric, value in stat:
                     if value is not None:
                         self.publish(metric, value)
 
-                # Setting multi_db to True will run this query on all known
-                # databases. This is bad for queries that hit views like
-                # pg_database, which are shared across databases.
-                #
-                # If multi_db is False, bail early after the first query
-                # iteration. Otherwise, continue to remaining databases.
-                if stat.multi_db is False:
-                    break
+        # Close the connections to databases that no longer exist
+        for dbase in self.connections.keys():
+            if dbase not in dbs and dbase != self.config['dbname']:
+                self._disconnect(dbase)
+
+    def _fetch(self, dbase, klasses):
+        """
+        Run the queries of klasses on the cached connection to dbase. If
+        the connection turns out to be broken, reconnect and try again once.
+        """
+        for attempt in (0, 1):
+            conn = self._get_connection(dbase)
+            stats = []
+            try:
+                for klass in klasses:
+                    stat = klass(dbase, conn,
+                                 underscore=self.config['underscore'])
+                    stat.fetch(self.config['pg_version'])
+                    stats.append(stat)
+                return stats
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._disconnect(dbase)
+                if attempt:
+                    raise
+                self.log.debug("Connection to database %s lost, "
+                               "reconnecting", dbase)
 
     def _get_db_names(self):
         """
@@ -127,11 +164,19 @@ class PostgresqlCollector(diamond.collector.Collector):
             WHERE datallowconn AND NOT datistemplate
             AND NOT datname='postgres' ORDER BY 1
         """
-        conn = self._connect(self.config['dbname'])
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute(query)
-        datnames = [d['datname'] for d in cursor.fetchall()]
-        conn.close()
+        for attempt in (0, 1):
+            conn = self._get_connection(self.config['dbname'])
+            try:
+                cursor = conn.cursor(
+                    cursor_factory=psycopg2.extras.DictCursor)
+                cursor.execute(query)
+                datnames = [d['datname'] for d in cursor.fetchall()]
+                cursor.close()
+                break
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._disconnect(self.config['dbname'])
+                if attempt:
+                    raise
 
         # Exclude `postgres` database list, unless it is the
         # only database available (required for querying pg_stat_database)
@@ -140,6 +185,28 @@ class PostgresqlCollector(diamond.collector.Collector):
 
         return datnames
 
+    def _get_connection(self, database):
+        """
+        Return the cached connection to database, connecting if there is
+        none or if it was closed
+        """
+        conn = self.connections.get(database)
+        if conn is None or conn.closed:
+            conn = self._connect(database=database)
+            self.connections[database] = conn
+        return conn
+
+    def _disconnect(self, database):
+        """
+        Close and forget the cached connection to database
+        """
+        conn = self.connections.pop(database, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
     def _connect(self, database=None):
         """
         Connect to given database
@@ -219,9 +286,8 @@ class QueryStats(object):
                         'value': value,
                     })
 
-        # Clean up
+        # Clean up, the connection is reused by the next queries
         cursor.close()
-        self.conn.close()
 
     def __iter__(self):
         for data_point in self.data:
@@ -4,10 +4,25 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from mock import Mock
+from mock import patch
 
+import postgres
 from postgres import PostgresqlCollector
 
 
+class FakePsycopg2Error(Exception):
+    pass
+
+
+class FakeOperationalError(FakePsycopg2Error):
+    pass
+
+
+class FakeInterfaceError(FakePsycopg2Error):
+    pass
+
+
 class TestPostgresqlCollector(CollectorTestCase):
     def setUp(self, allowed_names=None):
         if not allowed_names:
@@ -18,3 +33,64 @@ class TestPostgresqlCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(PostgresqlCollector)
+
+    def get_collector(self):
+        config = get_collector_config('PostgresqlCollector', {
+            'metrics': ['DatabaseStats', 'UserTableStats'],
+        })
+        return PostgresqlCollector(config, None)
+
+    def get_psycopg2(self):
+        psycopg2 = Mock()
+        psycopg2.Error = FakePsycopg2Error
+        psycopg2.OperationalError = FakeOperationalError
+        psycopg2.InterfaceError = FakeInterfaceError
+        self.connections = []
+
+        def connect(**kwargs):
+            conn = Mock()
+            conn.closed = 0
+            conn.database = kwargs['database']
+            conn.cursor.return_value.fetchall.return_value = [
+                {'datname': 'db1'}, {'datname': 'db2'}]
+            self.connections.append(conn)
+            return conn
+
+        psycopg2.connect.side_effect = connect
+        return psycopg2
+
+    def test_should_reuse_connections(self):
+        psycopg2 = self.get_psycopg2()
+        patch_psycopg2 = patch.object(postgres, 'psycopg2', psycopg2)
+        collector = self.get_collector()
+
+        patch_psycopg2.start()
+        collector.collect()
+        collector.collect()
+        patch_psycopg2.stop()
+
+        # One connection to list the databases, and one per database
+        self.assertEqual(sorted(c.database for c in self.connections),
+                         ['db1', 'db2', 'postgres'])
+        for conn in self.connections:
+            self.assertFalse(conn.close.called)
+
+    def test_should_reconnect(self):
+        psycopg2 = self.get_psycopg2()
+        patch_psycopg2 = patch.object(postgres, 'psycopg2', psycopg2)
+        collector = self.get_collector()
+
+        patch_psycopg2.start()
+        collector.collect()
+        db1 = collector.connections['db1']
+        db2 = collector.connections['db2']
+        # db1 was closed, the server closed the connection to db2
+        db1.closed = 1
+        db2.cursor.return_value.execute.side_effect = FakeOperationalError()
+        collector.collect()
+        patch_psycopg2.stop()
+
+        self.assertTrue(collector.connections['db1'] is not db1)
+        self.assertTrue(collector.connections['db2'] is not db2)
+        self.assertTrue(db2.close.called)
+        self.assertEqual(len(self.connections), 5)
@@ -191,10 +191,11 @@ class ProcessResourcesCollector(diamond.collector.Collector):
             self.collect_process_info(process)
 
         # publish results
+        metrics = []
         for pg_name, counters in self.processes_info.iteritems():
-            metrics = (
+            metrics.extend(
                 ("%s.%s" % (pg_name, key), value)
                 for key, value in counters.iteritems())
-            [self.publish(*metric) for metric in metrics]
             # reinitialize process info
             self.processes_info[pg_name] = {}
+        self.publish_many(metrics)
@@ -0,0 +1,53 @@
+# coding=utf-8
+
+"""
+Collect internal statistics about Diamond itself, such as the send queue
+depth of asynchronous handlers, how late the scheduler starts collectors,
+the queue wait and run times of the threaded collectors or the CPU usage
+and metric rate of the worker processes. It always runs in the main process.
+
+#### Dependencies
+
+ * None
+
+"""
+
+import diamond.collector
+import diamond.scheduler
+import diamond.worker
+
+
+class SelfStatsCollector(diamond.collector.Collector):
+
+    def get_default_config_help(self):
+        config_help = super(SelfStatsCollector,
+                            self).get_default_config_help()
+        config_help.update({
+        })
+        return config_help
+
+    def get_default_config(self):
+        """
+        Returns the default collector settings
+        """
+        config = super(SelfStatsCollector, self).get_default_config()
+        config.update({
+            'path':     'diamond',
+            'worker':   'main',
+        })
+        return config
+
+    def collect(self):
+        for handler in self.handlers or []:
+            name = handler.__class__.__name__
+            for stat, value in handler.get_stats().items():
+                self.publish('handlers.%s.%s' % (name, stat), value)
+
+        for source in diamond.scheduler.get_stats_sources():
+            for stat, value in source.get_stats().items():
+                self.publish('scheduler.%s.%s' % (source.name, stat), value)
+
+        for source in diamond.worker.get_stats_sources():
+            for stat, value in source.get_stats().items():
+                self.publish('workers.%s.%s' % (source.name, stat), value,
+                             precision=isinstance(value, float) and 2 or 0)
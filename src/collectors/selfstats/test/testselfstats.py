@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import configobj
+
+from test import CollectorTestCase
+from test import get_collector_config
+from test import unittest
+from mock import Mock
+from mock import patch
+
+from diamond.collector import Collector
+from diamond.handler.Handler import Handler
+from selfstats import SelfStatsCollector
+
+################################################################################
+
+
+class GraphiteHandler(Handler):
+    def process(self, metric):
+        pass
+
+
+class TestSelfStatsCollector(CollectorTestCase):
+    def setUp(self):
+        config = get_collector_config('SelfStatsCollector', {
+            'interval': 10
+        })
+
+        self.handler = GraphiteHandler(configobj.ConfigObj())
+        self.handler.get_stats = Mock(return_value={
+            'queue_depth': 12,
+            'queue_dropped': 3,
+        })
+
+        self.collector = SelfStatsCollector(config, [self.handler])
+
+    def test_import(self):
+        self.assertTrue(SelfStatsCollector)
+
+    @patch('diamond.scheduler.get_stats_sources', Mock(return_value=[]))
+    @patch('diamond.worker.get_stats_sources', Mock(return_value=[]))
+    @patch.object(Collector, 'publish')
+    def test_should_publish_handler_stats(self, publish_mock):
+        self.collector.collect()
+
+        metrics = {
+            'handlers.GraphiteHandler.queue_depth': 12,
+            'handlers.GraphiteHandler.queue_dropped': 3,
+        }
+
+        self.setDocExample(collector=self.collector.__class__.__name__,
+                           metrics=metrics,
+                           defaultpath=self.collector.config['path'])
+        self.assertPublishedMany(publish_mock, metrics)
+
+    @patch('diamond.worker.get_stats_sources', Mock(return_value=[]))
+    @patch.object(Collector, 'publish')
+    def test_should_publish_scheduler_stats(self, publish_mock):
+        pool = Mock()
+        pool.name = 'CollectorPool'
+        pool.get_stats.return_value = {'threads': 4, 'overlaps': 2}
+        patch_pools = patch('diamond.scheduler.get_stats_sources',
+                            Mock(return_value=[pool]))
+
+        patch_pools.start()
+        self.collector.collect()
+        patch_pools.stop()
+
+        self.assertPublishedMany(publish_mock, {
+            'scheduler.CollectorPool.threads': 4,
+            'scheduler.CollectorPool.overlaps': 2,
+        })
+
+    @patch('diamond.scheduler.get_stats_sources', Mock(return_value=[]))
+    @patch.object(Collector, 'publish')
+    def test_should_publish_worker_stats(self, publish_mock):
+        worker = Mock()
+        worker.name = 'worker0'
+        worker.get_stats.return_value = {'cpu_percent': 85.5,
+                                         'metrics_per_second': 120.0}
+        patch_workers = patch('diamond.worker.get_stats_sources',
+                              Mock(return_value=[worker]))
+
+        patch_workers.start()
+        self.collector.collect()
+        patch_workers.stop()
+
+        self.assertPublishedMany(publish_mock, {
+            'workers.worker0.cpu_percent': 85.5,
+            'workers.worker0.metrics_per_second': 120.0,
+        })
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
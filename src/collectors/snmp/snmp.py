@@ -3,6 +3,12 @@
 """
 SNMPCollector is a special collector for collecting data from using SNMP
 
+Collectors implementing poll_snmp() and publish_snmp() poll all their devices
+at once: poll_snmp() queues the requests of a device on an SNMPEngine, which
+keeps up to max_in_flight of them waiting for an answer, walks tables with
+GETBULK and times each device. The others have collect_snmp() called for each
+device in turn, doing synchronous get() and walk() requests.
+
 #### Dependencies
 
  * pysnmp
@@ -10,6 +16,8 @@ SNMPCollector is a special collector for collecting data from using SNMP
 """
 
 import socket
+import time
+from collections import deque
 
 import warnings
 
@@ -33,6 +41,168 @@ except ImportError:
 warnings.showwarning = old_showwarning
 
 import diamond.collector
+from diamond.util import monotonic
+
+
+def _convert_to_oid(s):
+    if isinstance(s, tuple):
+        return s
+    return tuple([int(x) for x in s.split(".")])
+
+
+class SNMPRequest(object):
+    """
+    A GET of some OIDs, or a GETBULK walk of the tables under them, on a
+    device
+    """
+
+    def __init__(self, device, host, port, community, oids, walk=False):
+        self.device = device
+        self.host = host
+        self.port = port
+        self.community = community
+        self.oids = [_convert_to_oid(oid) for oid in oids]
+        self.walk = walk
+
+        # OID to value, as strings, like SNMPCollector.get() and walk()
+        self.values = {}
+        # errorIndication or errorStatus, if the request failed
+        self.error = None
+        self.timed_out = False
+        # Seconds between sending the request and its last answer
+        self.latency = None
+        self.done = False
+
+        self.start_time = None
+        # Last OID received in each walked column, None once it's done
+        self.last_oids = list(self.oids)
+
+
+class SNMPEngine(object):
+    """
+    Sends the queued requests of many devices concurrently with pysnmp's
+    asynchronous command generator, up to max_in_flight at a time
+    """
+
+    def __init__(self, timeout=5, retries=3, max_repetitions=25,
+                 max_in_flight=64, resolve=socket.gethostbyname):
+        self.timeout = timeout
+        self.retries = retries
+        self.max_repetitions = max_repetitions
+        self.max_in_flight = max_in_flight
+        self.resolve = resolve
+
+        self.cmdgen = cmdgen.AsynCommandGenerator()
+        self.queue = deque()
+        self.in_flight = 0
+
+    def get(self, device, host, port, community, oids):
+        """
+        Queue a GET of some OIDs, sent by run()
+        """
+        request = SNMPRequest(device, host, port, community, oids)
+        self.queue.append(request)
+        return request
+
+    def walk(self, device, host, port, community, oids):
+        """
+        Queue a walk of the tables under some OIDs, sent by run()
+        """
+        request = SNMPRequest(device, host, port, community, oids,
+                              walk=True)
+        self.queue.append(request)
+        return request
+
+    def run(self):
+        """
+        Send the queued requests and return once all are answered or timed
+        out
+        """
+        self._send_queued()
+        if self.in_flight:
+            self.cmdgen.snmpEngine.transportDispatcher.runDispatcher()
+
+    def _send_queued(self):
+        while self.queue and self.in_flight < self.max_in_flight:
+            request = self.queue.popleft()
+            try:
+                self._send(request)
+            except Exception, e:
+                # Unknown host, bad OID...
+                request.error = str(e)
+                request.done = True
+                continue
+            self.in_flight += 1
+
+    def _send(self, request):
+        authData = cmdgen.CommunityData('agent', request.community)
+        transportData = cmdgen.UdpTransportTarget(
+            (self.resolve(request.host), request.port),
+            self.timeout, self.retries)
+
+        request.start_time = monotonic()
+        if request.walk:
+            self.cmdgen.asyncBulkCmd(authData, transportData, 0,
+                                     self.max_repetitions, request.oids,
+                                     (self._walk_callback, request))
+        else:
+            self.cmdgen.asyncGetCmd(authData, transportData, request.oids,
+                                    (self._get_callback, request))
+
+    def _check(self, request, errorIndication, errorStatus):
+        """
+        Record the error of an answer, return True if there is one
+        """
+        if errorIndication:
+            request.error = str(errorIndication)
+            request.timed_out = 'timeout' in request.error.lower()
+            return True
+        if errorStatus and int(errorStatus):
+            request.error = errorStatus.prettyPrint()
+            return True
+        return False
+
+    def _finish(self, request):
+        request.latency = monotonic() - request.start_time
+        request.done = True
+        self.in_flight -= 1
+        # Keep max_in_flight requests going
+        self._send_queued()
+
+    def _get_callback(self, sendRequestHandle, errorIndication, errorStatus,
+                      errorIndex, varBinds, request):
+        if not self._check(request, errorIndication, errorStatus):
+            for o, v in varBinds:
+                request.values[o.prettyPrint()] = v.prettyPrint()
+        self._finish(request)
+
+    def _walk_callback(self, sendRequestHandle, errorIndication, errorStatus,
+                       errorIndex, varBindTable, request):
+        if self._check(request, errorIndication, errorStatus):
+            self._finish(request)
+            return False
+
+        columns = request.oids
+        last_oids = request.last_oids
+        for varBindTableRow in varBindTable:
+            for i, (o, v) in enumerate(varBindTableRow[:len(columns)]):
+                last = last_oids[i]
+                if last is None:
+                    continue
+                oid = tuple(o)
+                # The column is done when the walk leaves its table, or
+                # stops going forward (endOfMibView)
+                if oid[:len(columns[i])] != columns[i] or oid <= last:
+                    last_oids[i] = None
+                    continue
+                last_oids[i] = oid
+                request.values[o.prettyPrint()] = v.prettyPrint()
+
+        if varBindTable and any(last is not None for last in last_oids):
+            # Ask for the next rows
+            return True
+        self._finish(request)
+        return False
 
 
 class SNMPCollector(diamond.collector.Collector):
@@ -44,11 +214,26 @@ class SNMPCollector(diamond.collector.Collector):
         # Initialize base Class
         diamond.collector.Collector.__init__(self, config, handlers)
 
+        # Resolved addresses of the devices, see resolve
+        self.addresses = {}
+
+        # SNMPEngine polling all the devices, see collect
+        self.engine = None
+
     def get_default_config_help(self):
         config_help = super(SNMPCollector, self).get_default_config_help()
         config_help.update({
             'timeout': 'Seconds before timing out the snmp connection',
             'retries': 'Number of times to retry before bailing',
+            'max_repetitions': 'Number of rows of a table fetched by each ' +
+                               'GETBULK request of a walk',
+            'max_in_flight': 'Number of requests waiting for an answer at ' +
+                             'once, for the collectors polling all their ' +
+                             'devices at once',
+            'resolve_ttl': 'Seconds to keep the resolved addresses of the ' +
+                           'devices',
+            'device_stats': 'Publish the time taken to poll each device, ' +
+                            'and its numbers of timeouts and errors',
         })
         return config_help
 
@@ -59,6 +244,10 @@ class SNMPCollector(diamond.collector.Collector):
         default_config['path_prefix'] = 'systems'
         default_config['timeout'] = 5
         default_config['retries'] = 3
+        default_config['max_repetitions'] = 25
+        default_config['max_in_flight'] = 64
+        default_config['resolve_ttl'] = 300
+        default_config['device_stats'] = True
         # Return default config
         return default_config
 
@@ -73,6 +262,10 @@ class SNMPCollector(diamond.collector.Collector):
                 'pysnmp.entity.rfc3413.oneliner.cmdgen failed to load')
             return
 
+        if hasattr(self, 'poll_snmp'):
+            # All the devices are polled at once by collect
+            return super(SNMPCollector, self).get_schedule()
+
         # Initialize SNMP Command Generator
         self.snmpCmdGen = cmdgen.CommandGenerator()
 
@@ -93,9 +286,82 @@ class SNMPCollector(diamond.collector.Collector):
                                   int(self.config['interval']))
         return schedule
 
+    def collect(self):
+        """
+        Poll all the devices at once, for the collectors implementing
+        poll_snmp(device, host, port, community), which queues requests on
+        self.engine and returns them, and publish_snmp(device, requests),
+        called once they are answered
+        """
+        if self.engine is None:
+            self.engine = SNMPEngine(
+                timeout=int(self.config['timeout']),
+                retries=int(self.config['retries']),
+                max_repetitions=int(self.config['max_repetitions']),
+                max_in_flight=int(self.config['max_in_flight']),
+                resolve=self.resolve)
+
+        polls = []
+        for device, c in self.config.get('devices', {}).items():
+            polls.append((device, self.poll_snmp(device,
+                                                 c['host'],
+                                                 int(c['port']),
+                                                 c['community'])))
+
+        self.engine.run()
+
+        device_stats = diamond.collector.str_to_bool(
+            self.config['device_stats'])
+        for device, requests in polls:
+            try:
+                self.publish_snmp(device, requests)
+            except Exception:
+                self.log.exception('Failed to publish SNMP data of %s',
+                                   device)
+            if device_stats:
+                self.publish_device_stats(device, requests)
+
+    def publish_device_stats(self, device, requests):
+        """
+        Publish the time taken to poll a device, the latency of its slowest
+        request as they all are sent at once, and its errors
+        """
+        latencies = [r.latency for r in requests if r.latency is not None]
+        timeouts = len([r for r in requests if r.timed_out])
+        errors = len([r for r in requests if r.error and not r.timed_out])
+        for r in requests:
+            if r.error:
+                self.log.debug('SNMP request to %s failed: %s', device,
+                               r.error)
+
+        path = '.'.join(['devices', device, 'snmp'])
+        if latencies:
+            self.publish_gauge(path + '.latency_ms',
+                               max(latencies) * 1000, precision=1)
+        self.publish_gauge(path + '.timeouts', timeouts)
+        self.publish_gauge(path + '.errors', errors)
+
+    def resolve(self, host):
+        """
+        Return the address of a host, resolved again after resolve_ttl
+        seconds, or kept if that fails
+        """
+        now = time.time()
+        cached = self.addresses.get(host)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        try:
+            address = socket.gethostbyname(host)
+        except socket.error:
+            if cached is None:
+                raise
+            return cached[0]
+        self.addresses[host] = (address,
+                                now + float(self.config['resolve_ttl']))
+        return address
+
     def _convert_to_oid(self, s):
-        d = s.split(".")
-        return tuple([int(x) for x in d])
+        return _convert_to_oid(s)
 
     def _convert_from_oid(self, oid):
         return ".".join([str(x) for x in oid])
@@ -112,7 +378,7 @@ class SNMPCollector(diamond.collector.Collector):
             oid = self._convert_to_oid(oid)
 
         # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
+        host = self.resolve(host)
 
         # Assemble SNMP Auth Data
         snmpAuthData = cmdgen.CommunityData('agent', community)
@@ -146,7 +412,7 @@ class SNMPCollector(diamond.collector.Collector):
             oid = self._convert_to_oid(oid)
 
         # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
+        host = self.resolve(host)
 
         # Assemble SNMP Auth Data
         snmpAuthData = cmdgen.CommunityData('agent', community)
@@ -157,10 +423,13 @@ class SNMPCollector(diamond.collector.Collector):
             int(self.config['timeout']),
             int(self.config['retries']))
 
-        # Assemble SNMP Next Command
-        resultTable = self.snmpCmdGen.nextCmd(snmpAuthData,
-                                              snmpTransportData,
-                                              oid)
+        # Assemble SNMP Bulk Command
+        resultTable = self.snmpCmdGen.bulkCmd(
+            snmpAuthData,
+            snmpTransportData,
+            0,
+            int(self.config['max_repetitions']),
+            oid)
         varBindTable = resultTable[3]
 
         # TODO: Error Check
@@ -2,10 +2,181 @@
 # coding=utf-8
 ################################################################################
 
+import socket
+
 from test import CollectorTestCase
 from test import get_collector_config
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import snmp
+from snmp import SNMPCollector, SNMPEngine
+
+TIMEOUT = 'No SNMP response received before timeout'
+
+
+class FakeOID(tuple):
+
+    def prettyPrint(self):
+        return '.'.join(str(x) for x in self)
+
+
+class FakeValue(str):
+
+    def prettyPrint(self):
+        return str(self)
+
+
+class FakeCommandGenerator(object):
+    """
+    pysnmp's AsynCommandGenerator, answering from the MIBs of fake agents
+    """
+
+    def __init__(self, agents):
+        self.agents = dict((address, sorted(
+            (FakeOID(int(x) for x in oid.split('.')), FakeValue(value))
+            for oid, value in mib.items()))
+            for address, mib in agents.items())
+        self.snmpEngine = Mock()
+        self.snmpEngine.transportDispatcher.runDispatcher = self.dispatch
+        self.pending = []
+        self.max_pending = 0
+        self.bulk_requests = 0
+
+    def asyncGetCmd(self, authData, transportData, varNames, cbInfo):
+        self.send(('get', transportData, varNames, 0, cbInfo))
+
+    def asyncBulkCmd(self, authData, transportData, nonRepeaters,
+                     maxRepetitions, varNames, cbInfo):
+        self.send(('bulk', transportData, varNames, maxRepetitions, cbInfo))
+
+    def send(self, request):
+        self.pending.append(request)
+        self.max_pending = max(self.max_pending, len(self.pending))
+
+    def dispatch(self):
+        while self.pending:
+            kind, address, varNames, maxRepetitions, (cbFun, cbCtx) = \
+                self.pending.pop(0)
+            mib = self.agents.get(address)
+            if mib is None:
+                cbFun(None, TIMEOUT, 0, 0, [], cbCtx)
+            elif kind == 'get':
+                varBinds = [(FakeOID(oid), dict(mib).get(oid, FakeValue('')))
+                            for oid in varNames]
+                cbFun(None, None, 0, 0, varBinds, cbCtx)
+            else:
+                self.bulk_requests += 1
+                varBindTable = self.bulk(mib, varNames, maxRepetitions)
+                if cbFun(None, None, 0, 0, varBindTable, cbCtx):
+                    self.send((kind, address, [o for o, v in varBindTable[-1]],
+                               maxRepetitions, (cbFun, cbCtx)))
+
+    def bulk(self, mib, varNames, maxRepetitions):
+        columns = []
+        for oid in varNames:
+            following = [(o, v) for o, v in mib if o > tuple(oid)]
+            following = following[:maxRepetitions]
+            # endOfMibView
+            following += [(FakeOID(oid), FakeValue(''))] * (
+                maxRepetitions - len(following))
+            columns.append(following)
+        return [list(row) for row in zip(*columns)]
+
+
+class FakeCmdgen(object):
+
+    def __init__(self, agents):
+        self.generator = FakeCommandGenerator(agents)
 
-from snmp import SNMPCollector
+    def AsynCommandGenerator(self):
+        return self.generator
+
+    def CommunityData(self, name, community):
+        return community
+
+    def UdpTransportTarget(self, address, timeout, retries):
+        return address
+
+
+class TestSNMPEngine(unittest.TestCase):
+
+    def get_engine(self, agents, **kwargs):
+        self.cmdgen = FakeCmdgen(agents)
+        with patch.object(snmp, 'cmdgen', self.cmdgen):
+            return SNMPEngine(resolve=lambda host: host, **kwargs)
+
+    def run_engine(self, engine):
+        with patch.object(snmp, 'cmdgen', self.cmdgen):
+            engine.run()
+
+    def test_walk(self):
+        engine = self.get_engine({('sw1', 161): {
+            '1.3.6.1.2.1.2.2.1.3.1': '6',
+            '1.3.6.1.2.1.2.2.1.3.2': '24',
+            '1.3.6.1.2.1.2.2.1.3.3': '6',
+            '1.3.6.1.2.1.2.2.1.4.1': '1500',
+            '1.3.6.1.2.1.31.1.1.1.1.1': 'eth0',
+            '1.3.6.1.2.1.31.1.1.1.1.2': 'lo',
+            '1.3.6.1.2.1.31.1.1.1.1.3': 'eth1',
+        }}, max_repetitions=2)
+        request = engine.walk('sw1', 'sw1', 161, 'public',
+                              ['1.3.6.1.2.1.2.2.1.3',
+                               '1.3.6.1.2.1.31.1.1.1.1'])
+        self.run_engine(engine)
+
+        self.assertTrue(request.done)
+        self.assertEqual(request.error, None)
+        self.assertEqual(request.values, {
+            '1.3.6.1.2.1.2.2.1.3.1': '6',
+            '1.3.6.1.2.1.2.2.1.3.2': '24',
+            '1.3.6.1.2.1.2.2.1.3.3': '6',
+            '1.3.6.1.2.1.31.1.1.1.1.1': 'eth0',
+            '1.3.6.1.2.1.31.1.1.1.1.2': 'lo',
+            '1.3.6.1.2.1.31.1.1.1.1.3': 'eth1',
+        })
+        # 2 rows per GETBULK, stopping past the end of both tables
+        self.assertEqual(self.cmdgen.generator.bulk_requests, 2)
+
+    def test_get(self):
+        engine = self.get_engine({('sw1', 161): {'1.3.6.1.2.1.1.3.0': '42'}})
+        request = engine.get('sw1', 'sw1', 161, 'public',
+                             ['1.3.6.1.2.1.1.3.0'])
+        self.run_engine(engine)
+        self.assertEqual(request.values, {'1.3.6.1.2.1.1.3.0': '42'})
+        self.assertTrue(request.latency >= 0)
+
+    def test_timeout(self):
+        engine = self.get_engine({})
+        request = engine.walk('sw1', 'sw1', 161, 'public', ['1.3.6'])
+        self.run_engine(engine)
+        self.assertTrue(request.done)
+        self.assertTrue(request.timed_out)
+        self.assertEqual(request.error, TIMEOUT)
+
+    def test_unknown_host(self):
+        engine = self.get_engine({})
+        engine.resolve = Mock(side_effect=socket.gaierror('unknown host'))
+        request = engine.get('sw1', 'sw1', 161, 'public', ['1.3.6'])
+        self.run_engine(engine)
+        self.assertTrue(request.done)
+        self.assertFalse(request.timed_out)
+        self.assertEqual(request.error, 'unknown host')
+
+    def test_max_in_flight(self):
+        agents = dict((('sw%d' % i, 161), {'1.3.6.1.1': str(i)})
+                      for i in range(10))
+        engine = self.get_engine(agents, max_in_flight=3)
+        requests = [engine.walk('sw%d' % i, 'sw%d' % i, 161, 'public',
+                                ['1.3.6.1'])
+                    for i in range(10)]
+        self.run_engine(engine)
+
+        self.assertEqual([r.values for r in requests],
+                         [{'1.3.6.1.1': str(i)} for i in range(10)])
+        self.assertEqual(self.cmdgen.generator.max_pending, 3)
+        self.assertEqual(engine.in_flight, 0)
 
 
 class TestSNMPCollector(CollectorTestCase):
@@ -20,3 +191,32 @@ class TestSNMPCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPCollector)
+
+    @patch('socket.gethostbyname')
+    def test_resolve(self, gethostbyname):
+        gethostbyname.return_value = '10.0.0.1'
+        self.assertEqual(self.collector.resolve('sw1'), '10.0.0.1')
+        self.assertEqual(self.collector.resolve('sw1'), '10.0.0.1')
+        self.assertEqual(gethostbyname.call_count, 1)
+
+        # Expired, and the DNS is down: keep the old address
+        self.collector.addresses['sw1'] = ('10.0.0.1', 0)
+        gethostbyname.side_effect = socket.gaierror('down')
+        self.assertEqual(self.collector.resolve('sw1'), '10.0.0.1')
+        self.assertRaises(socket.gaierror, self.collector.resolve, 'sw2')
+
+    @patch.object(SNMPCollector, 'publish_gauge')
+    def test_publish_device_stats(self, publish_gauge):
+        requests = [Mock(latency=0.25, timed_out=False, error=None),
+                    Mock(latency=0.5, timed_out=True, error=TIMEOUT),
+                    Mock(latency=None, timed_out=False, error='unknown')]
+        self.collector.publish_device_stats('sw1', requests)
+        self.assertEqual(publish_gauge.call_args_list, [
+            (('devices.sw1.snmp.latency_ms', 500.0), {'precision': 1}),
+            (('devices.sw1.snmp.timeouts', 1), {}),
+            (('devices.sw1.snmp.errors', 1), {}),
+        ])
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
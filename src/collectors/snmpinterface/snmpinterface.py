@@ -33,6 +33,10 @@ you need modify your graphite data retentions to handle this properly.
     path = interface
     interval = 60
 
+    # Devices polled at once, and rows fetched by each GETBULK request
+    max_in_flight = 64
+    max_repetitions = 25
+
     [devices]
 
     [[router1]]
@@ -55,9 +59,11 @@ restart diamond.
 
 #### Notes
 
-This implimentation is well suited for collecting a small number of metrics
-locally. If you want to collect a large number of remote metrics, consider
-https://github.com/GreggBzz/snmp-interface-poll as an alternative collector
+All the devices are polled at once: the IF-MIB tables of every device are
+walked with GETBULK requests, up to max_in_flight of them waiting for an
+answer at a time. The time taken to poll each device and its numbers of
+timeouts and errors are published under devices.<device>.snmp, unless
+device_stats is False.
 
 """
 
@@ -115,46 +121,63 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
         default_config['byte_unit'] = ['bit', 'byte']
         return default_config
 
-    def collect_snmp(self, device, host, port, community):
+    def poll_snmp(self, device, host, port, community):
         """
-        Collect SNMP interface data from device
+        Queue the walks of the IF-MIB tables of a device
         """
         # Log
         self.log.info("Collecting SNMP interface statistics from: %s", device)
 
-        # Define a list of interface indexes
-        ifIndexes = []
-
-        # Get Interface Indexes
-        ifIndexOid = '.'.join([self.IF_MIB_INDEX_OID])
-        ifIndexData = self.walk(ifIndexOid, host, port, community)
-        ifIndexes = [v for v in ifIndexData.values()]
+        return [
+            self.engine.walk(device, host, port, community,
+                             [self.IF_MIB_TYPE_OID, self.IF_MIB_NAME_OID]),
+            self.engine.walk(device, host, port, community,
+                             self.IF_MIB_GAUGE_OID_TABLE.values()),
+            self.engine.walk(device, host, port, community,
+                             self.IF_MIB_COUNTER_OID_TABLE.values()),
+        ]
 
-        for ifIndex in ifIndexes:
-            # Get Interface Type
-            ifTypeOid = '.'.join([self.IF_MIB_TYPE_OID, ifIndex])
-            ifTypeData = self.get(ifTypeOid, host, port, community)
-            if ifTypeData[ifTypeOid] not in self.IF_TYPES:
+    def _get_column(self, values, oid):
+        """
+        Return the values of a walked table column by interface index
+        """
+        prefix = oid + '.'
+        column = {}
+        for o, v in values.iteritems():
+            if o.startswith(prefix):
+                column[o[len(prefix):]] = v
+        return column
+
+    def publish_snmp(self, device, requests):
+        """
+        Publish the interface data of a device from its walked IF-MIB tables
+        """
+        values = {}
+        for request in requests:
+            values.update(request.values)
+
+        ifTypes = self._get_column(values, self.IF_MIB_TYPE_OID)
+        ifNames = self._get_column(values, self.IF_MIB_NAME_OID)
+        gauges = [(name, self._get_column(values, oid))
+                  for name, oid in self.IF_MIB_GAUGE_OID_TABLE.items()]
+        counters = [(name, self._get_column(values, oid))
+                    for name, oid in self.IF_MIB_COUNTER_OID_TABLE.items()]
+
+        for ifIndex, ifType in ifTypes.items():
+            if ifType not in self.IF_TYPES or ifIndex not in ifNames:
                 # Skip Interface
                 continue
-            # Get Interface Name
-            ifNameOid = '.'.join([self.IF_MIB_NAME_OID, ifIndex])
-            ifNameData = self.get(ifNameOid, host, port, community)
-            ifName = ifNameData[ifNameOid]
             # Remove quotes from string
-            ifName = re.sub(r'(\"|\')', '', ifName)
+            ifName = re.sub(r'(\"|\')', '', ifNames[ifIndex])
+            metricIfDescr = re.sub(r'\W', '_', ifName)
 
             # Get Gauges
-            for gaugeName, gaugeOid in self.IF_MIB_GAUGE_OID_TABLE.items():
-                ifGaugeOid = '.'.join([self.IF_MIB_GAUGE_OID_TABLE[gaugeName],
-                                       ifIndex])
-                ifGaugeData = self.get(ifGaugeOid, host, port, community)
-                ifGaugeValue = ifGaugeData[ifGaugeOid]
+            for gaugeName, column in gauges:
+                ifGaugeValue = column.get(ifIndex)
                 if not ifGaugeValue:
                     continue
 
                 # Get Metric Name and Value
-                metricIfDescr = re.sub(r'\W', '_', ifName)
                 metricName = '.'.join([metricIfDescr, gaugeName])
                 metricValue = int(ifGaugeValue)
                 # Get Metric Path
@@ -166,18 +189,11 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
                 self.publish_gauge(metricPath, metricValue)
 
             # Get counters (64bit)
-            counterItems = self.IF_MIB_COUNTER_OID_TABLE.items()
-            for counterName, counterOid in counterItems:
-                ifCounterOid = '.'.join(
-                    [self.IF_MIB_COUNTER_OID_TABLE[counterName], ifIndex])
-                ifCounterData = self.get(ifCounterOid, host, port, community)
-                ifCounterValue = ifCounterData[ifCounterOid]
+            for counterName, column in counters:
+                ifCounterValue = column.get(ifIndex)
                 if not ifCounterValue:
                     continue
 
-                # Get Metric Name and Value
-                metricIfDescr = re.sub(r'\W', '_', ifName)
-
                 if counterName in ['ifHCInOctets', 'ifHCOutOctets']:
                     for unit in self.config['byte_unit']:
                         # Convert Metric
@@ -4,7 +4,11 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from test import unittest
+from mock import Mock
+from mock import patch
 
+from diamond.collector import Collector
 from snmpinterface import SNMPInterfaceCollector
 
 
@@ -18,3 +22,55 @@ class TestSNMPInterfaceCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPInterfaceCollector)
+
+    def test_poll_snmp(self):
+        self.collector.engine = Mock()
+        requests = self.collector.poll_snmp('sw1', 'sw1.example.com', 161,
+                                            'public')
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(self.collector.engine.walk.call_count, 3)
+        walked = []
+        for call in self.collector.engine.walk.call_args_list:
+            self.assertEqual(call[0][:4],
+                             ('sw1', 'sw1.example.com', 161, 'public'))
+            walked.extend(call[0][4])
+        self.assertEqual(
+            sorted(walked),
+            sorted([SNMPInterfaceCollector.IF_MIB_TYPE_OID,
+                    SNMPInterfaceCollector.IF_MIB_NAME_OID]
+                   + SNMPInterfaceCollector.IF_MIB_GAUGE_OID_TABLE.values()
+                   + SNMPInterfaceCollector.IF_MIB_COUNTER_OID_TABLE.values()))
+
+    @patch.object(Collector, 'publish')
+    def test_publish_snmp(self, publish_mock):
+        requests = [
+            Mock(values={
+                '1.3.6.1.2.1.2.2.1.3.1': '6',
+                '1.3.6.1.2.1.2.2.1.3.2': '24',
+                '1.3.6.1.2.1.31.1.1.1.1.1': '"Gi0/1"',
+                '1.3.6.1.2.1.31.1.1.1.1.2': 'lo',
+            }),
+            Mock(values={
+                '1.3.6.1.2.1.2.2.1.14.1': '3',
+                '1.3.6.1.2.1.2.2.1.14.2': '5',
+            }),
+            Mock(values={
+                '1.3.6.1.2.1.31.1.1.1.6.1': '1024',
+                '1.3.6.1.2.1.31.1.1.1.7.1': '7',
+                '1.3.6.1.2.1.31.1.1.1.6.2': '2048',
+            }),
+        ]
+        self.collector.publish_snmp('sw1', requests)
+
+        # The loopback isn't an ethernet interface
+        self.assertEqual(publish_mock.call_count, 4)
+        self.assertPublishedMany(publish_mock, {
+            'devices.sw1.interface.Gi0_1.ifInErrors': 3,
+            'devices.sw1.interface.Gi0_1.ifHCInbit': 0,
+            'devices.sw1.interface.Gi0_1.ifHCInbyte': 0,
+            'devices.sw1.interface.Gi0_1.ifInUcastPkts': 0,
+        })
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,10 @@
 ################################################################################
 
 import os
+import shutil
 import sys
+import tempfile
+import time
 
 from test import CollectorTestCase
 from test import get_collector_config
@@ -65,6 +68,140 @@ class TestUserScriptsCollector(CollectorTestCase):
         # be due to raising an exception. Meh.
         assert publish_mock.call_args_list
 
+
+class TestUserScriptsRuns(CollectorTestCase):
+    def setUp(self):
+        self.scripts_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.scripts_path)
+
+    def get_collector(self, **config):
+        config.setdefault('scripts_path', self.scripts_path)
+        return UserScriptsCollector(get_collector_config(
+            'UserScriptsCollector', config), None)
+
+    def add_script(self, name, body):
+        path = os.path.join(self.scripts_path, name)
+        f = open(path, 'w')
+        f.write('#!/bin/sh\n' + body)
+        f.close()
+        os.chmod(path, 0755)
+
+    def get_published(self, publish_mock):
+        return dict((call[0][0], call[0][1])
+                    for call in publish_mock.call_args_list)
+
+    @patch.object(Collector, 'publish')
+    def test_parallel(self, publish_mock):
+        for i in range(3):
+            self.add_script('s%d.sh' % i,
+                            'sleep 0.5\necho "s.%d %d"\n' % (i, i))
+        collector = self.get_collector(parallelism=3)
+
+        start = time.time()
+        collector.collect()
+        self.assertTrue(time.time() - start < 1.4)
+
+        published = self.get_published(publish_mock)
+        for i in range(3):
+            self.assertEqual(published['s.%d' % i], str(i))
+            self.assertEqual(published['userscripts.s%d_sh.exit_status' % i],
+                             0)
+            self.assertTrue(
+                published['userscripts.s%d_sh.duration_ms' % i] >= 500)
+
+    @patch.object(Collector, 'publish')
+    def test_timeout(self, publish_mock):
+        self.add_script('hung.sh', 'echo "hung.before 1"\nsleep 30\n')
+        self.add_script('ok.sh', 'echo "ok.value 2"\nexit 3\n')
+        collector = self.get_collector(timeout=0.5, parallelism=1)
+
+        start = time.time()
+        collector.collect()
+        self.assertTrue(time.time() - start < 5)
+
+        published = self.get_published(publish_mock)
+        # The output before the hang is kept
+        self.assertEqual(published['hung.before'], '1')
+        self.assertEqual(published['userscripts.hung_sh.exit_status'], -9)
+        self.assertEqual(published['ok.value'], '2')
+        self.assertEqual(published['userscripts.ok_sh.exit_status'], 3)
+
+    @patch.object(Collector, 'publish')
+    def test_timeout_without_output(self, publish_mock):
+        # Still running, but its output is closed
+        self.add_script('quiet.sh', 'exec >/dev/null 2>&1\nsleep 30\n')
+        collector = self.get_collector(timeout=0.5)
+
+        start = time.time()
+        collector.collect()
+        self.assertTrue(time.time() - start < 5)
+
+        published = self.get_published(publish_mock)
+        self.assertEqual(published['userscripts.quiet_sh.exit_status'], -9)
+
+    @patch.object(Collector, 'publish')
+    def test_no_script_stats(self, publish_mock):
+        self.add_script('a.sh', 'printf "a.value 1"\n')
+        self.get_collector(script_stats=False).collect()
+        # The last line without a newline too
+        self.assertEqual(self.get_published(publish_mock), {'a.value': '1'})
+
+    @patch.object(Collector, 'publish')
+    def test_streaming(self, publish_mock):
+        self.add_script('stream.sh', 'i=0\nwhile true; do\n'
+                        '  i=$((i+1)); echo "stream.count $i"; sleep 0.1\n'
+                        'done\n')
+        collector = self.get_collector(streaming_scripts=['stream.sh'])
+        try:
+            collector.collect()
+            script = collector.streams['stream.sh']
+            self.assertEqual(publish_mock.call_count, 0)
+
+            time.sleep(0.5)
+            collector.collect()
+            # Only the last value, from the same process
+            self.assertEqual(publish_mock.call_count, 1)
+            self.assertTrue(int(publish_mock.call_args[0][1]) >= 2)
+            self.assertTrue(collector.streams['stream.sh'] is script)
+
+            # Started again after it exits
+            script.kill()
+            script.proc.wait()
+            collector.collect()
+            self.assertFalse(collector.streams['stream.sh'] is script)
+        finally:
+            collector.__del__()
+
+    @patch.object(Collector, 'publish')
+    def test_streaming_drained_between_runs(self, publish_mock):
+        marker = os.path.join(self.scripts_path, 'written')
+        # More than a pipe holds, then lines as fast as they can be written
+        self.add_script('stream.sh',
+                        'seq 1 100000 | sed "s/^/stream.count /"\n'
+                        'touch %s\n'
+                        'yes "stream.last 1"\n' % marker)
+        collector = self.get_collector(streaming_scripts=['stream.sh'])
+        try:
+            collector.collect()
+            script = collector.streams['stream.sh']
+            # Read while the collector doesn't run
+            for i in xrange(500):
+                if 'stream.last' in script.values:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(marker))
+
+            # Doesn't keep reading what keeps coming
+            collector.collect()
+            self.assertEqual(self.get_published(publish_mock), {
+                'stream.count': '100000',
+                'stream.last': '1',
+            })
+        finally:
+            collector.__del__()
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
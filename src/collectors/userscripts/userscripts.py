@@ -11,8 +11,20 @@ metric.path.b 2
 metric.path.c 3
 ```
 
-They are not passed any arguments and if they return an error code,
-no metrics are collected.
+They are not passed any arguments. Their output is parsed as it comes, and
+an error code is logged.
+
+Up to `parallelism` scripts run at once. A script still running after
+`timeout` seconds is killed, along with the processes it started. The run
+time in ms and the exit status of each script (negative for the signal that
+killed it) are published as userscripts.<script>.duration_ms and
+userscripts.<script>.exit_status, unless `script_stats` is False.
+
+Scripts listed in `streaming_scripts` are started once and kept running:
+they print `name value` lines whenever they like. A thread per script reads
+them as they come, so a script is never blocked on a full pipe, and keeps the
+last value of each name, published on every run. They are started again if
+they exit.
 
 #### Dependencies
 
@@ -22,17 +34,187 @@ no metrics are collected.
 
 import diamond.collector
 import diamond.convertor
+import errno
 import os
+import re
+import select
+import signal
 import subprocess
+import threading
+
+from diamond.util import monotonic
+
+# Bytes read from a pipe at once
+READ_SIZE = 65536
+
+# Seconds to wait for the rest of the output of a streaming script that exited
+STREAM_DRAIN_TIMEOUT = 1
+
+# Seconds between checks on a script that has nothing to read from
+REAP_INTERVAL = 0.1
+
+
+class UserScript(object):
+    """
+    A running script, its output split into lines as it comes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.start_time = monotonic()
+        # Its own process group, killed as a whole
+        self.proc = subprocess.Popen([path],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     close_fds=True,
+                                     preexec_fn=os.setsid)
+        self.stdout = self.proc.stdout.fileno()
+        self.stderr = self.proc.stderr.fileno()
+        self.open_fds = set([self.stdout, self.stderr])
+        self.partial = ''
+        self.err = []
+        self.killed = False
+
+    def read(self, fd):
+        """
+        Read what is available on one of the pipes of the script, return
+        the complete lines of output read
+        """
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError, e:
+            if e.errno in (errno.EINTR, errno.EAGAIN):
+                return []
+            data = ''
+        if not data:
+            self.open_fds.discard(fd)
+            if fd == self.stdout and self.partial:
+                # Last line without a newline
+                lines, self.partial = [self.partial], ''
+                return lines
+            return []
+        if fd == self.stderr:
+            self.err.append(data)
+            return []
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        return lines
+
+    def finished(self):
+        """
+        Whether the script has exited and all of its output was read (it is
+        dropped once the script was killed)
+        """
+        if self.proc.poll() is None:
+            return False
+        return self.killed or not self.open_fds
+
+    def kill(self):
+        """
+        Kill the script and the processes it started
+        """
+        self.killed = True
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def wait(self):
+        """
+        Reap the script, close its pipes and return its exit status
+        """
+        returncode = self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self.open_fds.clear()
+        return returncode
+
+    def is_running(self):
+        return self.proc.poll() is None
+
+
+class StreamingScript(UserScript):
+    """
+    A script kept running, its output read as it comes by a thread of its
+    own, which keeps the last value of each name
+    """
+
+    def __init__(self, path, parse_line):
+        UserScript.__init__(self, path)
+        self.parse_line = parse_line
+        self.values = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.drain,
+                                       name='userscripts-' + self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def drain(self):
+        """
+        Read the output of the script until it closes its pipes
+        """
+        while self.open_fds:
+            poller = select.poll()
+            for fd in self.open_fds:
+                poller.register(fd, select.POLLIN)
+            try:
+                ready = poller.poll()
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            # Pipes closed by wait() are POLLNVAL, and dropped by read()
+            for fd, event in ready:
+                self.lock.acquire()
+                try:
+                    for line in self.read(fd):
+                        parsed = self.parse_line(self.path, line)
+                        if parsed is not None:
+                            self.values[parsed[0]] = parsed[1]
+                finally:
+                    self.lock.release()
+
+    def pop(self):
+        """
+        Return the last values printed since the last call, and the error
+        output
+        """
+        self.lock.acquire()
+        try:
+            values, self.values = self.values, {}
+            err, self.err = self.err, []
+        finally:
+            self.lock.release()
+        return values, ''.join(err)
+
+    def stop(self):
+        """
+        Kill the script, once it has exited or not, and reap it
+        """
+        self.kill()
+        self.thread.join(STREAM_DRAIN_TIMEOUT)
+        return self.wait()
 
 
 class UserScriptsCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(UserScriptsCollector, self).__init__(*args, **kwargs)
+        # Streaming scripts kept running between runs, by name
+        self.streams = {}
+
     def get_default_config_help(self):
         config_help = super(UserScriptsCollector,
                             self).get_default_config_help()
         config_help.update({
             'scripts_path': "Path to find the scripts to run",
+            'parallelism': "Number of scripts running at once",
+            'timeout': "Seconds after which a script is killed, 0 for never",
+            'script_stats': "Publish the run time and exit status of the " +
+                            "scripts",
+            'streaming_scripts': "Scripts kept running, printing metrics " +
+                                 "whenever they like",
         })
         return config_help
 
@@ -46,14 +228,25 @@ class UserScriptsCollector(diamond.collector.Collector):
             'scripts_path': '/etc/diamond/user_scripts/',
             'method':       'Threaded',
             'floatprecision': 4,
+            'parallelism': 4,
+            'timeout': 60,
+            'script_stats': True,
+            'streaming_scripts': [],
         })
         return config
 
-    def collect(self):
-        scripts_path = self.config['scripts_path']
-        if not os.access(scripts_path, os.R_OK):
-            return None
-        for script in os.listdir(scripts_path):
+    def get_streaming_scripts(self):
+        streaming = self.config['streaming_scripts']
+        if isinstance(streaming, basestring):
+            streaming = streaming.split()
+        return set(streaming)
+
+    def get_scripts(self, scripts_path):
+        """
+        Return the paths of the executable files of scripts_path
+        """
+        scripts = []
+        for script in sorted(os.listdir(scripts_path)):
             absolutescriptpath = os.path.join(scripts_path, script)
             executable = os.access(absolutescriptpath, os.X_OK)
             is_file = os.path.isfile(absolutescriptpath)
@@ -65,38 +258,176 @@ class UserScriptsCollector(diamond.collector.Collector):
                 # Don't bother logging skipped non-file files (typically
                 # directories)
                 continue
-            out = None
-            self.log.debug("Executing %s" % absolutescriptpath)
-            try:
-                proc = subprocess.Popen([absolutescriptpath],
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-                (out, err) = proc.communicate()
-            except subprocess.CalledProcessError, e:
-                self.log.error("%s error launching: %s; skipping" %
-                               (absolutescriptpath, e))
-                continue
-            if proc.returncode:
-                self.log.error("%s return exit value %s; skipping" %
-                               (absolutescriptpath, proc.returncode))
-            if not out:
-                self.log.info("%s return no output" % absolutescriptpath)
+            scripts.append(absolutescriptpath)
+        return scripts
+
+    def collect(self):
+        scripts_path = self.config['scripts_path']
+        if not os.access(scripts_path, os.R_OK):
+            return None
+
+        streaming = self.get_streaming_scripts()
+        scripts = []
+        for absolutescriptpath in self.get_scripts(scripts_path):
+            if os.path.basename(absolutescriptpath) in streaming:
+                self.collect_stream(absolutescriptpath)
+            else:
+                scripts.append(absolutescriptpath)
+
+        self.run_scripts(scripts)
+
+    def start_script(self, absolutescriptpath, streaming=False):
+        self.log.debug("Executing %s" % absolutescriptpath)
+        try:
+            if streaming:
+                return StreamingScript(absolutescriptpath, self.parse_line)
+            return UserScript(absolutescriptpath)
+        except (OSError, ValueError), e:
+            self.log.error("%s error launching: %s; skipping" %
+                           (absolutescriptpath, e))
+
+    def run_scripts(self, scripts):
+        """
+        Run the scripts, parallelism of them at a time, publishing their
+        output as it comes and killing those running past the timeout
+        """
+        parallelism = max(int(self.config['parallelism']), 1)
+        timeout = float(self.config['timeout'])
+        pending = list(reversed(scripts))
+        running = []
+
+        while pending or running:
+            while pending and len(running) < parallelism:
+                script = self.start_script(pending.pop())
+                if script is not None:
+                    running.append(script)
+            if not running:
                 continue
-            if err:
-                self.log.error("%s return error output: %s" %
-                               (absolutescriptpath, err))
-            # Use filter to remove empty lines of output
-            for line in filter(None, out.split('\n')):
-                # Ignore invalid lines
-                try:
-                    name, value = line.split()
-                    float(value)
-                except ValueError:
-                    self.log.error("%s returned error output: %s" %
-                                   (absolutescriptpath, line))
+
+            wait = None
+            if timeout > 0:
+                started = [r.start_time for r in running if not r.killed]
+                if started:
+                    wait = max(min(started) + timeout - monotonic(), 0)
+            # poll() rather than select(), whose fds must be below 1024
+            poller = select.poll()
+            fds = {}
+            for script in running:
+                if script.killed or not script.open_fds:
+                    # Nothing to read, check on it again soon
+                    if wait is None or wait > REAP_INTERVAL:
+                        wait = REAP_INTERVAL
+                    continue
+                for fd in script.open_fds:
+                    fds[fd] = script
+                    poller.register(fd, select.POLLIN)
+            try:
+                if wait is None:
+                    ready = poller.poll()
+                else:
+                    ready = poller.poll(wait * 1000)
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
                     continue
-                name, value = line.split()
-                floatprecision = 0
-                if "." in value:
-                    floatprecision = self.config['floatprecision']
-                self.publish(name, value, precision=floatprecision)
+                raise
+
+            for fd, event in ready:
+                script = fds[fd]
+                for line in script.read(fd):
+                    self.publish_line(script.path, line)
+
+            now = monotonic()
+            for script in list(running):
+                if script.finished():
+                    running.remove(script)
+                    self.finish_script(script)
+                elif (not script.killed and timeout > 0
+                        and now - script.start_time >= timeout):
+                    # Whether its pipes are still open or not
+                    self.log.error("%s still running after %ss; killing it" %
+                                   (script.path, timeout))
+                    script.kill()
+
+    def finish_script(self, script):
+        """
+        Reap a script, log its errors and publish its stats
+        """
+        returncode = script.wait()
+        duration = monotonic() - script.start_time
+        if returncode and not script.killed:
+            self.log.error("%s return exit value %s" %
+                           (script.path, returncode))
+        err = ''.join(script.err)
+        if err:
+            self.log.error("%s return error output: %s" %
+                           (script.path, err))
+
+        if diamond.collector.str_to_bool(self.config['script_stats']):
+            name = 'userscripts.' + re.sub(r'[^\w-]', '_', script.name)
+            self.publish(name + '.duration_ms', duration * 1000,
+                         precision=1)
+            self.publish(name + '.exit_status', returncode)
+
+    def collect_stream(self, absolutescriptpath):
+        """
+        Publish the last values printed by a streaming script since the
+        last run, starting it if it's not running
+        """
+        name = os.path.basename(absolutescriptpath)
+        script = self.streams.get(name)
+        if script is None or not script.is_running():
+            if script is not None:
+                # Publish what it printed before exiting
+                returncode = script.stop()
+                self.read_stream(script)
+                self.log.error("%s exited with %s; starting it again" %
+                               (script.path, returncode))
+            script = self.streams[name] = self.start_script(
+                absolutescriptpath, streaming=True)
+            if script is None:
+                del self.streams[name]
+            return
+        self.read_stream(script)
+
+    def read_stream(self, script):
+        """
+        Publish the values read from a streaming script since the last run
+        """
+        values, err = script.pop()
+        if err:
+            self.log.error("%s return error output: %s" %
+                           (script.path, err))
+        for name, value in sorted(values.iteritems()):
+            self.publish_value(name, value)
+
+    def parse_line(self, absolutescriptpath, line):
+        """
+        Return the name and value of a line of output, None if it's empty
+        or invalid
+        """
+        if not line:
+            return None
+        # Ignore invalid lines
+        try:
+            name, value = line.split()
+            float(value)
+        except ValueError:
+            self.log.error("%s returned error output: %s" %
+                           (absolutescriptpath, line))
+            return None
+        return name, value
+
+    def publish_line(self, absolutescriptpath, line):
+        parsed = self.parse_line(absolutescriptpath, line)
+        if parsed is not None:
+            self.publish_value(*parsed)
+
+    def publish_value(self, name, value):
+        floatprecision = 0
+        if "." in value:
+            floatprecision = self.config['floatprecision']
+        self.publish(name, value, precision=floatprecision)
+
+    def __del__(self):
+        for script in getattr(self, 'streams', {}).values():
+            script.stop()
@@ -8,12 +8,6 @@ from test import unittest
 from mock import Mock
 from mock import patch
 
-try:
-    from cStringIO import StringIO
-    StringIO  # workaround for pyflakes issue #13
-except ImportError:
-    from StringIO import StringIO
-
 from diamond.collector import Collector
 from vmstat import VMStatCollector
 
@@ -31,13 +25,13 @@ class TestVMStatCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(VMStatCollector)
 
-    @patch('__builtin__.open')
+    @patch.object(Collector, 'read_proc')
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
-    def test_should_open_proc_vmstat(self, publish_mock, open_mock):
-        open_mock.return_value = StringIO('')
+    def test_should_open_proc_vmstat(self, publish_mock, read_mock):
+        read_mock.return_value = ''
         self.collector.collect()
-        open_mock.assert_called_once_with('/proc/vmstat')
+        read_mock.assert_called_once_with('/proc/vmstat')
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
@@ -11,7 +11,7 @@ Uses /proc/vmstat to collect data on virtual memory manager
 
 import diamond.collector
 import os
-import re
+from diamond.procfs import parse_keyvalue
 
 
 class VMStatCollector(diamond.collector.Collector):
@@ -46,22 +46,12 @@ class VMStatCollector(diamond.collector.Collector):
             return None
 
         results = {}
-        # open file
-        file = open(self.PROC)
-        exp = '^(pgpgin|pgpgout|pswpin|pswpout)\s(\d+)'
-        reg = re.compile(exp)
-        # Build regex
-        for line in file:
-            match = reg.match(line)
-            if match:
-                name = match.group(1)
-                value = match.group(2)
+        values = parse_keyvalue(self.read_proc(self.PROC))
+        for name, max_value in self.MAX_VALUES.items():
+            if name in values:
                 results[name] = self.derivative(name,
-                                                int(value),
-                                                self.MAX_VALUES[name])
-
-        # Close file
-        file.close()
+                                                values[name],
+                                                max_value)
 
         for key, value in results.items():
             self.publish(key, value, 2)
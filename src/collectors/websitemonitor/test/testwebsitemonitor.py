@@ -37,8 +37,9 @@ class TestWebsiteCollector(CollectorTestCase):
 
         self.collector = WebsiteMonitorCollector(config, None)
 
-        self.patcher = patch('urllib2.urlopen')
+        self.patcher = patch('diamond.httpclient.HTTPClient.urlopen')
         self.urlopen_mock = self.patcher.start()
+        self.addCleanup(self.patcher.stop)
 
     def test_import(self):
         self.assertTrue(WebsiteMonitorCollector)
@@ -66,6 +67,3 @@ class TestWebsiteCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, {
         })
-
-    def tearDown(self):
-        self.patcher.stop()
@@ -12,16 +12,32 @@ import time
 from datetime import datetime
 import diamond.collector
 
+from diamond.collector import str_to_bool
+from diamond.httpclient import HTTPClient
+
 
 class WebsiteMonitorCollector(diamond.collector.Collector):
     """
     Gather HTTP response code and Duration of HTTP request
     """
+
+    def __init__(self, *args, **kwargs):
+        super(WebsiteMonitorCollector, self).__init__(*args, **kwargs)
+        timeout = float(self.config['timeout'])
+        if str_to_bool(self.config['keepalive']):
+            self.http = HTTPClient(timeout=timeout)
+        else:
+            # A new connection for every request, its time is measured too
+            self.http = HTTPClient(timeout=timeout, max_connections=0)
+
     def get_default_config_help(self):
         config_help = super(WebsiteMonitorCollector,
                             self).get_default_config_help()
         config_help.update({
             'URL': "FQDN of HTTP endpoint to test",
+            'timeout': "Seconds to wait for a response",
+            'keepalive': ('Keep the connection open between requests. The '
+                          'time measured then leaves out connecting'),
 
         })
         return config_help
@@ -34,6 +50,8 @@ class WebsiteMonitorCollector(diamond.collector.Collector):
                                self).get_default_config()
         default_config['URL'] = ''
         default_config['path'] = 'websitemonitor'
+        default_config['timeout'] = 10
+        default_config['keepalive'] = False
         return default_config
 
     def collect(self):
@@ -47,9 +65,10 @@ class WebsiteMonitorCollector(diamond.collector.Collector):
                                         ).strftime('%B %d, %Y %H:%M:%S')
             self.log.debug('Start time: %s' % (st))
 
-            resp = urllib2.urlopen(req)
+            resp = self.http.urlopen(req)
             # time in seconds since epoch as a floating number
             end_time = time.time()
+            resp.close()
             # human-readable end time e.eg. November 25, 2013 18:15:56
             et = datetime.fromtimestamp(end_time).strftime('%B %d, %Y %H:%M%S')
             self.log.debug('End time: %s' % (et))
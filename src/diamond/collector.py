@@ -11,10 +11,13 @@ import logging
 import configobj
 import traceback
 import time
-import re
 import subprocess
 
 from diamond.metric import Metric
+from diamond.metricfilter import MetricFilter
+from diamond.procfs import ProcFile
+from diamond.rates import RateTable
+from diamond.util import monotonic
 from error import DiamondException
 
 # Detect the architecture of the system and set the counters for MAX_VALUES
@@ -26,6 +29,11 @@ if platform.architecture()[0] == '64bit':
 else:
     MAX_COUNTER = (2 ** 32) - 1
 
+# Maximum number of metric paths memoized per collector. The memo is only
+# emptied when it gets that big: it is built from the config the collector
+# was created with, which a config reload doesn't change.
+METRIC_PATH_CACHE_SIZE = 10000
+
 
 def get_hostname(config, method=None):
     """
@@ -170,6 +178,7 @@ class Collector(object):
         self.name = self.__class__.__name__
         self.handlers = handlers
         self.last_values = {}
+        self.last_tables = {}
 
         # Get Collector class
         cls = self.__class__
@@ -206,6 +215,12 @@ class Collector(object):
         self.config['measure_collector_time'] = str_to_bool(
             self.config['measure_collector_time'])
 
+        self.config['measured_interval'] = str_to_bool(
+            self.config['measured_interval'])
+
+        self.config['sample_timestamp'] = str_to_bool(
+            self.config['sample_timestamp'])
+
         # Raise an error if both whitelist and blacklist are specified
         if self.config['metrics_whitelist'] and \
                 self.config['metrics_blacklist']:
@@ -213,15 +228,32 @@ class Collector(object):
                     'Both metrics_whitelist and metrics_blacklist specified ' +
                     'in file %s' % configfile)
 
+        self._metric_filter = MetricFilter(self.config['metrics_whitelist'],
+                                           self.config['metrics_blacklist'])
         if self.config['metrics_whitelist']:
-            self.config['metrics_whitelist'] = re.compile(
-                self.config['metrics_whitelist'])
+            self.config['metrics_whitelist'] = self._metric_filter.whitelist
         elif self.config['metrics_blacklist']:
-            self.config['metrics_blacklist'] = re.compile(
-                self.config['metrics_blacklist'])
+            self.config['metrics_blacklist'] = self._metric_filter.blacklist
 
         self.collect_running = False
 
+        # Metrics waiting to be handed to the handlers, see publish_many
+        self._pending_metrics = None
+
+        # Metric path caches, see get_metric_path. They live as long as the
+        # collector, and so does the config they are built from: a reload
+        # only creates again the collectors whose module changed.
+        self._path_prefixes = None
+        self._metric_paths = {}
+
+        # /proc files kept open between runs, see read_proc
+        self._proc_files = {}
+
+        # Monotonic and wall clock times of the start of the current run,
+        # see _run. Rates are computed against the monotonic one.
+        self._sample_time = None
+        self._sample_timestamp = None
+
     def get_default_config_help(self):
         """
         Returns the help text for the configuration options for this collector
@@ -230,9 +262,17 @@ class Collector(object):
             'enabled': 'Enable collecting these metrics',
             'byte_unit': 'Default numeric output(s)',
             'measure_collector_time': 'Collect the collector run time in ms',
-            'metrics_whitelist': 'Regex to match metrics to transmit. ' +
+            'measured_interval': 'Compute the rates of counters over the ' +
+                                 'time measured between two runs rather ' +
+                                 'than over the configured interval',
+            'sample_timestamp': 'Timestamp the metrics with the start time ' +
+                                'of the run that collected them rather ' +
+                                'than with the time they are published',
+            'metrics_whitelist': 'Regex (or list of regexes) to match ' +
+                                 'metrics to transmit. ' +
                                  'Mutually exclusive with metrics_blacklist',
-            'metrics_blacklist': 'Regex to match metrics to block. ' +
+            'metrics_blacklist': 'Regex (or list of regexes) to match ' +
+                                 'metrics to block. ' +
                                  'Mutually exclusive with metrics_whitelist',
         }
 
@@ -287,6 +327,13 @@ class Collector(object):
             # Collect the collector run time in ms
             'measure_collector_time': False,
 
+            # Compute rates over the time elapsed between two runs, which
+            # is longer than the interval when a run is late or skipped
+            'measured_interval': True,
+
+            # Timestamp metrics with the start of the run collecting them
+            'sample_timestamp': False,
+
             # Whitelist of metrics to let through
             'metrics_whitelist': None,
 
@@ -328,20 +375,48 @@ class Collector(object):
             virtual machine and should have a different
             root prefix.
         """
+        key = (name, instance)
+        try:
+            return self._metric_paths[key]
+        except KeyError:
+            pass
+
+        if self._path_prefixes is None:
+            self._path_prefixes = self._get_path_prefixes()
+        prefix, instance_prefix = self._path_prefixes
+
+        if instance is not None:
+            path = ''.join((instance_prefix[0], instance, instance_prefix[1],
+                            '.', name))
+        else:
+            path = '.'.join((prefix, name))
+
+        # Collectors publishing ever-changing names shouldn't grow the cache
+        # without bounds
+        if len(self._metric_paths) >= METRIC_PATH_CACHE_SIZE:
+            self._metric_paths.clear()
+        self._metric_paths[key] = path
+        return path
+
+    def _get_path_prefixes(self):
+        """
+        Build the parts of the metric paths that only depend on the config:
+        the prefix of host metrics, and the parts surrounding the instance
+        name of virtual machine metrics
+        """
         if 'path' in self.config:
             path = self.config['path']
         else:
             path = self.__class__.__name__
 
-        if instance is not None:
-            if 'instance_prefix' in self.config:
-                prefix = self.config['instance_prefix']
-            else:
-                prefix = 'instances'
-            if path == '.':
-                return '.'.join([prefix, instance, name])
-            else:
-                return '.'.join([prefix, instance, path, name])
+        if 'instance_prefix' in self.config:
+            prefix = self.config['instance_prefix']
+        else:
+            prefix = 'instances'
+        if path == '.':
+            instance_prefix = (prefix + '.', '')
+        else:
+            instance_prefix = (prefix + '.', '.' + path)
 
         if 'path_prefix' in self.config:
             prefix = self.config['path_prefix']
@@ -364,10 +439,10 @@ class Collector(object):
         if suffix:
             prefix = '.'.join((prefix, suffix))
 
-        if path == '.':
-            return '.'.join([prefix, name])
-        else:
-            return '.'.join([prefix, path, name])
+        if path != '.':
+            prefix = '.'.join((prefix, path))
+
+        return prefix, instance_prefix
 
     def get_hostname(self):
         return get_hostname(self.config)
@@ -379,17 +454,13 @@ class Collector(object):
         raise NotImplementedError()
 
     def publish(self, name, value, raw_value=None, precision=0,
-                metric_type='GAUGE', instance=None):
+                metric_type='GAUGE', instance=None, timestamp=None):
         """
         Publish a metric with the given name
         """
         # Check whitelist/blacklist
-        if self.config['metrics_whitelist']:
-            if not self.config['metrics_whitelist'].match(name):
-                return
-        elif self.config['metrics_blacklist']:
-            if self.config['metrics_blacklist'].match(name):
-                return
+        if not self._metric_filter.allows(name):
+            return
 
         # Get metric Path
         path = self.get_metric_path(name, instance=instance)
@@ -398,9 +469,14 @@ class Collector(object):
         ttl = float(self.config['interval']) * float(
             self.config['ttl_multiplier'])
 
+        # Sample time of the run, if configured
+        if timestamp is None:
+            timestamp = self._sample_timestamp
+
         # Create Metric
         try:
-            metric = Metric(path, value, raw_value=raw_value, timestamp=None,
+            metric = Metric(path, value, raw_value=raw_value,
+                            timestamp=timestamp,
                             precision=precision, host=self.get_hostname(),
                             metric_type=metric_type, ttl=ttl)
         except DiamondException:
@@ -411,14 +487,51 @@ class Collector(object):
         # Publish Metric
         self.publish_metric(metric)
 
+    def publish_many(self, metrics, precision=0, metric_type='GAUGE',
+                     instance=None):
+        """
+        Publish several metrics, given as a dict or as (name, value) pairs,
+        handing them to each handler in a single batch
+        """
+        if isinstance(metrics, dict):
+            metrics = metrics.iteritems()
+
+        # publish_metric collects the metrics instead of sending them
+        self._pending_metrics = []
+        try:
+            for name, value in metrics:
+                self.publish(name, value, precision=precision,
+                             metric_type=metric_type, instance=instance)
+        finally:
+            pending = self._pending_metrics
+            self._pending_metrics = None
+
+        self.publish_metrics(pending)
+
     def publish_metric(self, metric):
         """
         Publish a Metric object
         """
+        # Inside publish_many, keep it for the batch
+        if self._pending_metrics is not None:
+            self._pending_metrics.append(metric)
+            return
+
         # Process Metric
         for handler in self.handlers:
             handler._process(metric)
 
+    def publish_metrics(self, metrics):
+        """
+        Publish a list of Metric objects
+        """
+        if not metrics:
+            return
+
+        # Process Metrics
+        for handler in self.handlers:
+            handler._process_batch(metrics)
+
     def publish_gauge(self, name, value, precision=0, instance=None):
         return self.publish(name, value, precision=precision,
                             metric_type='GAUGE', instance=instance)
@@ -443,22 +556,20 @@ class Collector(object):
         """
         # Format Metric Path
         path = self.get_metric_path(name, instance=instance)
+        sample_time = self._sample_time
 
         if path in self.last_values:
-            old = self.last_values[path]
+            old, old_time = self.last_values[path]
             # Check for rollover
             if new < old:
                 old = old - max_value
             # Get Change in X (value)
             derivative_x = new - old
 
-            # If we pass in a interval, use it rather then the configured one
-            if interval is None:
-                interval = int(self.config['interval'])
-
             # Get Change in Y (time)
             if time_delta:
-                derivative_y = interval
+                derivative_y = self._get_elapsed(old_time, sample_time,
+                                                 interval)
             else:
                 derivative_y = 1
 
@@ -469,11 +580,48 @@ class Collector(object):
             result = 0
 
         # Store Old Value
-        self.last_values[path] = new
+        self.last_values[path] = (new, sample_time)
 
         # Return result
         return result
 
+    def derivative_table(self, name, labels, rows, max_value=0,
+                         time_delta=True, interval=None,
+                         allow_negative=False):
+        """
+        Calculate the derivatives of a table of counters in one pass, rows
+        being the lists of counters of each label (cpu, disk...). Returns
+        the list of the lists of derivatives of each row, 0 for the rows
+        not in the previous sample of the table called name.
+        """
+        sample_time = self._sample_time
+        if name in self.last_tables:
+            table, old_time = self.last_tables[name]
+        else:
+            table, old_time = RateTable(max_value), None
+        self.last_tables[name] = (table, sample_time)
+
+        if time_delta:
+            interval = self._get_elapsed(old_time, sample_time, interval)
+        else:
+            interval = 1
+
+        return table.update(labels, rows, interval, allow_negative)
+
+    def _get_elapsed(self, old_time, new_time, interval=None):
+        """
+        Return the time between two samples to compute rates over: the
+        given interval, else the time measured between the runs that
+        collected them, else the configured interval
+        """
+        # If we pass in a interval, use it rather then the configured one
+        if interval is not None:
+            return interval
+        if (self.config['measured_interval'] and old_time is not None
+                and new_time is not None and new_time > old_time):
+            return new_time - old_time
+        return int(self.config['interval'])
+
     def _run(self):
         """
         Run the collector unless it's already running
@@ -487,6 +635,11 @@ class Collector(object):
                 start_time = time.time()
                 self.collect_running = True
 
+                # Sample time of everything this run collects
+                self._sample_time = monotonic()
+                if self.config['sample_timestamp']:
+                    self._sample_timestamp = start_time
+
                 # Collect Data
                 self.collect()
 
@@ -503,11 +656,23 @@ class Collector(object):
                 self.log.error(traceback.format_exc())
         finally:
             self.collect_running = False
+            self._sample_time = None
+            self._sample_timestamp = None
             # After collector run, invoke a flush
             # method on each handler.
             for handler in self.handlers:
                 handler._flush()
 
+    def read_proc(self, path):
+        """
+        Return the contents of a /proc file. The file is kept open and read
+        again from the start on the next call.
+        """
+        proc_file = self._proc_files.get(path)
+        if proc_file is None:
+            proc_file = self._proc_files[path] = ProcFile(path)
+        return proc_file.read()
+
     def find_binary(self, binary):
         """
         Scan and return the first path to a binary that we can find
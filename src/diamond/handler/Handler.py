@@ -4,8 +4,17 @@ import logging
 import threading
 import traceback
 from configobj import ConfigObj
+from collections import deque
 import time
 
+from diamond.collector import str_to_bool
+from diamond.error import DiamondException
+from diamond.metricfilter import MetricFilter
+
+# What to do with a new metric when the send queue of an asynchronous
+# handler is full
+QUEUE_OVERFLOW_POLICIES = ['drop_oldest', 'drop_newest', 'block']
+
 
 class Handler(object):
     """
@@ -38,6 +47,37 @@ class Handler(object):
         # Initialize Lock
         self.lock = threading.Lock()
 
+        # Whitelist/blacklist of metric paths sent by this handler
+        if self.config['metrics_whitelist'] and \
+                self.config['metrics_blacklist']:
+            raise DiamondException(
+                'Both metrics_whitelist and metrics_blacklist specified ' +
+                'for %s' % self.__class__.__name__)
+        if self.config['metrics_whitelist'] or \
+                self.config['metrics_blacklist']:
+            self._metric_filter = MetricFilter(
+                self.config['metrics_whitelist'],
+                self.config['metrics_blacklist'])
+        else:
+            self._metric_filter = None
+
+        # Asynchronous dispatch: metrics are queued and sent by a writer
+        # thread so a slow backend doesn't stall the collector threads
+        self.async_dispatch = str_to_bool(self.config['async'])
+        self.queue_size = self._positive_option('queue_size')
+        self.queue_batch = self._positive_option('queue_batch')
+        self.queue_overflow = self.config['queue_overflow'].lower().strip()
+        if self.queue_overflow not in QUEUE_OVERFLOW_POLICIES:
+            raise ValueError("Invalid queue_overflow policy: %s"
+                             % self.queue_overflow)
+        self.queue_dropped = 0
+        self._queue = deque()
+        self._queue_cond = threading.Condition(threading.Lock())
+        self._flush_pending = False
+        self._writer = None
+        if self.async_dispatch:
+            self._start_writer()
+
     def get_default_config_help(self):
         """
         Returns the help text for the configuration options for this handler
@@ -46,6 +86,18 @@ class Handler(object):
             'get_default_config_help': 'get_default_config_help',
             'server_error_interval': ('How frequently to send repeated server '
                                       'errors'),
+            'async': ('Queue metrics and send them from a dedicated writer '
+                      'thread instead of the collector thread'),
+            'queue_size': 'Maximum number of metrics waiting in the queue',
+            'queue_batch': 'Maximum number of metrics sent per writer pass',
+            'queue_overflow': ('What to do when the queue is full: '
+                               'drop_oldest, drop_newest or block'),
+            'metrics_whitelist': ('Regex (or list of regexes) to match the '
+                                  'paths of metrics to send. Mutually '
+                                  'exclusive with metrics_blacklist'),
+            'metrics_blacklist': ('Regex (or list of regexes) to match the '
+                                  'paths of metrics to drop. Mutually '
+                                  'exclusive with metrics_whitelist'),
         }
 
     def get_default_config(self):
@@ -55,6 +107,12 @@ class Handler(object):
         return {
             'get_default_config': 'get_default_config',
             'server_error_interval': 120,
+            'async': False,
+            'queue_size': 10000,
+            'queue_batch': 500,
+            'queue_overflow': 'drop_oldest',
+            'metrics_whitelist': None,
+            'metrics_blacklist': None,
         }
 
     def _process(self, metric):
@@ -63,6 +121,12 @@ class Handler(object):
         """
         if not self.enabled:
             return
+        if (self._metric_filter is not None
+                and not self._metric_filter.allows(metric.path)):
+            return
+        if self.async_dispatch:
+            self._enqueue([metric])
+            return
         try:
             try:
                 self.lock.acquire()
@@ -81,12 +145,59 @@ class Handler(object):
         """
         raise NotImplementedError
 
+    def _process_batch(self, metrics):
+        """
+        Decorator for processing a list of metrics with a lock, catching
+        exceptions
+        """
+        if not self.enabled:
+            return
+        if self._metric_filter is not None:
+            allows = self._metric_filter.allows
+            metrics = [metric for metric in metrics if allows(metric.path)]
+            if not metrics:
+                return
+        if self.async_dispatch:
+            self._enqueue(metrics)
+            return
+        try:
+            try:
+                self.lock.acquire()
+                self.process_batch(metrics)
+            except Exception:
+                self.log.error(traceback.format_exc())
+        finally:
+            if self.lock.locked():
+                self.lock.release()
+
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics
+
+        Optional: Should be overridden in subclasses able to handle several
+        metrics at once. The default processes them one at a time.
+        """
+        for metric in metrics:
+            try:
+                self.process(metric)
+            except Exception:
+                self.log.error(traceback.format_exc())
+
     def _flush(self):
         """
         Decorator for flushing handlers with an lock, catching exceptions
         """
         if not self.enabled:
             return
+        if self.async_dispatch:
+            # Let the writer thread flush after its current batch
+            self._queue_cond.acquire()
+            try:
+                self._flush_pending = True
+                self._queue_cond.notifyAll()
+            finally:
+                self._queue_cond.release()
+            return
         try:
             try:
                 self.lock.acquire()
@@ -105,6 +216,139 @@ class Handler(object):
         """
         pass
 
+    def reload_config(self, config):
+        """
+        Called with the handler config when diamond reloads its config
+
+        Optional: Should be overridden in subclasses able to apply a new
+        config while running
+        """
+        pass
+
+    def close_inherited(self):
+        """
+        Called in a forked worker process, which doesn't use the handler,
+        to close the connections it inherited from the main process. Their
+        peers are not told, the main process keeps using them.
+
+        Optional: Should be overridden in subclasses holding connections
+        """
+        pass
+
+    def get_stats(self):
+        """
+        Return a dict of internal counters describing the state of this
+        handler, published by the SelfStatsCollector
+
+        Optional: Can be extended in subclasses
+        """
+        stats = {}
+        if self.async_dispatch:
+            self._queue_cond.acquire()
+            try:
+                stats['queue_depth'] = len(self._queue)
+                stats['queue_dropped'] = self.queue_dropped
+                # Age in seconds of the oldest metric waiting to be sent
+                if self._queue:
+                    stats['queue_lag'] = max(
+                        0, int(time.time()) - self._queue[0].timestamp)
+                else:
+                    stats['queue_lag'] = 0
+            finally:
+                self._queue_cond.release()
+        return stats
+
+    def _positive_option(self, name):
+        """
+        Return the value of an option that must be a positive integer, the
+        default one if it is not
+        """
+        value = int(self.config[name])
+        if value < 1:
+            default = int(self.get_default_config()[name])
+            self.log.error("%s: %s must be at least 1, not %d. Using %d.",
+                           self.__class__.__name__, name, value, default)
+            value = default
+        return value
+
+    def _start_writer(self):
+        """
+        Start the thread draining the send queue
+        """
+        self._writer = threading.Thread(
+            target=self._writer_loop,
+            name='%s-writer' % self.__class__.__name__)
+        self._writer.setDaemon(True)
+        self._writer.start()
+
+    def _enqueue(self, metrics):
+        """
+        Add metrics to the send queue, applying the overflow policy when
+        the queue is full
+        """
+        self._queue_cond.acquire()
+        try:
+            for metric in metrics:
+                if len(self._queue) >= self.queue_size:
+                    if self.queue_overflow == 'drop_newest':
+                        self.queue_dropped += 1
+                        continue
+                    elif self.queue_overflow == 'drop_oldest':
+                        self._queue.popleft()
+                        self.queue_dropped += 1
+                    else:
+                        self._queue_cond.notifyAll()
+                        while len(self._queue) >= self.queue_size:
+                            self._queue_cond.wait()
+                self._queue.append(metric)
+            self._queue_cond.notifyAll()
+        finally:
+            self._queue_cond.release()
+
+    def _dequeue(self):
+        """
+        Wait for queued metrics and return a batch of them, along with
+        whether a flush should follow once the batch has been processed
+        """
+        self._queue_cond.acquire()
+        try:
+            while not self._queue and not self._flush_pending:
+                self._queue_cond.wait()
+            batch = []
+            while self._queue and len(batch) < self.queue_batch:
+                batch.append(self._queue.popleft())
+            # Even with more metrics queued, which would put the flush off
+            # for as long as metrics keep coming
+            flush = self._flush_pending
+            self._flush_pending = False
+            # Wake up producers blocked on a full queue
+            self._queue_cond.notifyAll()
+            return batch, flush
+        finally:
+            self._queue_cond.release()
+
+    def _writer_loop(self):
+        """
+        Drain the send queue in batches, holding the handler lock while
+        processing each batch
+        """
+        while True:
+            batch, flush = self._dequeue()
+            self.lock.acquire()
+            try:
+                if batch:
+                    try:
+                        self.process_batch(batch)
+                    except Exception:
+                        self.log.error(traceback.format_exc())
+                if flush:
+                    try:
+                        self.flush()
+                    except Exception:
+                        self.log.error(traceback.format_exc())
+            finally:
+                self.lock.release()
+
     def _throttle_error(self, msg, *args, **kwargs):
         """
         Avoids sending errors repeatedly. Waits at least
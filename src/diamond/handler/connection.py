@@ -0,0 +1,215 @@
+# coding=utf-8
+
+"""
+Socket connection shared by the handlers talking to a TCP or UDP backend.
+
+Connecting never blocks the calling (collector) thread: the connection is
+started in non-blocking mode and its progress checked on the next call.
+Host name lookups are cached for `dns_ttl` seconds, and failed attempts are
+retried with an exponential backoff with jitter.
+"""
+
+import errno
+import logging
+import random
+import select
+import socket
+import time
+
+# connect_ex results meaning the connection is in progress
+CONNECT_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+
+class Connection(object):
+    """
+    Non-blocking, reconnecting socket connection to host:port
+    """
+
+    def __init__(self, host, port, proto='tcp', timeout=15, keepalive=False,
+                 keepaliveinterval=10, flow_info=0, scope_id=0, dns_ttl=300,
+                 backoff=1, max_backoff=300, name='Handler', error=None):
+        """
+        Create a new Connection. `proto` is one of udp, udp4, udp6, tcp,
+        tcp4 or tcp6. Failures are reported through the `error` callable,
+        Logger.error by default.
+        """
+        self.log = logging.getLogger('diamond')
+        self.host = host
+        self.port = port
+        self.proto = proto
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.keepaliveinterval = keepaliveinterval
+        self.flow_info = flow_info
+        self.scope_id = scope_id
+        self.dns_ttl = dns_ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self.error = error or self.log.error
+
+        self.socket = None
+        self.connected = False
+        self.failures = 0
+        self._connect_started = 0
+        self._next_attempt = 0
+        self._address = None
+        self._resolved = 0
+
+    def resolve(self):
+        """
+        Return the (family, socktype, sockaddr) to connect to, looking the
+        host up again once the cached answer is older than dns_ttl
+        """
+        now = time.time()
+        if self._address is not None and now - self._resolved < self.dns_ttl:
+            return self._address
+
+        if self.proto.startswith('udp'):
+            socktype = socket.SOCK_DGRAM
+        else:
+            socktype = socket.SOCK_STREAM
+
+        if self.proto[-1] == '4':
+            family = socket.AF_INET
+        elif self.proto[-1] == '6':
+            family = socket.AF_INET6
+        else:
+            family = socket.AF_UNSPEC
+
+        addrinfo = socket.getaddrinfo(self.host, self.port, family, socktype)
+        family, socktype, proto, canonname, sockaddr = addrinfo[0]
+        if family == socket.AF_INET6:
+            sockaddr = sockaddr[:2] + (self.flow_info, self.scope_id)
+
+        self._address = (family, socktype, sockaddr)
+        self._resolved = now
+        return self._address
+
+    def connect(self):
+        """
+        Start connecting, or check on a connection in progress. Returns the
+        socket once connected, None otherwise.
+        """
+        if self.connected:
+            return self.socket
+
+        if self.socket is None:
+            if time.time() < self._next_attempt:
+                return None
+
+            try:
+                family, socktype, sockaddr = self.resolve()
+            except socket.gaierror, ex:
+                self._failed("Error looking up host '%s' - %s"
+                             % (self.host, ex))
+                return None
+
+            try:
+                sock = socket.socket(family, socktype)
+                if socktype == socket.SOCK_STREAM and self.keepalive:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                                    self.keepaliveinterval)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                                    self.keepaliveinterval)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+                sock.setblocking(0)
+                err = sock.connect_ex(sockaddr)
+            except socket.error, ex:
+                self._failed("Failed to connect to %s:%i. %s."
+                             % (self.host, self.port, ex))
+                return None
+
+            self.socket = sock
+            self._connect_started = time.time()
+            if err not in (0,) + CONNECT_IN_PROGRESS:
+                self._failed("Failed to connect to %s:%i. %s."
+                             % (self.host, self.port, errno.errorcode.get(
+                                 err, err)))
+                return None
+
+        return self._check_connect()
+
+    def _check_connect(self):
+        """
+        Check whether the connection in progress is established
+        """
+        try:
+            w = self._poll_out()
+        except (select.error, socket.error), ex:
+            self._failed("Failed to connect to %s:%i. %s."
+                         % (self.host, self.port, ex))
+            return None
+
+        if not w:
+            if time.time() - self._connect_started > self.timeout:
+                self._failed("Timed out connecting to %s:%i."
+                             % (self.host, self.port))
+            return None
+
+        err = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._failed("Failed to connect to %s:%i. %s."
+                         % (self.host, self.port,
+                            errno.errorcode.get(err, err)))
+            return None
+
+        # Writes are only done once poll says they won't block, the
+        # timeout only bounds large writes
+        self.socket.settimeout(self.timeout)
+        self.connected = True
+        self.failures = 0
+        self.log.debug("%s: Established connection to %s:%d.",
+                       self.name, self.host, self.port)
+        return self.socket
+
+    def writable(self):
+        """
+        Return True if the connection is established and data can be
+        written to it without blocking
+        """
+        if not self.connected:
+            return False
+        try:
+            return self._poll_out()
+        except (select.error, socket.error):
+            return False
+
+    def _poll_out(self):
+        """
+        Return True if the socket can be written to without blocking, or
+        has an error. poll() rather than select(), whose fds must be below
+        1024.
+        """
+        poller = select.poll()
+        poller.register(self.socket, select.POLLOUT)
+        return bool(poller.poll(0))
+
+    def _failed(self, reason):
+        """
+        Close the socket and wait before the next attempt, exponentially
+        longer after each consecutive failure
+        """
+        self.close()
+        self.failures += 1
+        delay = min(self.max_backoff,
+                    self.backoff * 2 ** min(self.failures - 1, 32))
+        # Jitter, so many hosts don't all reconnect at once
+        delay = delay / 2.0 + random.uniform(0, delay / 2.0)
+        self._next_attempt = time.time() + delay
+        # The address may have changed
+        self._address = None
+        self.error("%s: %s Retrying in %.1fs.", self.name, reason, delay)
+
+    def close(self):
+        """
+        Close the socket
+        """
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except socket.error:
+                pass
+        self.socket = None
+        self.connected = False
@@ -17,7 +17,9 @@ use it.
 """
 
 from Handler import Handler
-import socket
+from connection import Connection
+from spool import Spool
+import time
 
 
 class GraphiteHandler(Handler):
@@ -50,6 +52,27 @@ class GraphiteHandler(Handler):
         self.flow_info = self.config['flow_info']
         self.scope_id = self.config['scope_id']
         self.metrics = []
+        self.connection = Connection(
+            self.host, self.port, proto=self.proto, timeout=self.timeout,
+            keepalive=self.keepalive,
+            keepaliveinterval=self.keepaliveinterval,
+            flow_info=int(self.flow_info), scope_id=int(self.scope_id),
+            dns_ttl=int(self.config['dns_ttl']),
+            backoff=float(self.config['reconnect_backoff']),
+            max_backoff=float(self.config['reconnect_max_backoff']),
+            name=self.__class__.__name__, error=self._throttle_error)
+
+        # Spool data that can't be sent to disk, and replay it later
+        self.spool = None
+        if self.config['spool_dir']:
+            self.spool = Spool(self.config['spool_dir'],
+                               int(self.config['spool_max_size']),
+                               int(self.config['spool_segment_size']),
+                               self.config['spool_fsync'])
+        self.spool_replay_rate = int(self.config['spool_replay_rate'])
+        self.spool_replayed = 0
+        self._replay_allowance = 0
+        self._replay_time = time.time()
 
         # Connect
         self._connect()
@@ -72,6 +95,21 @@ class GraphiteHandler(Handler):
             'keepaliveinterval': 'How frequently to send keepalives',
             'flow_info': 'IPv6 Flow Info',
             'scope_id': 'IPv6 Scope ID',
+            'dns_ttl': 'How long to cache the address of the host (seconds)',
+            'reconnect_backoff': ('Delay before reconnecting after a failed '
+                                  'attempt, doubled after each failure '
+                                  '(seconds)'),
+            'reconnect_max_backoff': ('Maximum delay between reconnection '
+                                      'attempts (seconds)'),
+            'spool_dir': ('Directory where data that can not be sent is '
+                          'spooled, instead of keeping a backlog in memory. '
+                          'Empty to disable'),
+            'spool_max_size': 'Maximum size of the spool, in bytes',
+            'spool_segment_size': 'Size of the spool files, in bytes',
+            'spool_fsync': ('When to fsync the spool: never, segment (when '
+                            'a spool file is complete) or always'),
+            'spool_replay_rate': ('Maximum number of bytes replayed from the '
+                                  'spool per second'),
         })
 
         return config
@@ -94,6 +132,14 @@ class GraphiteHandler(Handler):
             'keepaliveinterval': 10,
             'flow_info': 0,
             'scope_id': 0,
+            'dns_ttl': 300,
+            'reconnect_backoff': 1,
+            'reconnect_max_backoff': 300,
+            'spool_dir': '',
+            'spool_max_size': 104857600,
+            'spool_segment_size': 1048576,
+            'spool_fsync': 'segment',
+            'spool_replay_rate': 1048576,
         })
 
         return config
@@ -103,6 +149,8 @@ class GraphiteHandler(Handler):
         Destroy instance of the GraphiteHandler class
         """
         self._close()
+        if self.spool is not None:
+            self.spool.close()
 
     def process(self, metric):
         """
@@ -113,27 +161,108 @@ class GraphiteHandler(Handler):
         if len(self.metrics) >= self.batch_size:
             self._send()
 
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics, sending them to graphite at once
+        """
+        self.metrics.extend([str(metric) for metric in metrics])
+        if len(self.metrics) >= self.batch_size:
+            self._send()
+
     def flush(self):
         """Flush metrics in queue"""
         self._send()
 
+    def get_stats(self):
+        stats = super(GraphiteHandler, self).get_stats()
+        if self.spool is not None:
+            stats['spool_size'] = self.spool.size
+            stats['spool_replayed'] = self.spool_replayed
+            stats['spool_dropped'] = self.spool.dropped
+        return stats
+
     def _send_data(self, data):
         """
-        Try to send all data in buffer.
+        Try to send all data in buffer, if the socket is writable.
+        Returns False if the data could not be sent.
         """
+        if not self.connection.writable():
+            return False
         try:
             self.socket.sendall(data)
             self._reset_errors()
         except:
             self._close()
             self._throttle_error("GraphiteHandler: Socket error, "
-                                 "trying reconnect.")
-            self._connect()
-            try:
-                self.socket.sendall(data)
-            except:
-                return
-            self._reset_errors()
+                                 "will reconnect.")
+            return False
+        return True
+
+    def _get_data(self):
+        """
+        Return the buffered data, ready to be sent
+        """
+        return ''.join(self.metrics)
+
+    def _has_data(self):
+        """
+        Whether there is buffered data to send
+        """
+        return bool(self.metrics)
+
+    def _clear_data(self):
+        """
+        Empty the buffer once its data has been sent or spooled
+        """
+        self.metrics = []
+
+    def _trim_backlog(self):
+        """
+        Drop the oldest buffered metrics once the backlog is too large
+        """
+        if len(self.metrics) >= (
+                self.batch_size * self.max_backlog_multiplier):
+            trim_offset = (self.batch_size
+                           * self.trim_backlog_multiplier * -1)
+            self.log.warn('GraphiteHandler: Trimming backlog. Removing'
+                          + ' oldest %d and keeping newest %d metrics',
+                          len(self.metrics) - abs(trim_offset),
+                          abs(trim_offset))
+            self.metrics = self.metrics[trim_offset:]
+
+    def _spool(self):
+        """
+        Move the metrics that could not be sent to the spool
+        """
+        if self._has_data():
+            self.spool.append(self._get_data())
+            self._clear_data()
+
+    def _replay_spool(self):
+        """
+        Send spooled data, without exceeding spool_replay_rate
+        """
+        now = time.time()
+        self._replay_allowance = min(
+            self.spool_replay_rate,
+            self._replay_allowance
+            + (now - self._replay_time) * self.spool_replay_rate)
+        self._replay_time = now
+
+        replayed = 0
+        while self._replay_allowance > 0:
+            data = self.spool.peek()
+            if data is None:
+                break
+            if self._send_data(data) is False:
+                break
+            self.spool.pop(data)
+            self._replay_allowance -= len(data)
+            replayed += len(data)
+
+        if replayed:
+            self.spool_replayed += replayed
+            self.spool.save_cursor()
 
     def _send(self):
         """
@@ -150,94 +279,41 @@ class GraphiteHandler(Handler):
                     self.log.debug("GraphiteHandler: Reconnect failed.")
                 else:
                     # Send data to socket
-                    self._send_data(''.join(self.metrics))
-                    self.metrics = []
+                    sent = self._send_data(self._get_data())
+                    if sent is not False:
+                        self._clear_data()
+                    elif self.spool is not None:
+                        self._spool()
+                    # Otherwise keep the metrics as backlog
+                    if sent is not False and self.spool is not None:
+                        self._replay_spool()
             except Exception:
                 self._close()
                 self._throttle_error("GraphiteHandler: Error sending metrics.")
                 raise
         finally:
-            if len(self.metrics) >= (
-                    self.batch_size * self.max_backlog_multiplier):
-                trim_offset = (self.batch_size
-                               * self.trim_backlog_multiplier * -1)
-                self.log.warn('GraphiteHandler: Trimming backlog. Removing'
-                              + ' oldest %d and keeping newest %d metrics',
-                              len(self.metrics) - abs(trim_offset),
-                              abs(trim_offset))
-                self.metrics = self.metrics[trim_offset:]
+            if self.spool is not None and self._has_data():
+                self._spool()
+            else:
+                self._trim_backlog()
+
+    def close_inherited(self):
+        """
+        Close the socket inherited by a forked process
+        """
+        self.connection.close()
+        self.socket = None
 
     def _connect(self):
         """
-        Connect to the graphite server
-        """
-        if (self.proto == 'udp'):
-            stream = socket.SOCK_DGRAM
-        else:
-            stream = socket.SOCK_STREAM
-
-        if (self.proto[-1] == '4'):
-            family = socket.AF_INET
-            connection_struct = (self.host, self.port)
-        elif (self.proto[-1] == '6'):
-            family = socket.AF_INET6
-            connection_struct = (self.host, self.port,
-                                 self.flow_info, self.scope_id)
-        else:
-            connection_struct = (self.host, self.port)
-            try:
-                addrinfo = socket.getaddrinfo(self.host, self.port, 0, stream)
-            except socket.gaierror, ex:
-                self.log.error("GraphiteHandler: Error looking up graphite host"
-                               " '%s' - %s",
-                               self.host, ex)
-                return
-            if (len(addrinfo) > 0):
-                family = addrinfo[0][0]
-                if (family == socket.AF_INET6):
-                    connection_struct = (self.host, self.port,
-                                         self.flow_info, self.scope_id)
-            else:
-                family = socket.AF_INET
-
-        # Create socket
-        self.socket = socket.socket(family, stream)
-        if self.socket is None:
-            # Log Error
-            self.log.error("GraphiteHandler: Unable to create socket.")
-            # Close Socket
-            self._close()
-            return
-        # Enable keepalives?
-        if self.proto != 'udp' and self.keepalive:
-            self.log.error("GraphiteHandler: Setting socket keepalives...")
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
-                                   self.keepaliveinterval)
-            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
-                                   self.keepaliveinterval)
-            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
-        # Set socket timeout
-        self.socket.settimeout(self.timeout)
-        # Connect to graphite server
-        try:
-            self.socket.connect(connection_struct)
-            # Log
-            self.log.debug("GraphiteHandler: Established connection to "
-                           "graphite server %s:%d.",
-                           self.host, self.port)
-        except Exception, ex:
-            # Log Error
-            self._throttle_error("GraphiteHandler: Failed to connect to "
-                                 "%s:%i. %s.", self.host, self.port, ex)
-            # Close Socket
-            self._close()
-            return
+        Connect to the graphite server. This doesn't block: the socket is
+        only set once the connection is established.
+        """
+        self.socket = self.connection.connect()
 
     def _close(self):
         """
         Close the socket
         """
-        if self.socket is not None:
-            self.socket.close()
+        self.connection.close()
         self.socket = None
@@ -22,6 +22,7 @@ use it.
 """
 
 import struct
+from collections import deque
 
 from graphite import GraphiteHandler
 
@@ -31,6 +32,12 @@ try:
 except ImportError:
     import pickle as pickle
 
+# Frame header: length of the pickled batch, big endian
+HEADER = struct.Struct("!L")
+
+# Estimated size of a pickled metric, on top of its path
+METRIC_OVERHEAD = 32
+
 
 class GraphitePickleHandler(GraphiteHandler):
     """
@@ -45,8 +52,13 @@ class GraphitePickleHandler(GraphiteHandler):
         GraphiteHandler.__init__(self, config)
         # Initialize Data
         self.batch = []
+        self._batch_bytes = 0
+        # Framed batches waiting to be sent, and the size of each frame
+        self.buffer = bytearray()
+        self._frames = deque()
         # Initialize Options
         self.batch_size = int(self.config['batch'])
+        self.batch_max_bytes = int(self.config['batch_max_bytes'])
 
     def get_default_config_help(self):
         """
@@ -55,6 +67,8 @@ class GraphitePickleHandler(GraphiteHandler):
         config = super(GraphitePickleHandler, self).get_default_config_help()
 
         config.update({
+            'batch_max_bytes': ('Maximum size of a pickled batch, in bytes. '
+                                'carbon refuses batches over 1MB'),
         })
 
         return config
@@ -66,6 +80,7 @@ class GraphitePickleHandler(GraphiteHandler):
         config = super(GraphitePickleHandler, self).get_default_config()
 
         config.update({
+            'batch_max_bytes': 1048576,
         })
 
         return config
@@ -75,31 +90,83 @@ class GraphitePickleHandler(GraphiteHandler):
         m = (metric.path, (metric.timestamp, metric.value))
         # Add the metric to the match
         self.batch.append(m)
+        self._batch_bytes += len(metric.path) + METRIC_OVERHEAD
         # If there are sufficient metrics, then pickle and send
-        if len(self.batch) >= self.batch_size:
+        self._send_batch()
+
+    def process_batch(self, metrics):
+        for metric in metrics:
+            self.batch.append((metric.path, (metric.timestamp, metric.value)))
+            self._batch_bytes += len(metric.path) + METRIC_OVERHEAD
+            if self._batch_full():
+                self._frame_batch()
+        # If there are sufficient metrics, then pickle and send
+        self._send_batch()
+
+    def flush(self):
+        """Pickle the pending metrics and send everything"""
+        if self.batch:
+            self._frame_batch()
+        self._send()
+
+    def _send_batch(self):
+        """
+        Pickle and send the batch once it holds enough metrics, or bytes
+        """
+        if self._batch_full():
             # Log
             self.log.debug("GraphitePickleHandler: Sending batch size: %d",
-                           self.batch_size)
-            # Pickle the batch of metrics
-            self.metrics = [self._pickle_batch()]
-            # Send pickled batch
+                           len(self.batch))
+            self._frame_batch()
+        if self._frames:
             self._send()
-            # Flush the metric pack down the wire
-            self.flush()
-            # Clear Batch
-            self.batch = []
 
-    def _pickle_batch(self):
+    def _batch_full(self):
+        return (len(self.batch) >= self.batch_size
+                or self._batch_bytes >= self.batch_max_bytes)
+
+    def _frame_batch(self):
         """
-        Pickle the metrics into a form that can be understood
-        by the graphite pickle connector.
+        Pickle the batch into a frame understood by the graphite pickle
+        connector, appended to the send buffer
         """
-        # Pickle
-        payload = pickle.dumps(self.batch)
+        self._frame(self.batch)
+        self.batch = []
+        self._batch_bytes = 0
+
+    def _frame(self, batch):
+        payload = pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.batch_max_bytes and len(batch) > 1:
+            # The size estimate was too low, split the batch
+            middle = len(batch) // 2
+            self._frame(batch[:middle])
+            self._frame(batch[middle:])
+            return
+
+        self.buffer.extend(HEADER.pack(len(payload)))
+        self.buffer.extend(payload)
+        self._frames.append(HEADER.size + len(payload))
+
+    def _get_data(self):
+        return self.buffer
 
-        # Pack Message
-        header = struct.pack("!L", len(payload))
-        message = header + payload
+    def _has_data(self):
+        return bool(self._frames)
 
-        # Return Message
-        return message
+    def _clear_data(self):
+        del self.buffer[:]
+        self._frames.clear()
+
+    def _trim_backlog(self):
+        """
+        Drop the oldest frames once the backlog is too large
+        """
+        if len(self._frames) >= self.max_backlog_multiplier:
+            keep = self.trim_backlog_multiplier
+            trimmed = 0
+            while len(self._frames) > keep:
+                trimmed += self._frames.popleft()
+            self.log.warn('GraphitePickleHandler: Trimming backlog. Removing'
+                          + ' oldest %d bytes and keeping newest %d batches',
+                          trimmed, keep)
+            del self.buffer[:trimmed]
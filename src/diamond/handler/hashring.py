@@ -0,0 +1,73 @@
+# coding=utf-8
+
+"""
+Consistent hash ring compatible with the one carbon-relay uses to pick the
+carbon-cache a metric belongs to (RELAY_METHOD = consistent-hashing), so
+metrics can be sent straight to the caches.
+"""
+
+import bisect
+from hashlib import md5
+
+from diamond.error import DiamondException
+
+
+def parse_destination(destination):
+    """
+    Parse a carbon destination string, host:port[:instance], IPv6 hosts
+    being enclosed in brackets. Returns a (host, port, instance) tuple,
+    instance being None when not given.
+    """
+    destination = destination.strip()
+    try:
+        if destination.startswith('['):
+            host, rest = destination[1:].split(']:', 1)
+            parts = [host] + rest.split(':')
+        else:
+            parts = destination.split(':')
+        if len(parts) == 2:
+            return parts[0], int(parts[1]), None
+        elif len(parts) == 3:
+            return parts[0], int(parts[1]), parts[2]
+    except ValueError:
+        pass
+    raise DiamondException("Invalid carbon destination: %s" % destination)
+
+
+class ConsistentHashRing(object):
+    """
+    carbon's ConsistentHashRing: each node is placed replica_count times on
+    a ring of 2^16 positions, and a key belongs to the first node found
+    clockwise from the position of its hash.
+
+    Nodes are (host, instance) tuples, added in the order of the relay's
+    DESTINATIONS for positions to be resolved the same way on collisions.
+    """
+
+    def __init__(self, nodes, replica_count=100):
+        self.ring = []
+        self.nodes = set()
+        self.replica_count = replica_count
+        self._positions = set()
+        for node in nodes:
+            self.add_node(node)
+
+    def compute_ring_position(self, key):
+        return int(md5(str(key)).hexdigest()[:4], 16)
+
+    def add_node(self, node):
+        self.nodes.add(node)
+        for i in xrange(self.replica_count):
+            position = self.compute_ring_position("%s:%d" % (node, i))
+            while position in self._positions:
+                position += 1
+            self._positions.add(position)
+            bisect.insort(self.ring, (position, node))
+
+    def get_node(self, key):
+        if not self.ring:
+            raise DiamondException("The hash ring is empty")
+        position = self.compute_ring_position(key)
+        index = bisect.bisect_left(self.ring, (position, None)) % len(
+            self.ring)
+        return self.ring[index][1]
@@ -134,7 +134,12 @@ class InfluxdbHandler(Handler):
         self._close()
 
     def process(self, metric):
-        if self.batch_count <= self.metric_max_cache:
+        self.process_batch([metric])
+
+    def process_batch(self, metrics):
+        for metric in metrics:
+            if self.batch_count > self.metric_max_cache:
+                break
             # Add the data to the batch
             self.batch.setdefault(metric.path, []).append([metric.timestamp,
                                                            metric.value])
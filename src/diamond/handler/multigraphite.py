@@ -6,10 +6,14 @@ interface. Unlike GraphiteHandler, this one supports multiple graphite servers.
 Specify them as a list of hosts divided by comma.
 """
 
+import os
+
 from Handler import Handler
 from graphite import GraphiteHandler
 from copy import deepcopy
 
+from diamond.collector import str_to_bool
+
 
 class MultiGraphiteHandler(Handler):
     """
@@ -26,11 +30,22 @@ class MultiGraphiteHandler(Handler):
 
         self.handlers = []
 
+        # In parallel mode every destination gets its own send queue and
+        # writer thread, so a slow or dead server doesn't hold up the others
+        self.parallel = str_to_bool(self.config['parallel'])
+
         # Initialize Options
         hosts = self.config['host']
         for host in hosts:
             config = deepcopy(self.config)
             config['host'] = host
+            if self.parallel:
+                config['async'] = True
+            # Each server spools what it missed on its own
+            if self.config.get('spool_dir'):
+                config['spool_dir'] = os.path.join(
+                    self.config['spool_dir'],
+                    '%s_%s' % (host.replace('.', '_'), self.config['port']))
             self.handlers.append(GraphiteHandler(config))
 
     def get_default_config_help(self):
@@ -47,6 +62,8 @@ class MultiGraphiteHandler(Handler):
             'batch': 'How many to store before sending to the graphite server',
             'max_backlog_multiplier': 'how many batches to store before trimming',  # NOQA
             'trim_backlog_multiplier': 'Trim down how many batches',
+            'parallel': ('Send to each server from its own writer thread and '
+                         'queue (see queue_size and queue_overflow)'),
         })
 
         return config
@@ -65,6 +82,7 @@ class MultiGraphiteHandler(Handler):
             'batch': 1,
             'max_backlog_multiplier': 5,
             'trim_backlog_multiplier': 4,
+            'parallel': False,
         })
 
         return config
@@ -74,10 +92,53 @@ class MultiGraphiteHandler(Handler):
         Process a metric by passing it to GraphiteHandler
         instances
         """
+        if self.parallel:
+            # Format the line once, the destinations share the cached copy
+            str(metric)
+            for handler in self.handlers:
+                handler._process(metric)
+            return
         for handler in self.handlers:
             handler.process(metric)
 
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics by passing it to GraphiteHandler
+        instances
+        """
+        if self.parallel:
+            for metric in metrics:
+                str(metric)
+            for handler in self.handlers:
+                handler._process_batch(metrics)
+            return
+        for handler in self.handlers:
+            handler.process_batch(metrics)
+
     def flush(self):
         """Flush metrics in queue"""
         for handler in self.handlers:
-            handler.flush()
+            if self.parallel:
+                handler._flush()
+            else:
+                handler.flush()
+
+    def close_inherited(self):
+        """
+        Close the sockets inherited by a forked process
+        """
+        for handler in self.handlers:
+            handler.close_inherited()
+
+    def get_stats(self):
+        """
+        Return the counters of each destination, prefixed with its
+        host_port. In parallel mode these include the send queue depth and
+        lag of each server.
+        """
+        stats = super(MultiGraphiteHandler, self).get_stats()
+        for handler in self.handlers:
+            name = '%s_%s' % (handler.host.replace('.', '_'), handler.port)
+            for key, value in handler.get_stats().items():
+                stats['%s.%s' % (name, key)] = value
+        return stats
@@ -0,0 +1,300 @@
+# coding=utf-8
+
+"""
+Send metrics directly to several carbon-cache instances, sharding them with
+the same consistent hash ring as carbon-relay, so the relay tier can be
+bypassed. List the caches in `destinations` exactly as in the relay's
+DESTINATIONS setting (host:port:instance, in the same order), with the
+pickle (or plaintext, see `pickle`) port of each cache.
+
+Each destination has its own batch buffer and GraphitePickleHandler (or
+GraphiteHandler). When the destinations change on config reload, the ring
+is rebuilt and buffered metrics are routed to their new destination;
+removed destinations are kept until their backlog has been sent.
+
+- enable it in `diamond.conf` :
+
+`    handlers = diamond.handler.shardedgraphite.ShardedGraphiteHandler
+`
+
+"""
+
+import os
+import traceback
+from copy import deepcopy
+
+from configobj import ConfigObj
+
+from Handler import Handler
+from graphite import GraphiteHandler
+from graphitepickle import GraphitePickleHandler
+from hashring import ConsistentHashRing, parse_destination
+from diamond.collector import str_to_bool
+from diamond.error import DiamondException
+
+# Maximum number of metric paths whose destination is remembered
+ROUTE_CACHE_SIZE = 10000
+
+
+class ShardedGraphiteHandler(Handler):
+    """
+    Implements the abstract Handler class, sharding metrics across carbon
+    caches by consistent hashing of their path
+    """
+
+    def __init__(self, config=None):
+        """
+        Create a new instance of the ShardedGraphiteHandler class
+        """
+        # Initialize Handler
+        Handler.__init__(self, config)
+
+        # Initialize Options
+        self.batch_size = int(self.config['batch'])
+        self.pickle = str_to_bool(self.config['pickle'])
+
+        # Initialize Data
+        self.destinations = []
+        self.shards = {}
+        self.buffers = {}
+        self.retired = []
+        self.ring = None
+        self._nodes = {}
+        self._routes = {}
+
+        self._set_destinations(self.config['destinations'])
+
+    def get_default_config_help(self):
+        """
+        Returns the help text for the configuration options for this handler
+        """
+        config = super(ShardedGraphiteHandler, self).get_default_config_help()
+
+        config.update({
+            'destinations': ('carbon-cache instances, as host:port:instance, '
+                             'in the order of the DESTINATIONS of the relay'),
+            'pickle': ('Send using the pickle protocol, or plaintext if '
+                       'False'),
+            'proto': 'udp, udp4, udp6, tcp, tcp4, or tcp6',
+            'timeout': '',
+            'batch': 'How many to store per destination before sending',
+            'max_backlog_multiplier': 'how many batches to store before trimming',  # NOQA
+            'trim_backlog_multiplier': 'Trim down how many batches',
+            'spool_dir': ('Directory where data that can not be sent is '
+                          'spooled, in a subdirectory per destination. '
+                          'Empty to disable'),
+        })
+
+        return config
+
+    def get_default_config(self):
+        """
+        Return the default config for the handler
+        """
+        config = super(ShardedGraphiteHandler, self).get_default_config()
+
+        config.update({
+            'destinations': ['localhost:2004'],
+            'pickle': True,
+            'proto': 'tcp',
+            'timeout': 15,
+            'batch': 1,
+            'max_backlog_multiplier': 5,
+            'trim_backlog_multiplier': 4,
+            'spool_dir': '',
+        })
+
+        return config
+
+    def reload_config(self, config):
+        """
+        Rebuild the hash ring if the destinations changed, keeping the
+        buffered metrics
+        """
+        new_config = ConfigObj()
+        new_config.merge(self.get_default_config())
+        new_config.merge(config)
+
+        self.lock.acquire()
+        try:
+            self._set_destinations(new_config['destinations'])
+            self.config['destinations'] = new_config['destinations']
+        finally:
+            self.lock.release()
+
+    def _set_destinations(self, destinations):
+        """
+        Build the hash ring and the shards of a list of destinations
+        """
+        if isinstance(destinations, basestring):
+            destinations = [destinations]
+        destinations = [parse_destination(d) for d in destinations]
+        if destinations == self.destinations:
+            return
+        if not destinations:
+            raise DiamondException("ShardedGraphiteHandler: no destinations")
+
+        nodes = {}
+        for destination in destinations:
+            host, port, instance = destination
+            if (host, instance) in nodes:
+                raise DiamondException(
+                    "ShardedGraphiteHandler: destination instance (%s, %s) "
+                    "configured more than once" % (host, instance))
+            nodes[(host, instance)] = destination
+
+        shards = {}
+        for destination in destinations:
+            if destination in self.shards:
+                shards[destination] = self.shards.pop(destination)
+            else:
+                shards[destination] = self._create_shard(destination)
+        # Removed destinations are flushed until their backlog is sent
+        self.retired.extend(self.shards.values())
+
+        buffers = self.buffers
+        self.destinations = destinations
+        self.shards = shards
+        self.buffers = dict((destination, []) for destination in destinations)
+        self.ring = ConsistentHashRing([(destination[0], destination[2])
+                                        for destination in destinations])
+        self._nodes = nodes
+        self._routes = {}
+
+        # Route buffered metrics to their new destination
+        for buffered in buffers.values():
+            for metric in buffered:
+                self.buffers[self._get_destination(metric.path)].append(
+                    metric)
+
+    def _create_shard(self, destination):
+        """
+        Create the handler sending to a destination
+        """
+        host, port, instance = destination
+        config = deepcopy(self.config)
+        config['host'] = host
+        config['port'] = port
+        if self.pickle:
+            # A batch handed to the shard is pickled as one frame, and its
+            # backlog is counted in frames
+            config['batch'] = self.batch_size
+        else:
+            # Metrics are batched here, the shard sends whatever it is
+            # given, and its backlog is counted in lines
+            config['batch'] = 1
+            config['max_backlog_multiplier'] = (
+                self.batch_size * int(self.config['max_backlog_multiplier']))
+            config['trim_backlog_multiplier'] = (
+                self.batch_size * int(self.config['trim_backlog_multiplier']))
+        config['async'] = False
+        config['metrics_whitelist'] = None
+        config['metrics_blacklist'] = None
+        if self.config['spool_dir']:
+            config['spool_dir'] = os.path.join(self.config['spool_dir'],
+                                               self._shard_name(destination))
+
+        if self.pickle:
+            return GraphitePickleHandler(config)
+        return GraphiteHandler(config)
+
+    def _shard_name(self, destination):
+        host, port, instance = destination
+        name = '%s_%d' % (host.replace('.', '_').replace(':', '_'), port)
+        if instance is not None:
+            name += '_' + instance
+        return name
+
+    def _get_destination(self, path):
+        """
+        Return the destination of a metric path
+        """
+        destination = self._routes.get(path)
+        if destination is None:
+            if len(self._routes) >= ROUTE_CACHE_SIZE:
+                self._routes.clear()
+            destination = self._nodes[self.ring.get_node(path)]
+            self._routes[path] = destination
+        return destination
+
+    def process(self, metric):
+        """
+        Add a metric to the buffer of its destination, sending the buffer
+        once it holds a batch
+        """
+        destination = self._get_destination(metric.path)
+        buffered = self.buffers[destination]
+        buffered.append(metric)
+        if len(buffered) >= self.batch_size:
+            self._send(destination)
+
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics, sending the buffers holding a batch
+        """
+        full = set()
+        for metric in metrics:
+            destination = self._get_destination(metric.path)
+            buffered = self.buffers[destination]
+            buffered.append(metric)
+            if len(buffered) >= self.batch_size:
+                full.add(destination)
+        for destination in full:
+            self._send(destination)
+
+    def flush(self):
+        """Flush metrics in queue"""
+        for destination in self.destinations:
+            try:
+                if self.buffers[destination]:
+                    self._send(destination)
+                self.shards[destination].flush()
+            except Exception:
+                self.log.error(traceback.format_exc())
+
+        for shard in self.retired[:]:
+            try:
+                shard.flush()
+            except Exception:
+                self.log.error(traceback.format_exc())
+            if self._drained(shard):
+                shard._close()
+                if shard.spool is not None:
+                    shard.spool.close()
+                self.retired.remove(shard)
+
+    def close_inherited(self):
+        """
+        Close the sockets inherited by a forked process
+        """
+        for shard in self.shards.values() + self.retired:
+            shard.close_inherited()
+
+    def get_stats(self):
+        """
+        Return the counters of each destination, prefixed with its name
+        """
+        stats = super(ShardedGraphiteHandler, self).get_stats()
+        for destination in self.destinations:
+            name = self._shard_name(destination)
+            stats['%s.buffered' % name] = len(self.buffers[destination])
+            for key, value in self.shards[destination].get_stats().items():
+                stats['%s.%s' % (name, key)] = value
+        stats['retired'] = len(self.retired)
+        return stats
+
+    def _send(self, destination):
+        """
+        Hand the buffer of a destination to its shard
+        """
+        metrics = self.buffers[destination]
+        self.buffers[destination] = []
+        self.shards[destination].process_batch(metrics)
+
+    def _drained(self, shard):
+        """
+        Whether a shard has nothing left to send
+        """
+        return (not shard._has_data()
+                and not getattr(shard, 'batch', None)
+                and (shard.spool is None or not shard.spool.size))
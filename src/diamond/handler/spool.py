@@ -0,0 +1,228 @@
+# coding=utf-8
+
+"""
+Persistent on-disk spool used by handlers to keep data that could not be
+sent, so it can be replayed once the backend is reachable again.
+
+The spool is a directory of append-only segment files. Each record is
+framed with its length, so any kind of payload (plaintext lines, pickled
+batches) can be spooled. The position of the oldest unsent record is kept
+in a cursor file, which lets the spool survive a restart.
+"""
+
+import os
+import struct
+
+# Record framing: length of the record, big endian
+HEADER = struct.Struct("!L")
+
+SEGMENT_SUFFIX = '.spool'
+CURSOR_FILE = 'cursor'
+
+# When to fsync spooled data
+FSYNC_POLICIES = ['never', 'segment', 'always']
+
+
+class Spool(object):
+    """
+    Size-capped, segmented, append-only spool directory
+    """
+
+    def __init__(self, path, max_size, segment_size, fsync='segment'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Invalid spool fsync policy: %s" % fsync)
+
+        self.path = path
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.fsync = fsync
+
+        # Bytes of records not replayed yet, and bytes dropped because of
+        # max_size
+        self.size = 0
+        self.dropped = 0
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self._segments = []
+        for f in os.listdir(self.path):
+            seq = f[:-len(SEGMENT_SUFFIX)]
+            if f.endswith(SEGMENT_SUFFIX) and seq.isdigit():
+                self._segments.append(int(seq))
+        self._segments.sort()
+
+        # Read position: segment and offset of the oldest unsent record
+        self._reader = None
+        self._read_seq, self._read_offset = self._load_cursor()
+        for seq in self._segments:
+            self.size += os.path.getsize(self._segment_path(seq))
+        self.size -= self._read_offset
+
+        # Always start a new segment, the last one may end with a record
+        # truncated by a crash
+        self._writer = None
+        self._write_seq = None
+        self._write_size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, '%020d%s' % (seq, SEGMENT_SUFFIX))
+
+    def _load_cursor(self):
+        """
+        Return the read position saved by save_cursor, if still valid
+        """
+        if not self._segments:
+            return None, 0
+        try:
+            f = open(os.path.join(self.path, CURSOR_FILE))
+            try:
+                seq, offset = [int(x) for x in f.read().split()]
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return self._segments[0], 0
+
+        if seq not in self._segments:
+            return self._segments[0], 0
+
+        # Segments before the cursor were entirely replayed
+        for old in self._segments[:self._segments.index(seq)]:
+            self._remove_segment(old)
+        return seq, min(offset, os.path.getsize(self._segment_path(seq)))
+
+    def save_cursor(self):
+        """
+        Persist the read position
+        """
+        filename = os.path.join(self.path, CURSOR_FILE)
+        if self._read_seq is None:
+            # Everything was replayed, segment numbers start over
+            if os.path.exists(filename):
+                os.unlink(filename)
+            return
+        f = open(filename + '.tmp', 'w')
+        try:
+            f.write('%d %d\n' % (self._read_seq, self._read_offset))
+            if self.fsync != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(filename + '.tmp', filename)
+
+    def _remove_segment(self, seq):
+        self._segments.remove(seq)
+        try:
+            os.unlink(self._segment_path(seq))
+        except OSError:
+            pass
+
+    def _close_writer(self):
+        if self._writer is None:
+            return
+        if self.fsync == 'segment':
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._writer = None
+
+    def _rotate(self):
+        """
+        Start a new segment to write to
+        """
+        self._close_writer()
+        if self._segments:
+            self._write_seq = self._segments[-1] + 1
+        else:
+            self._write_seq = 0
+        self._segments.append(self._write_seq)
+        self._writer = open(self._segment_path(self._write_seq), 'ab')
+        self._write_size = 0
+        if self._read_seq is None:
+            self._read_seq, self._read_offset = self._write_seq, 0
+
+    def append(self, data):
+        """
+        Add a record to the spool
+        """
+        if self._writer is None or self._write_size >= self.segment_size:
+            self._rotate()
+
+        self._writer.write(HEADER.pack(len(data)))
+        self._writer.write(data)
+        self._writer.flush()
+        if self.fsync == 'always':
+            os.fsync(self._writer.fileno())
+        self._write_size += HEADER.size + len(data)
+        self.size += HEADER.size + len(data)
+
+        # Enforce the size cap by dropping the oldest segments
+        while self.size > self.max_size and len(self._segments) > 1:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        seq = self._segments[0]
+        remaining = os.path.getsize(self._segment_path(seq))
+        if seq == self._read_seq:
+            remaining -= self._read_offset
+            self._close_reader()
+            self._read_seq, self._read_offset = self._segments[1], 0
+        self._remove_segment(seq)
+        self.size -= remaining
+        self.dropped += remaining
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def peek(self):
+        """
+        Return the oldest unsent record, or None if the spool is empty.
+        The record stays in the spool until pop() is called.
+        """
+        while self._read_seq is not None:
+            if self._reader is None:
+                self._reader = open(self._segment_path(self._read_seq), 'rb')
+            self._reader.seek(self._read_offset)
+
+            header = self._reader.read(HEADER.size)
+            if len(header) == HEADER.size:
+                length = HEADER.unpack(header)[0]
+                data = self._reader.read(length)
+                if len(data) == length:
+                    return data
+
+            # End of segment. The one being written may still grow.
+            if self._read_seq == self._write_seq:
+                return None
+
+            self._close_reader()
+            skipped = (os.path.getsize(self._segment_path(self._read_seq))
+                       - self._read_offset)
+            self.size -= skipped
+            self._remove_segment(self._read_seq)
+            if self._segments:
+                self._read_seq, self._read_offset = self._segments[0], 0
+            else:
+                self._read_seq, self._read_offset = None, 0
+        return None
+
+    def pop(self, data):
+        """
+        Remove the record returned by peek() from the spool
+        """
+        self._read_offset += HEADER.size + len(data)
+        self.size -= HEADER.size + len(data)
+
+    def close(self):
+        """
+        Close the spool files, saving the read position
+        """
+        self._close_reader()
+        self._close_writer()
+        self.save_cursor()
@@ -191,6 +191,12 @@ class StatsiteHandler(Handler):
             self._close()
             return
 
+    def close_inherited(self):
+        """
+        Close the socket inherited by a forked process
+        """
+        self._close()
+
     def _close(self):
         """
         Close the socket
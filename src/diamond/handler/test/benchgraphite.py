@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+"""
+Benchmark of the plaintext and pickle graphite handlers, sending to a
+socket discarding the data
+
+    python src/diamond/handler/test/benchgraphite.py [count] [batch]
+
+Not part of the unit tests, run it by hand when changing the graphite
+handlers. Diamond needs about 100k metrics/s per handler for a busy host.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', '..', '..')))
+
+import configobj
+
+from diamond.handler.graphite import GraphiteHandler
+from diamond.handler.graphitepickle import GraphitePickleHandler
+from diamond.metric import Metric
+
+
+class NullSocket(object):
+    """
+    Socket counting the bytes sent to it
+    """
+
+    def __init__(self):
+        self.sent = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+    def close(self):
+        pass
+
+
+def get_handler(cls, batch):
+    config = configobj.ConfigObj()
+    config['batch'] = batch
+    handler = cls(config)
+    handler.socket = NullSocket()
+    handler.connection.connected = True
+    handler.connection.socket = handler.socket
+    handler.connection.writable = lambda: True
+    handler._connect = lambda: None
+    return handler
+
+
+def get_metrics(count):
+    return [Metric('servers.host%d.cpu.cpu%d.idle' % (i % 100, i % 16),
+                   i * 0.5, timestamp=1234567890 + i, precision=2)
+            for i in xrange(count)]
+
+
+def bench(label, cls, metrics, batch):
+    handler = get_handler(cls, batch)
+    # Metrics come in batches of 100, as a collector would publish them
+    start = time.time()
+    for i in xrange(0, len(metrics), 100):
+        handler.process_batch(metrics[i:i + 100])
+    handler.flush()
+    elapsed = time.time() - start
+    print "%-10s %9d metrics in %6.2fs  %10.0f metrics/s  %10d bytes" % (
+        label, len(metrics), elapsed, len(metrics) / elapsed,
+        handler.socket.sent)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 100000
+    if len(sys.argv) > 2:
+        batch = int(sys.argv[2])
+    else:
+        batch = 500
+
+    # Formatting is cached on the Metric, use fresh ones for each run
+    bench('plaintext', GraphiteHandler, get_metrics(count), batch)
+    bench('pickle', GraphitePickleHandler, get_metrics(count), batch)
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import os
+import resource
+import socket
+import time
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+from diamond.handler.connection import Connection
+
+
+class TestConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+    def wait_connected(self, connection):
+        for i in xrange(100):
+            if connection.connect() is not None:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_connect_and_write(self):
+        connection = Connection('127.0.0.1', self.port, proto='tcp4')
+        self.assertTrue(self.wait_connected(connection))
+        self.assertTrue(connection.writable())
+
+        connection.socket.sendall('metric 0 123\n')
+        client = self.server.accept()[0]
+        self.assertEqual(client.recv(100), 'metric 0 123\n')
+        client.close()
+        connection.close()
+        self.assertFalse(connection.writable())
+
+    def test_high_fd(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY and hard <= 1100:
+            self.skipTest('no fds over 1024')
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 1100), hard))
+        # Up to what select() handles
+        fillers = [os.open(os.devnull, os.O_RDONLY)]
+        while fillers[-1] < 1024:
+            fillers.append(os.open(os.devnull, os.O_RDONLY))
+        connection = Connection('127.0.0.1', self.port, proto='tcp4')
+        try:
+            self.assertTrue(self.wait_connected(connection))
+            self.assertTrue(connection.socket.fileno() > 1024)
+            self.assertTrue(connection.writable())
+        finally:
+            connection.close()
+            for fd in fillers:
+                os.close(fd)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_backoff(self):
+        # Nothing listens anymore on this port
+        self.server.close()
+        error = Mock()
+        connection = Connection('127.0.0.1', self.port, proto='tcp4',
+                                backoff=60, error=error)
+
+        self.assertFalse(self.wait_connected(connection))
+        self.assertEqual(connection.failures, 1)
+        self.assertEqual(error.call_count, 1)
+
+        # No new attempt until the backoff delay is over
+        with patch('socket.socket') as socket_mock:
+            self.assertEqual(connection.connect(), None)
+            self.assertEqual(socket_mock.call_count, 0)
+
+    def test_dns_cache(self):
+        connection = Connection('localhost', self.port, proto='tcp4')
+        with patch('socket.getaddrinfo') as getaddrinfo_mock:
+            getaddrinfo_mock.return_value = [
+                (socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('127.0.0.1', self.port))]
+            connection.resolve()
+            connection.resolve()
+            self.assertEqual(getaddrinfo_mock.call_count, 1)
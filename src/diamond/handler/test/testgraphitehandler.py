@@ -2,7 +2,12 @@
 # coding=utf-8
 ################################################################################
 
+import os
 import time
+import shutil
+import struct
+import cPickle
+import tempfile
 
 from test import unittest
 from mock import Mock
@@ -12,6 +17,8 @@ from mock import call
 import configobj
 
 import diamond.handler.graphite as mod
+from diamond.handler.graphitepickle import GraphitePickleHandler
+from diamond.handler.multigraphite import MultiGraphiteHandler
 from diamond.metric import Metric
 
 
@@ -129,6 +136,134 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(sendmock.call_count, len(expected_data))
         self.assertEqual(sendmock.call_args_list, expected_data)
 
+    def test_process_batch(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 2
+
+        metrics = [
+            Metric('metricname1', 0, timestamp=123),
+            Metric('metricname2', 0, timestamp=123),
+            Metric('metricname3', 0, timestamp=123),
+        ]
+
+        expected_data = [
+            call("metricname1 0 123\nmetricname2 0 123\n"
+                 "metricname3 0 123\n"),
+        ]
+
+        handler = mod.GraphiteHandler(config)
+
+        patch_sock = patch.object(handler, 'socket', True)
+        sendmock = Mock()
+        patch_send = patch.object(handler, '_send_data', sendmock)
+
+        patch_sock.start()
+        patch_send.start()
+        handler.process_batch(metrics)
+        patch_send.stop()
+        patch_sock.stop()
+
+        self.assertEqual(sendmock.call_count, len(expected_data))
+        self.assertEqual(sendmock.call_args_list, expected_data)
+
+    def test_spool(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1
+        config['spool_dir'] = tempfile.mkdtemp()
+
+        try:
+            handler = mod.GraphiteHandler(config)
+
+            # Can't connect: metrics go to the spool
+            patch_connect = patch.object(handler, '_connect', Mock())
+            patch_connect.start()
+            handler.socket = None
+            handler.process(Metric('metricname1', 0, timestamp=123))
+            handler.process(Metric('metricname2', 0, timestamp=123))
+            patch_connect.stop()
+
+            self.assertEqual(handler.metrics, [])
+            self.assertTrue(handler.get_stats()['spool_size'] > 0)
+
+            # Connected again: live metrics are sent, then the spool
+            handler.socket = Mock()
+            patch_writable = patch.object(handler.connection, 'writable',
+                                          Mock(return_value=True))
+            patch_writable.start()
+            handler.process(Metric('metricname3', 0, timestamp=123))
+            patch_writable.stop()
+
+            self.assertEqual(handler.socket.sendall.call_args_list, [
+                call("metricname3 0 123\n"),
+                call("metricname1 0 123\n"),
+                call("metricname2 0 123\n"),
+            ])
+            stats = handler.get_stats()
+            self.assertEqual(stats['spool_size'], 0)
+            self.assertEqual(stats['spool_replayed'], 36)
+
+            handler.spool.close()
+            handler.spool = None
+        finally:
+            shutil.rmtree(config['spool_dir'])
+
+    def test_multi_spool(self):
+        config = configobj.ConfigObj()
+        config['host'] = ['127.0.0.1', '127.0.0.2']
+        config['spool_dir'] = tempfile.mkdtemp()
+
+        try:
+            handler = MultiGraphiteHandler(config)
+            first, second = handler.handlers
+
+            # Each server has a spool of its own
+            self.assertEqual(first.spool.path,
+                             config['spool_dir'] + '/127_0_0_1_2003')
+            self.assertEqual(second.spool.path,
+                             config['spool_dir'] + '/127_0_0_2_2003')
+
+            first.socket = None
+            second.socket = Mock()
+            patch_connect = patch.object(first, '_connect', Mock())
+            patch_writable = patch.object(second.connection, 'writable',
+                                          Mock(return_value=True))
+            patch_connect.start()
+            patch_writable.start()
+            handler.process(Metric('metricname1', 0, timestamp=123))
+            patch_writable.stop()
+            patch_connect.stop()
+
+            # Only what the first one couldn't send was spooled
+            self.assertTrue(first.spool.size > 0)
+            self.assertEqual(second.spool.size, 0)
+            self.assertEqual(os.listdir(second.spool.path), [])
+            second.socket.sendall.assert_called_once_with(
+                "metricname1 0 123\n")
+
+            for child in handler.handlers:
+                child.spool.close()
+                child.spool = None
+        finally:
+            shutil.rmtree(config['spool_dir'])
+
+    def test_close_inherited(self):
+        config = configobj.ConfigObj()
+        config['host'] = ['127.0.0.1', '127.0.0.2']
+        handler = MultiGraphiteHandler(config)
+        sockets = []
+        for child in handler.handlers:
+            child.connection.socket = child.socket
+            child.connection.connected = True
+            sockets.append(child.socket)
+
+        handler.close_inherited()
+        for child, sock in zip(handler.handlers, sockets):
+            self.assertEqual(child.socket, None)
+            sock.close.assert_called_once_with()
+            # The connection of the main process goes on
+            self.assertFalse(sock.shutdown.called)
+            self.assertFalse(sock.sendall.called)
+
     def test_backlog(self):
         config = configobj.ConfigObj()
         config['batch'] = 1
@@ -172,6 +307,133 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(send_mock.call_count, 0)
         self.assertEqual(handler.metrics, expected_data)
 
+    def test_multi_parallel(self):
+        config = configobj.ConfigObj()
+        # Addresses, not names to look up
+        config['host'] = ['127.0.0.1', '127.0.0.2']
+        config['parallel'] = 'True'
+        handler = MultiGraphiteHandler(config)
+        slow, fast = handler.handlers
+
+        received = []
+        fast.process_batch = received.extend
+        fast.flush = Mock()
+        slow.process_batch = Mock()
+
+        metrics = [Metric('servers.com.example.www.cpu.total.idle',
+                          i, timestamp=1234567) for i in range(3)]
+        # A stuck destination doesn't hold up the other one
+        slow.lock.acquire()
+        try:
+            slow._enqueue([Metric('stuck', 0, timestamp=1234567)])
+            while len(slow._queue):
+                time.sleep(0.01)
+            handler.process(metrics[0])
+            handler.process_batch(metrics[1:])
+            handler.flush()
+            for _ in range(500):
+                if fast.flush.called:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(received, metrics)
+            self.assertTrue(fast.flush.called)
+            self.assertFalse(slow.process_batch.called)
+            # Lines were formatted once and are shared
+            self.assertEqual(metrics[0]._line[1],
+                             "servers.com.example.www.cpu.total.idle "
+                             "0 1234567\n")
+
+            stats = handler.get_stats()
+            self.assertEqual(stats['127_0_0_1_2003.queue_depth'], 3)
+            self.assertEqual(stats['127_0_0_2_2003.queue_depth'], 0)
+            self.assertTrue(stats['127_0_0_1_2003.queue_lag'] > 0)
+        finally:
+            slow.lock.release()
+
+    def unframe(self, data):
+        """
+        Decode the frames sent by GraphitePickleHandler
+        """
+        data = str(data)
+        batches = []
+        while data:
+            length = struct.unpack("!L", data[:4])[0]
+            batches.append(cPickle.loads(data[4:4 + length]))
+            data = data[4 + length:]
+        return batches
+
+    def test_pickle_batching(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 2
+        handler = GraphitePickleHandler(config)
+        send_mock = Mock()
+        sent = []
+        send_mock.side_effect = lambda data: sent.append(str(data))
+        patch_send = patch.object(handler, '_send_data', send_mock)
+
+        metrics = [Metric('servers.com.example.www.cpu.total.idle',
+                          i, timestamp=1234567) for i in range(5)]
+        patch_send.start()
+        handler.process(metrics[0])
+        self.assertEqual(sent, [])
+        handler.process_batch(metrics[1:])
+        handler.flush()
+        patch_send.stop()
+
+        batches = []
+        for data in sent:
+            batches.extend(self.unframe(data))
+        self.assertEqual(batches, [
+            [('servers.com.example.www.cpu.total.idle', (1234567, 0)),
+             ('servers.com.example.www.cpu.total.idle', (1234567, 1))],
+            [('servers.com.example.www.cpu.total.idle', (1234567, 2)),
+             ('servers.com.example.www.cpu.total.idle', (1234567, 3))],
+            [('servers.com.example.www.cpu.total.idle', (1234567, 4))],
+        ])
+        self.assertEqual(len(handler.buffer), 0)
+
+    def test_pickle_batch_max_bytes(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1000
+        config['batch_max_bytes'] = 200
+        handler = GraphitePickleHandler(config)
+        handler._send = Mock()
+
+        metrics = [Metric('servers.com.example.www.cpu.total.idle',
+                          i, timestamp=1234567) for i in range(10)]
+        handler.process_batch(metrics)
+        handler.batch_max_bytes = 150
+        handler.flush()
+
+        batches = self.unframe(handler.buffer)
+        self.assertTrue(len(batches) > 1)
+        for size in handler._frames:
+            self.assertTrue(size - 4 <= 200)
+        self.assertEqual([m for batch in batches for m in batch],
+                         [(m.path, (m.timestamp, m.value)) for m in metrics])
+
+    def test_pickle_backlog(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1
+        config['max_backlog_multiplier'] = 3
+        config['trim_backlog_multiplier'] = 2
+        handler = GraphitePickleHandler(config)
+        send_mock = Mock(return_value=False)
+        patch_send = patch.object(handler, '_send_data', send_mock)
+
+        metrics = [Metric('servers.com.example.www.cpu.total.idle',
+                          i, timestamp=1234567) for i in range(3)]
+        patch_send.start()
+        for metric in metrics:
+            handler.process(metric)
+        patch_send.stop()
+
+        # The oldest batch was trimmed, the others are kept as backlog
+        self.assertEqual(self.unframe(handler.buffer), [
+            [('servers.com.example.www.cpu.total.idle', (1234567, 1))],
+            [('servers.com.example.www.cpu.total.idle', (1234567, 2))],
+        ])
+
     def test_error_throttling(self):
         """
         This is more of a generic test checking that the _throttle_error method
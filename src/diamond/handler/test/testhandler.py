@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import threading
+import time
+
+from test import unittest
+from mock import Mock
+
+import configobj
+
+from diamond.handler.Handler import Handler
+from diamond.metric import Metric
+
+
+class RecordingHandler(Handler):
+    """
+    Handler keeping track of what it was asked to do
+    """
+
+    def __init__(self, config=None):
+        self.processed = []
+        self.flushed = threading.Event()
+        Handler.__init__(self, config)
+
+    def process(self, metric):
+        self.processed.append(metric)
+
+    def flush(self):
+        self.flushed.set()
+
+
+class TestHandler(unittest.TestCase):
+
+    def get_metrics(self, count):
+        return [Metric('metricname%d' % i, i, timestamp=123)
+                for i in xrange(count)]
+
+    def test_sync_by_default(self):
+        handler = RecordingHandler(configobj.ConfigObj())
+        metrics = self.get_metrics(3)
+
+        for m in metrics:
+            handler._process(m)
+
+        self.assertFalse(handler.async_dispatch)
+        self.assertEqual(handler.processed, metrics)
+        self.assertEqual(handler.get_stats(), {})
+
+    def test_process_batch(self):
+        handler = RecordingHandler(configobj.ConfigObj())
+        metrics = self.get_metrics(3)
+
+        handler._process_batch(metrics)
+
+        self.assertEqual(handler.processed, metrics)
+
+    def test_metrics_blacklist(self):
+        config = configobj.ConfigObj()
+        config['metrics_blacklist'] = ['metricname1', 'metricname3']
+        handler = RecordingHandler(config)
+        metrics = self.get_metrics(5)
+
+        handler._process(metrics[0])
+        handler._process(metrics[1])
+        handler._process_batch(metrics[2:])
+
+        self.assertEqual(handler.processed,
+                         [metrics[0], metrics[2], metrics[4]])
+
+    def test_async_dispatch(self):
+        config = configobj.ConfigObj()
+        config['async'] = 'True'
+        config['queue_batch'] = 2
+        handler = RecordingHandler(config)
+        metrics = self.get_metrics(5)
+
+        for m in metrics[:3]:
+            handler._process(m)
+        handler._process_batch(metrics[3:])
+        handler._flush()
+
+        handler.flushed.wait(5)
+        self.assertTrue(handler.flushed.isSet())
+        self.assertEqual(handler.processed, metrics)
+        self.assertEqual(handler.get_stats(), {'queue_depth': 0,
+                                               'queue_dropped': 0,
+                                               'queue_lag': 0})
+
+    def test_async_batch_enqueued_at_once(self):
+        config = configobj.ConfigObj()
+        config['async'] = 'True'
+        handler = RecordingHandler(config)
+        handler._enqueue = Mock()
+        metrics = self.get_metrics(5)
+
+        handler._process_batch(metrics)
+
+        handler._enqueue.assert_called_once_with(metrics)
+
+    def test_async_drop_oldest(self):
+        config = configobj.ConfigObj()
+        config['async'] = 'True'
+        config['queue_size'] = 2
+        handler = RecordingHandler(config)
+        # Keep the writer thread busy so the queue fills up
+        handler.lock.acquire()
+        try:
+            metrics = self.get_metrics(5)
+            handler._enqueue(metrics[:1])
+            while len(handler._queue):
+                time.sleep(0.01)
+            for m in metrics[1:]:
+                handler._process(m)
+            self.assertEqual(list(handler._queue), metrics[3:])
+            self.assertEqual(handler.queue_dropped, 2)
+        finally:
+            handler.lock.release()
+
+    def test_async_drop_newest(self):
+        config = configobj.ConfigObj()
+        config['async'] = 'True'
+        config['queue_size'] = 2
+        config['queue_overflow'] = 'drop_newest'
+        handler = RecordingHandler(config)
+        handler.lock.acquire()
+        try:
+            metrics = self.get_metrics(5)
+            handler._enqueue(metrics[:1])
+            while len(handler._queue):
+                time.sleep(0.01)
+            for m in metrics[1:]:
+                handler._process(m)
+            self.assertEqual(list(handler._queue), metrics[1:3])
+            self.assertEqual(handler.queue_dropped, 2)
+        finally:
+            handler.lock.release()
+
+    def test_async_flush_with_metrics_queued(self):
+        config = configobj.ConfigObj()
+        config['queue_batch'] = 2
+        handler = RecordingHandler(config)
+        metrics = self.get_metrics(5)
+        handler._enqueue(metrics)
+        handler._flush_pending = True
+
+        # Flushed after the first batch, the rest comes with the next flush
+        self.assertEqual(handler._dequeue(), (metrics[:2], True))
+        self.assertEqual(handler._dequeue(), (metrics[2:4], False))
+
+    def test_invalid_queue_size(self):
+        config = configobj.ConfigObj()
+        config['async'] = 'True'
+        config['queue_size'] = 0
+        config['queue_batch'] = -1
+        handler = RecordingHandler(config)
+        self.assertEqual(handler.queue_size, 10000)
+        self.assertEqual(handler.queue_batch, 500)
+
+        # The queue takes metrics
+        metrics = self.get_metrics(3)
+        handler._process_batch(metrics)
+        handler._flush()
+        handler.flushed.wait(5)
+        self.assertEqual(handler.processed, metrics)
+
+    def test_invalid_overflow_policy(self):
+        config = configobj.ConfigObj()
+        config['queue_overflow'] = 'explode'
+        self.assertRaises(ValueError, RecordingHandler, config)
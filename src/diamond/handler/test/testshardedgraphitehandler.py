@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import cPickle
+import struct
+from hashlib import md5
+
+from test import unittest
+from mock import Mock
+
+import configobj
+
+import diamond.handler.graphite as graphite
+from diamond.error import DiamondException
+from diamond.handler.hashring import ConsistentHashRing, parse_destination
+from diamond.handler.shardedgraphite import ShardedGraphiteHandler
+from diamond.metric import Metric
+
+
+def fake_connect(self):
+    self.socket = None
+
+
+class TestConsistentHashRing(unittest.TestCase):
+
+    def test_parse_destination(self):
+        self.assertEqual(parse_destination('127.0.0.1:2004'),
+                         ('127.0.0.1', 2004, None))
+        self.assertEqual(parse_destination('carbon1:2004:a'),
+                         ('carbon1', 2004, 'a'))
+        self.assertEqual(parse_destination('[::1]:2004:b'),
+                         ('::1', 2004, 'b'))
+        self.assertRaises(DiamondException, parse_destination, 'carbon1')
+        self.assertRaises(DiamondException, parse_destination, 'carbon1:x')
+
+    def test_ring_positions(self):
+        node = ('127.0.0.1', 'a')
+        ring = ConsistentHashRing([node], replica_count=3)
+        # Replicas are placed like carbon does, by hashing "<node>:<i>"
+        positions = sorted(int(md5("('127.0.0.1', 'a'):%d" % i
+                                   ).hexdigest()[:4], 16)
+                           for i in range(3))
+        self.assertEqual(ring.ring, [(p, node) for p in positions])
+
+    def test_get_node(self):
+        nodes = [('carbon1', None), ('carbon2', None), ('carbon3', None)]
+        ring = ConsistentHashRing(nodes)
+        keys = ['servers.host%d.cpu.total.idle' % i for i in range(1000)]
+        owners = dict((key, ring.get_node(key)) for key in keys)
+
+        # Every node gets a share of the keys
+        for node in nodes:
+            self.assertTrue(owners.values().count(node) > 100)
+
+        # Adding a node only moves keys to that node
+        ring.add_node(('carbon4', None))
+        for key in keys:
+            node = ring.get_node(key)
+            self.assertTrue(node in (owners[key], ('carbon4', None)))
+
+
+class TestShardedGraphiteHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.__connect_method = graphite.GraphiteHandler._connect
+        graphite.GraphiteHandler._connect = fake_connect
+
+    def tearDown(self):
+        graphite.GraphiteHandler._connect = self.__connect_method
+
+    def get_handler(self, destinations, batch=1):
+        config = configobj.ConfigObj()
+        config['destinations'] = destinations
+        config['batch'] = batch
+        handler = ShardedGraphiteHandler(config)
+        for shard in handler.shards.values():
+            shard.process_batch = Mock()
+        return handler
+
+    def get_metrics(self, count):
+        return [Metric('servers.host%d.cpu.total.idle' % i, i,
+                       timestamp=1234567) for i in range(count)]
+
+    def test_sharding(self):
+        handler = self.get_handler(['carbon1:2004:a', 'carbon2:2004:a'],
+                                   batch=100)
+        metrics = self.get_metrics(100)
+
+        handler.process_batch(metrics)
+        handler.flush()
+
+        sent = []
+        for destination, shard in handler.shards.items():
+            self.assertEqual(shard.process_batch.call_count, 1)
+            shard_metrics = shard.process_batch.call_args[0][0]
+            self.assertTrue(shard_metrics)
+            for metric in shard_metrics:
+                self.assertEqual(
+                    handler.ring.get_node(metric.path),
+                    (destination[0], destination[2]))
+            sent.extend(shard_metrics)
+        self.assertEqual(sorted(sent), sorted(metrics))
+
+    def test_batching(self):
+        handler = self.get_handler(['carbon1:2004'], batch=3)
+        shard = handler.shards[('carbon1', 2004, None)]
+        metrics = self.get_metrics(5)
+
+        for metric in metrics:
+            handler.process(metric)
+
+        shard.process_batch.assert_called_once_with(metrics[:3])
+        self.assertEqual(handler.get_stats()['carbon1_2004.buffered'], 2)
+
+    def test_pickle_frames(self):
+        config = configobj.ConfigObj()
+        config['destinations'] = ['carbon1:2004']
+        config['batch'] = 3
+        handler = ShardedGraphiteHandler(config)
+        shard = handler.shards[('carbon1', 2004, None)]
+        metrics = self.get_metrics(7)
+
+        for metric in metrics:
+            handler.process(metric)
+        # One frame per batch
+        self.assertEqual(len(shard._frames), 2)
+        handler.flush()
+        self.assertEqual(len(shard._frames), 3)
+
+        data = str(shard.buffer)
+        frames = []
+        while data:
+            length = struct.unpack("!L", data[:4])[0]
+            frames.append([path for path, point in
+                           cPickle.loads(data[4:4 + length])])
+            data = data[4 + length:]
+        paths = [metric.path for metric in metrics]
+        self.assertEqual(frames, [paths[:3], paths[3:6], paths[6:]])
+        # The backlog is counted in frames
+        self.assertEqual(shard.max_backlog_multiplier, 5)
+        self.assertEqual(shard.trim_backlog_multiplier, 4)
+
+    def test_duplicate_destination(self):
+        self.assertRaises(DiamondException, self.get_handler,
+                          ['carbon1:2004:a', 'carbon1:2005:a'])
+
+    def test_reload(self):
+        handler = self.get_handler(['carbon1:2004', 'carbon2:2004'],
+                                   batch=100)
+        kept = handler.shards[('carbon1', 2004, None)]
+        removed = handler.shards[('carbon2', 2004, None)]
+        removed._frame([('backlog', (1234567, 0))])
+        metrics = self.get_metrics(50)
+        handler.process_batch(metrics)
+
+        config = configobj.ConfigObj()
+        config['destinations'] = ['carbon1:2004', 'carbon3:2004']
+        handler.reload_config(config)
+
+        self.assertTrue(handler.shards[('carbon1', 2004, None)] is kept)
+        self.assertEqual(handler.retired, [removed])
+        # Buffered metrics were routed with the new ring
+        buffered = []
+        for destination, shard_metrics in handler.buffers.items():
+            for metric in shard_metrics:
+                self.assertEqual(handler.ring.get_node(metric.path),
+                                 (destination[0], destination[2]))
+            buffered.extend(shard_metrics)
+        self.assertEqual(sorted(buffered), sorted(metrics))
+        self.assertTrue(handler.buffers[('carbon3', 2004, None)])
+
+        # The removed destination is kept until its backlog is sent
+        removed.flush = Mock()
+        handler.flush()
+        self.assertEqual(removed.flush.call_count, 1)
+        self.assertEqual(handler.retired, [removed])
+        removed._clear_data()
+        handler.flush()
+        self.assertEqual(handler.retired, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import os
+import shutil
+import tempfile
+
+from test import unittest
+
+from diamond.handler.spool import Spool
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_records(self, spool):
+        records = []
+        while True:
+            data = spool.peek()
+            if data is None:
+                return records
+            spool.pop(data)
+            records.append(data)
+
+    def test_append_and_replay(self):
+        spool = Spool(self.path, 1024 * 1024, 64)
+        records = ['metric%d 0 123\n' % i for i in xrange(20)]
+        for record in records:
+            spool.append(record)
+
+        self.assertTrue(len(spool) > 0)
+        self.assertEqual(spool.peek(), records[0])
+        self.assertEqual(spool.peek(), records[0])
+        self.assertEqual(self.get_records(spool), records)
+        self.assertEqual(len(spool), 0)
+
+        spool.append('after')
+        self.assertEqual(self.get_records(spool), ['after'])
+
+    def test_survives_restart(self):
+        spool = Spool(self.path, 1024 * 1024, 64)
+        records = ['metric%d 0 123\n' % i for i in xrange(20)]
+        for record in records:
+            spool.append(record)
+        for i in xrange(5):
+            spool.pop(spool.peek())
+        spool.close()
+
+        spool = Spool(self.path, 1024 * 1024, 64)
+        self.assertEqual(self.get_records(spool), records[5:])
+        spool.close()
+
+        spool = Spool(self.path, 1024 * 1024, 64)
+        self.assertEqual(len(spool), 0)
+        self.assertEqual(spool.peek(), None)
+
+    def test_max_size(self):
+        spool = Spool(self.path, 200, 50)
+        records = ['metric%02d 0 123\n' % i for i in xrange(50)]
+        for record in records:
+            spool.append(record)
+
+        self.assertTrue(spool.dropped > 0)
+        self.assertTrue(len(spool) <= 200 + 50)
+        replayed = self.get_records(spool)
+        self.assertEqual(replayed, records[-len(replayed):])
+        self.assertEqual(len(os.listdir(self.path)), 1)
+
+    def test_invalid_fsync_policy(self):
+        self.assertRaises(ValueError, Spool, self.path, 100, 10, 'sometimes')
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.connection import Connection
+from diamond.handler.tsdb import TSDBHandler
+from diamond.metric import Metric
+
+
+class TestTSDBHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.socket = Mock()
+        # Connecting, not connected yet
+        self.patch_connect = patch.object(Connection, 'connect',
+                                          Mock(return_value=None))
+        self.patch_writable = patch.object(Connection, 'writable',
+                                           Mock(return_value=False))
+        self.connect = self.patch_connect.start()
+        self.writable = self.patch_writable.start()
+
+    def tearDown(self):
+        self.patch_writable.stop()
+        self.patch_connect.stop()
+
+    def get_handler(self, **options):
+        config = configobj.ConfigObj()
+        config['host'] = '127.0.0.1'
+        config['format'] = '{Metric} {timestamp} {value}'
+        config.update(options)
+        return TSDBHandler(config)
+
+    def get_metrics(self, count):
+        return [Metric('servers.host.cpu.total.idle%d' % i, i,
+                       timestamp=1234567) for i in range(count)]
+
+    def connected(self):
+        self.connect.return_value = self.socket
+        self.writable.return_value = True
+
+    def test_reconnect_in_progress(self):
+        handler = self.get_handler()
+        metrics = self.get_metrics(3)
+
+        handler.process(metrics[0])
+        handler.process(metrics[1])
+        # Kept until the connection is established
+        self.assertEqual(self.socket.sendall.call_count, 0)
+        self.assertEqual(len(handler.metrics), 2)
+
+        self.connected()
+        handler.process(metrics[2])
+        self.socket.sendall.assert_called_once_with(
+            "put total.idle0 1234567 0\n"
+            "put total.idle1 1234567 1\n"
+            "put total.idle2 1234567 2\n")
+        self.assertEqual(handler.metrics, [])
+
+    def test_send_buffer_full(self):
+        self.connected()
+        handler = self.get_handler()
+        metrics = self.get_metrics(2)
+
+        # Connected, but the socket can't take more data
+        self.writable.return_value = False
+        handler.process(metrics[0])
+        handler.process(metrics[1])
+        self.assertEqual(self.socket.sendall.call_count, 0)
+
+        self.writable.return_value = True
+        handler.flush()
+        self.socket.sendall.assert_called_once_with(
+            "put total.idle0 1234567 0\n"
+            "put total.idle1 1234567 1\n")
+
+        # Nothing left to send
+        handler.flush()
+        self.assertEqual(self.socket.sendall.call_count, 1)
+
+    def test_backlog(self):
+        handler = self.get_handler(max_backlog=4, trim_backlog=3)
+
+        for metric in self.get_metrics(8):
+            handler.process(metric)
+
+        self.assertEqual(handler.metrics, [
+            "put total.idle5 1234567 5\n",
+            "put total.idle6 1234567 6\n",
+            "put total.idle7 1234567 7\n",
+        ])
+
+    def test_backlog_trimmed_to_nothing(self):
+        handler = self.get_handler(max_backlog=2, trim_backlog=0)
+
+        for metric in self.get_metrics(3):
+            handler.process(metric)
+
+        self.assertEqual(handler.metrics, [
+            "put total.idle2 1234567 2\n",
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
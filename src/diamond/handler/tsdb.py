@@ -37,6 +37,7 @@ yourself.
 """
 
 from Handler import Handler
+from connection import Connection
 import socket
 
 
@@ -44,7 +45,6 @@ class TSDBHandler(Handler):
     """
     Implements the abstract Handler class, sending data to graphite
     """
-    RETRY = 3
 
     def __init__(self, config=None):
         """
@@ -55,6 +55,7 @@ class TSDBHandler(Handler):
 
         # Initialize Data
         self.socket = None
+        self.metrics = []
 
         # Initialize Options
         self.host = self.config['host']
@@ -62,6 +63,14 @@ class TSDBHandler(Handler):
         self.timeout = int(self.config['timeout'])
         self.metric_format = str(self.config['format'])
         self.tags = str(self.config['tags'])
+        self.max_backlog = int(self.config['max_backlog'])
+        self.trim_backlog = int(self.config['trim_backlog'])
+        self.connection = Connection(
+            self.host, self.port, timeout=self.timeout,
+            dns_ttl=int(self.config['dns_ttl']),
+            backoff=float(self.config['reconnect_backoff']),
+            max_backoff=float(self.config['reconnect_max_backoff']),
+            name='TSDBHandler', error=self._throttle_error)
 
         # Connect
         self._connect()
@@ -78,6 +87,15 @@ class TSDBHandler(Handler):
             'timeout': '',
             'format': '',
             'tags': '',
+            'max_backlog': ('How many metrics to keep while they can not be '
+                            'sent before trimming'),
+            'trim_backlog': 'Trim down to how many metrics',
+            'dns_ttl': 'How long to cache the address of the host (seconds)',
+            'reconnect_backoff': ('Delay before reconnecting after a failed '
+                                  'attempt, doubled after each failure '
+                                  '(seconds)'),
+            'reconnect_max_backoff': ('Maximum delay between reconnection '
+                                      'attempts (seconds)'),
         })
 
         return config
@@ -95,6 +113,11 @@ class TSDBHandler(Handler):
             'format': '{Collector}.{Metric} {timestamp} {value} hostname={host}'
                       '{tags}',
             'tags': '',
+            'max_backlog': 1000,
+            'trim_backlog': 800,
+            'dns_ttl': 300,
+            'reconnect_backoff': 1,
+            'reconnect_max_backoff': 300,
         })
 
         return config
@@ -120,72 +143,72 @@ class TSDBHandler(Handler):
             tags=self.tags
         )
         # Just send the data as a string
-        self._send("put " + str(metric_str) + "\n")
+        self.metrics.append("put " + str(metric_str) + "\n")
+        self._send()
 
-    def _send(self, data):
+    def flush(self):
+        """Send the metrics kept while the server could not be reached"""
+        if self.metrics:
+            self._send()
+
+    def _send(self):
         """
-        Send data to TSDB. Data that can not be sent will be queued.
+        Send data to TSDB. Data that can not be sent right away is kept, and
+        sent with the next metrics.
         """
-        retry = self.RETRY
-        # Attempt to send any data in the queue
-        while retry > 0:
+        try:
             # Check socket
-            if not self.socket:
-                # Log Error
-                self.log.error("TSDBHandler: Socket unavailable.")
-                # Attempt to restablish connection
+            if self.socket is None:
+                # Attempt to restablish connection, without waiting for it
                 self._connect()
-                # Decrement retry
-                retry -= 1
-                # Try again
-                continue
+            if self.socket is None or not self.connection.writable():
+                self.log.debug("TSDBHandler: Socket unavailable, keeping "
+                               "%d metrics.", len(self.metrics))
+                return
             try:
                 # Send data to socket
-                self.socket.sendall(data)
-                # Done
-                break
+                self.socket.sendall(''.join(self.metrics))
+                self.metrics = []
+                self._reset_errors()
             except socket.error, e:
                 # Log Error
-                self.log.error("TSDBHandler: Failed sending data. %s.", e)
-                # Attempt to restablish connection
+                self._throttle_error("TSDBHandler: Failed sending data. %s.",
+                                     e)
+                # Reconnect next time
                 self._close()
-                # Decrement retry
-                retry -= 1
-                # try again
-                continue
+        finally:
+            self._trim_backlog()
+
+    def _trim_backlog(self):
+        """
+        Drop the oldest metrics once the backlog is too large
+        """
+        if len(self.metrics) >= self.max_backlog:
+            self.log.warn('TSDBHandler: Trimming backlog. Removing'
+                          + ' oldest %d and keeping newest %d metrics',
+                          len(self.metrics) - self.trim_backlog,
+                          self.trim_backlog)
+            # Not [-trim_backlog:], which keeps everything for 0
+            self.metrics = self.metrics[
+                max(len(self.metrics) - self.trim_backlog, 0):]
+
+    def close_inherited(self):
+        """
+        Close the socket inherited by a forked process
+        """
+        self.connection.close()
+        self.socket = None
 
     def _connect(self):
         """
-        Connect to the TSDB server
-        """
-        # Create socket
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        if socket is None:
-            # Log Error
-            self.log.error("TSDBHandler: Unable to create socket.")
-            # Close Socket
-            self._close()
-            return
-        # Set socket timeout
-        self.socket.settimeout(self.timeout)
-        # Connect to graphite server
-        try:
-            self.socket.connect((self.host, self.port))
-            # Log
-            self.log.debug("Established connection to TSDB server %s:%d",
-                           self.host, self.port)
-        except Exception, ex:
-            # Log Error
-            self.log.error("TSDBHandler: Failed to connect to %s:%i. %s",
-                           self.host, self.port, ex)
-            # Close Socket
-            self._close()
-            return
+        Connect to the TSDB server. This doesn't block: the socket is only
+        set once the connection is established.
+        """
+        self.socket = self.connection.connect()
 
     def _close(self):
         """
         Close the socket
         """
-        if self.socket is not None:
-            self.socket.close()
+        self.connection.close()
         self.socket = None
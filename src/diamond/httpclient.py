@@ -0,0 +1,395 @@
+# coding=utf-8
+
+"""
+HTTP client for the collectors polling HTTP endpoints.
+
+An HTTPClient keeps its connections open between requests and runs (HTTP/1.1
+keep-alive), a few per host, instead of opening a new TCP connection for
+every urllib2.urlopen() call. Requests have a timeout, ask for gzip encoded
+responses and follow redirects. fetch_all() sends many requests at once from
+a few threads sharing the pool. With max_connections=0 no connection is
+kept, every request is sent from a new one.
+
+Proxies are taken from the http_proxy, https_proxy and no_proxy environment
+variables, as urllib2 does. HTTPS requests go through a CONNECT tunnel.
+
+urlopen() takes the same arguments as urllib2.urlopen(), a URL or a
+urllib2.Request, and returns a file-like response with the same code, read(),
+readlines(), info() and getcode(). Its errors are urllib2.URLError and
+urllib2.HTTPError, so collectors catch the same exceptions as before.
+"""
+
+import base64
+import errno
+import httplib
+import Queue
+import socket
+import threading
+import urllib
+import urllib2
+import urlparse
+import zlib
+
+from StringIO import StringIO
+
+# Bytes read from a response at once
+READ_SIZE = 65536
+
+# Redirects followed before giving up
+MAX_REDIRECTS = 5
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Errors from an idle connection the server closed, the request is sent again
+# from a new one
+RETRY_ERRNOS = (errno.ECONNRESET, errno.EPIPE)
+
+
+class URLError(urllib2.URLError):
+    pass
+
+
+class HTTPError(urllib2.HTTPError):
+    pass
+
+
+class HTTPResponse(object):
+    """
+    Response to a request, read as it comes from the connection. The
+    connection goes back to the pool once the whole body is read, or is
+    closed if the response is closed before that.
+    """
+
+    def __init__(self, url, response, release):
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self._response = response
+        self._release = release
+        if 'gzip' in (response.getheader('content-encoding') or '').lower():
+            # gzip header and trailer, not a bare zlib stream
+            self._decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompress = None
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes of the (decoded) body, all of it by default
+        """
+        if self._response is None:
+            return ''
+        if size is None or size < 0:
+            chunks = []
+            while self._response is not None:
+                chunks.append(self._read_chunk(READ_SIZE))
+            return ''.join(chunks)
+
+        # A gzip block may not decode to anything on its own
+        data = ''
+        while not data and self._response is not None:
+            data = self._read_chunk(size)
+        return data
+
+    def _read_chunk(self, size):
+        response = self._response
+        try:
+            data = response.read(size)
+        except (httplib.HTTPException, socket.error), e:
+            self.close()
+            raise URLError(e)
+        finished = response.isclosed()
+        if not data and not finished:
+            # Nothing more to read, but not at the end of the body
+            self.close()
+            finished = True
+        if self._decompress is not None:
+            try:
+                data = self._decompress.decompress(data)
+                if finished:
+                    data += self._decompress.flush()
+            except zlib.error, e:
+                self.close()
+                raise URLError(e)
+        if finished and self._response is not None:
+            self._done(True)
+        return data
+
+    def readlines(self):
+        return self.read().splitlines(True)
+
+    def __iter__(self):
+        return iter(self.readlines())
+
+    def close(self):
+        """
+        Drop the rest of the body, and the connection with it
+        """
+        if self._response is not None:
+            self._response.close()
+            self._done(False)
+
+    def _done(self, reuse):
+        self._response = None
+        self._release(reuse)
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+
+class HTTPClient(object):
+    """
+    Pool of keep-alive connections, max_connections idle ones kept per host.
+    proxies maps schemes to proxy URLs, like urllib.getproxies() which is
+    the default.
+    """
+
+    def __init__(self, timeout=10, max_connections=8, headers=None,
+                 proxies=None):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        if proxies is None:
+            proxies = urllib.getproxies()
+        self.proxies = proxies
+        self.headers = {
+            'Accept-Encoding': 'gzip',
+            'User-Agent': 'Diamond',
+        }
+        if headers:
+            self.headers.update(headers)
+        # Idle connections by (scheme, host, port, proxy)
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _get_connection(self, key, timeout):
+        """
+        Return an idle connection to the host, or a new one, and whether it
+        was idle
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    try:
+                        conn.sock.settimeout(timeout)
+                    except socket.error:
+                        # Reconnected by the next request
+                        conn.close()
+                return conn, True
+        finally:
+            self.lock.release()
+
+        scheme, host, port, proxy = key
+        if scheme == 'https':
+            if proxy is None:
+                return (httplib.HTTPSConnection(host, port, timeout=timeout),
+                        False)
+            proxy_host, proxy_port, proxy_auth = proxy
+            conn = httplib.HTTPSConnection(proxy_host, proxy_port,
+                                           timeout=timeout)
+            conn.set_tunnel(host, port, proxy_auth and {
+                'Proxy-Authorization': proxy_auth})
+            return conn, False
+        if proxy is not None:
+            host, port = proxy[:2]
+        return httplib.HTTPConnection(host, port, timeout=timeout), False
+
+    def _get_proxy(self, scheme, host):
+        """
+        Return the (host, port, Proxy-Authorization) of the proxy to send a
+        request through, None to connect to the host directly
+        """
+        url = self.proxies.get(scheme)
+        if not url or urllib.proxy_bypass(host):
+            return None
+        if '://' not in url:
+            url = 'http://' + url
+        parts = urlparse.urlsplit(url)
+        auth = None
+        if parts.username is not None:
+            auth = 'Basic ' + base64.b64encode(
+                '%s:%s' % (urllib.unquote(parts.username),
+                           urllib.unquote(parts.password or '')))
+        return parts.hostname, parts.port or 80, auth
+
+    def _put_connection(self, key, conn):
+        if conn.sock is None:
+            # Closed by the server (Connection: close)
+            return
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_connections:
+                idle.append(conn)
+                return
+        finally:
+            self.lock.release()
+        conn.close()
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, {}
+        finally:
+            self.lock.release()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def urlopen(self, url, data=None, timeout=None, headers=None):
+        """
+        Send a GET request (a POST one with data) and return the response.
+        url may be a urllib2.Request, whose data and headers are sent.
+        Raise HTTPError for 4xx and 5xx responses, URLError when the
+        request fails.
+        """
+        all_headers = {}
+        # One header per name, whatever the case of the names given
+        for items in (self.headers.items(),
+                      isinstance(url, urllib2.Request) and url.header_items(),
+                      headers and headers.items()):
+            for name, value in items or ():
+                all_headers[name.title()] = value
+        if isinstance(url, urllib2.Request):
+            if data is None:
+                data = url.get_data()
+            url = url.get_full_url()
+        if timeout is None:
+            timeout = self.timeout
+
+        for i in range(MAX_REDIRECTS + 1):
+            response = self._request(url, data, timeout, all_headers)
+            location = response.headers.getheader('location')
+            if response.code not in REDIRECT_CODES or not location:
+                break
+            response.read()
+            url = urlparse.urljoin(url, location)
+            if response.code not in (307, 308):
+                data = None
+        else:
+            raise HTTPError(url, response.code, 'Too many redirects',
+                            response.headers, None)
+
+        if response.code >= 400:
+            raise HTTPError(url, response.code, response.msg,
+                            response.headers, StringIO(response.read()))
+        return response
+
+    def _request(self, url, data, timeout, headers):
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise URLError('unsupported URL %r' % url)
+        port = parts.port or (scheme == 'https' and 443 or 80)
+        proxy = self._get_proxy(scheme, parts.hostname)
+        key = (scheme, parts.hostname, port, proxy)
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers)
+        if parts.username is not None:
+            headers['Authorization'] = 'Basic ' + base64.b64encode(
+                '%s:%s' % (urllib.unquote(parts.username),
+                           urllib.unquote(parts.password or '')))
+        if proxy is not None and scheme == 'http':
+            # The proxy is sent the whole URL, without the credentials
+            path = urlparse.urlunsplit((scheme,
+                                        parts.netloc.rpartition('@')[2],
+                                        parts.path or '/', parts.query, ''))
+            if proxy[2]:
+                headers['Proxy-Authorization'] = proxy[2]
+        method = data is None and 'GET' or 'POST'
+
+        while True:
+            conn, reused = self._get_connection(key, timeout)
+            try:
+                conn.request(method, path, data, headers)
+                response = conn.getresponse()
+                break
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+                # The server may have closed an idle connection before
+                # reading the request: try a GET again from a new one
+                if not (reused and data is None and self._closed_idle(e)):
+                    raise URLError(e)
+
+        def release(reuse):
+            if reuse:
+                self._put_connection(key, conn)
+            else:
+                conn.close()
+
+        return HTTPResponse(url, response, release)
+
+    def _closed_idle(self, e):
+        """
+        Whether a request failed because its idle connection was closed
+        """
+        if isinstance(e, httplib.BadStatusLine):
+            return True
+        return (isinstance(e, socket.error)
+                and not isinstance(e, socket.timeout)
+                and e.errno in RETRY_ERRNOS)
+
+    def fetch_all(self, urls, parse=None, parallelism=None):
+        """
+        Send requests for all the urls from parallelism threads at once
+        (max_connections by default) and return a (result, error) pair for
+        each, in the same order. The result is parse(response), run in the
+        thread, or the body of the response by default. error is the
+        exception raised by the request or by parse, None if none was.
+        """
+        if parse is None:
+            parse = self._read
+        if parallelism is None:
+            parallelism = self.max_connections
+        parallelism = max(min(int(parallelism), len(urls)), 1)
+
+        results = [(None, None)] * len(urls)
+        queue = Queue.Queue()
+        for item in enumerate(urls):
+            queue.put(item)
+
+        def fetch():
+            while True:
+                try:
+                    i, url = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    response = self.urlopen(url)
+                    try:
+                        results[i] = (parse(response), None)
+                    finally:
+                        response.close()
+                except Exception, e:
+                    results[i] = (None, e)
+
+        if parallelism == 1:
+            fetch()
+            return results
+
+        threads = [threading.Thread(target=fetch)
+                   for i in range(parallelism)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _read(self, response):
+        return response.read()
@@ -0,0 +1,337 @@
+# coding=utf-8
+
+"""
+Incremental parsing of large JSON documents of which only a few values are
+wanted, such as the stats of elasticsearch.
+
+load() reads the document from a file-like object a block at a time, and
+returns it with only the values at the paths asked for: objects and arrays
+on no wanted path are scanned over without being decoded, so neither the
+whole text nor the whole document are ever held in memory.
+
+A path is a sequence of keys (or a string of keys separated by dots), from
+the root of the document to a value, which is kept whole. Keys are glob
+patterns, as for fnmatch: ('nodes', '*', 'jvm', 'mem', '*_in_bytes'). The
+elements of arrays have keys '0', '1', ... Objects and arrays on the way to
+a wanted value are kept, with only what is wanted in them.
+"""
+
+import fnmatch
+import re
+
+from json.decoder import JSONDecoder, scanstring
+
+# Bytes read at once
+READ_SIZE = 65536
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_CHARS = re.compile(r'[-+.eE0-9]*')
+NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?')
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+DECODER = JSONDecoder()
+
+# What to look for while skipping a value: strings, which may hold any
+# character, and brackets
+PLAIN = re.compile(r'[^"{}\[\]]*')
+SKIP = re.compile(r'[^"{}\[\]]*(?:([{\[])|([}\]])|"[^"\\]*(?:\\.[^"\\]*)*")',
+                  re.S)
+
+
+class PathNode(object):
+    """
+    Node of the tree of the wanted paths, for the keys under it
+    """
+
+    __slots__ = ['wanted', 'keys', 'patterns']
+
+    def __init__(self):
+        # The whole value is wanted
+        self.wanted = False
+        # Child nodes by plain key, and by compiled pattern
+        self.keys = {}
+        self.patterns = []
+
+    def add(self, path):
+        node = self
+        for key in path:
+            # Like the keys decoded
+            key = unicode(key)
+            if any(c in key for c in '*?['):
+                for pattern, child in node.patterns:
+                    if pattern.pattern == fnmatch.translate(key):
+                        break
+                else:
+                    child = PathNode()
+                    node.patterns.append(
+                        (re.compile(fnmatch.translate(key)), child))
+            else:
+                child = node.keys.get(key)
+                if child is None:
+                    child = node.keys[key] = PathNode()
+            node = child
+        node.wanted = True
+
+
+def build_paths(paths):
+    """
+    Return the root node of the tree of paths
+    """
+    root = PathNode()
+    for path in paths:
+        if isinstance(path, basestring):
+            path = path.split('.')
+        root.add(path)
+    return root
+
+
+def _match(nodes, key):
+    """
+    Return the nodes for key under the nodes
+    """
+    matched = []
+    for node in nodes:
+        child = node.keys.get(key)
+        if child is not None:
+            matched.append(child)
+        for pattern, child in node.patterns:
+            if pattern.match(key):
+                matched.append(child)
+    return matched
+
+
+def prune(value, nodes):
+    """
+    Return what is on the paths of nodes of a decoded value
+    """
+    for node in nodes:
+        if node.wanted:
+            return value
+    if isinstance(value, dict):
+        pruned = {}
+        if len(nodes) == 1 and not nodes[0].patterns:
+            # Plain keys only
+            for key, child in nodes[0].keys.iteritems():
+                if key in value:
+                    pruned[key] = prune(value[key], [child])
+            return pruned
+        for key, item in value.iteritems():
+            matched = _match(nodes, key)
+            if matched:
+                pruned[key] = prune(item, matched)
+        return pruned
+    if isinstance(value, list):
+        pruned = []
+        for index, item in enumerate(value):
+            matched = _match(nodes, str(index))
+            if matched:
+                pruned.append(prune(item, matched))
+        return pruned
+    return value
+
+
+class Parser(object):
+    """
+    Reader of a JSON document from a file-like object, through a buffer
+    holding the block being parsed
+    """
+
+    def __init__(self, fp, size=READ_SIZE):
+        self.fp = fp
+        self.size = size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Read the next block after what is left of the buffer, return False
+        at the end of the document
+        """
+        if self.eof:
+            return False
+        data = self.fp.read(self.size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def error(self, message):
+        return ValueError('%s at offset %d of the buffer' % (message,
+                                                             self.pos))
+
+    def peek(self):
+        """
+        Return the next character after whitespace, '' at the end
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error('Expecting %r' % char)
+        self.pos += 1
+
+    def string(self):
+        self.expect('"')
+        while True:
+            try:
+                value, end = scanstring(self.buf, self.pos)
+                break
+            except ValueError:
+                # Not all of it in the buffer yet
+                if not self.fill():
+                    raise
+        self.pos = end
+        return value
+
+    def scalar(self):
+        char = self.peek()
+        if char == '"':
+            return self.string()
+        if char in '-0123456789':
+            # The number may go on in the next block
+            while (NUMBER_CHARS.match(self.buf, self.pos).end() ==
+                   len(self.buf) and self.fill()):
+                pass
+            m = NUMBER.match(self.buf, self.pos)
+            if m is None:
+                raise self.error('Expecting value')
+            self.pos = m.end()
+            if m.group(1) or m.group(2):
+                return float(m.group())
+            return int(m.group())
+        for literal, value in LITERALS.iteritems():
+            while (len(self.buf) - self.pos < len(literal)
+                   and self.fill()):
+                pass
+            if self.buf.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+        raise self.error('Expecting value')
+
+    def value(self, nodes):
+        """
+        Parse the next value, keeping what is on the paths of nodes
+        """
+        # Everything under a wanted value is
+        wanted = [node for node in nodes if node.wanted]
+
+        char = self.peek()
+        if char and char in '{[':
+            # Small enough to be decoded at once by the json module (in C)
+            # and pruned after
+            decoded = self.decode()
+            if decoded is not None:
+                return prune(decoded[0], nodes)
+        if char == '{':
+            self.pos += 1
+            obj = {}
+            for key in self.members('}'):
+                matched = wanted or _match(nodes, key)
+                if matched:
+                    obj[key] = self.value(matched)
+                else:
+                    self.skip()
+            return obj
+        if char == '[':
+            self.pos += 1
+            array = []
+            for index in self.members(']'):
+                matched = wanted or _match(nodes, str(index))
+                if matched:
+                    array.append(self.value(matched))
+                else:
+                    self.skip()
+            return array
+        return self.scalar()
+
+    def members(self, end):
+        """
+        Yield the keys of the members of an object (the indices of the
+        elements of an array, if end is ']'), once positioned at their
+        values
+        """
+        index = 0
+        if self.peek() == end:
+            self.pos += 1
+            return
+        while True:
+            if end == '}':
+                key = self.string()
+                self.expect(':')
+                yield key
+            else:
+                yield index
+                index += 1
+            char = self.peek()
+            self.pos += 1
+            if char == end:
+                return
+            if char != ',':
+                self.pos -= 1
+                raise self.error('Expecting %r or %r' % (',', end))
+
+    def decode(self):
+        """
+        Decode the whole value at the current position, if it ends within
+        a block, and return it as a (value,) tuple. Return None if it does
+        not, or is not valid: it is then parsed bit by bit.
+        """
+        while True:
+            try:
+                value, self.pos = DECODER.raw_decode(self.buf, self.pos)
+                return (value,)
+            except ValueError:
+                if len(self.buf) - self.pos >= self.size or not self.fill():
+                    return None
+
+    def skip(self):
+        """
+        Go over the next value without decoding it
+        """
+        char = self.peek()
+        if not char or char not in '{[':
+            self.scalar()
+            return
+        # Decoding it in C is faster than looking for its end here
+        if self.decode() is not None:
+            return
+
+        depth = 0
+        while True:
+            m = SKIP.match(self.buf, self.pos)
+            if m is None:
+                # Keep only what may be the start of a string
+                self.pos = PLAIN.match(self.buf, self.pos).end()
+                if not self.fill():
+                    raise self.error('Unterminated value')
+                continue
+            self.pos = m.end()
+            if m.group(1):
+                depth += 1
+            elif m.group(2):
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def load(fp, paths, size=READ_SIZE):
+    """
+    Parse the JSON document read from fp, keeping only the values on paths
+    """
+    if isinstance(paths, PathNode):
+        root = paths
+    else:
+        root = build_paths(paths)
+    parser = Parser(fp, size)
+    doc = parser.value([root])
+    if parser.peek() != '':
+        raise parser.error('Extra data')
+    return doc
@@ -5,10 +5,30 @@ import re
 import logging
 from error import DiamondException
 
+# Format strings used by Metric.__repr__, keyed by precision
+_FORMATS = {}
+
+
+def _get_format(precision):
+    """
+    Return the (cached) plaintext format string for the given precision
+    """
+    try:
+        return _FORMATS[precision]
+    except KeyError:
+        fstring = _FORMATS[precision] = "%%s %%0.%if %%i\n" % precision
+        return fstring
+
 
 class Metric(object):
 
-    _METRIC_TYPES = ['COUNTER', 'GAUGE']
+    # Metrics are created by the tens of thousands on every interval, so
+    # keep them small. _line and _parts cache the formatted line and the
+    # path components, along with the attributes they were computed from.
+    __slots__ = ['path', 'value', 'raw_value', 'timestamp', 'precision',
+                 'host', 'metric_type', 'ttl', '_line', '_parts']
+
+    _METRIC_TYPES = frozenset(['COUNTER', 'GAUGE'])
 
     def __init__(self, path, value, raw_value=None, timestamp=None, precision=0,
                  host=None, metric_type='COUNTER', ttl=None):
@@ -24,7 +44,8 @@ class Metric(object):
         """
 
         # Validate the path, value and metric_type submitted
-        if (None in [path, value] or metric_type not in self._METRIC_TYPES):
+        if (path is None or value is None
+                or metric_type not in self._METRIC_TYPES):
             raise DiamondException(("Invalid parameter when creating new "
                                     "Metric with path: %r value: %r "
                                     "metric_type: %r")
@@ -35,7 +56,7 @@ class Metric(object):
             timestamp = int(time.time())
         else:
             # If the timestamp isn't an int, then make it one
-            if not isinstance(timestamp, int):
+            if timestamp.__class__ is not int:
                 try:
                     timestamp = int(timestamp)
                 except ValueError, e:
@@ -63,21 +84,41 @@ class Metric(object):
         self.host = host
         self.metric_type = metric_type
         self.ttl = ttl
+        self._line = None
+        self._parts = None
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name))
+                    for name in self.__slots__ if name[0] != '_')
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._line = None
+        self._parts = None
 
     def __repr__(self):
         """
         Return the Metric as a string
         """
-        if not isinstance(self.precision, (int, long)):
+        # The line is only formatted once, unless the metric was modified
+        path, value, timestamp, precision = (self.path, self.value,
+                                             self.timestamp, self.precision)
+        cached = self._line
+        if cached is not None and cached[0] == (path, value, timestamp,
+                                                precision):
+            return cached[1]
+
+        if (precision.__class__ is not int
+                and not isinstance(precision, (int, long))):
             log = logging.getLogger('diamond')
             log.warn('Metric %s does not have a valid precision', self.path)
-            self.precision = 0
-
-        # Set the format string
-        fstring = "%%s %%0.%if %%i\n" % self.precision
+            self.precision = precision = 0
 
         # Return formated string
-        return fstring % (self.path, self.value, self.timestamp)
+        line = _get_format(precision) % (path, value, timestamp)
+        self._line = ((path, value, timestamp, precision), line)
+        return line
 
     @classmethod
     def parse(cls, string):
@@ -98,19 +139,38 @@ class Metric(object):
             raise DiamondException(
                 "Metric could not be parsed from string: %s." % string)
 
+    def _get_path_cache(self):
+        """
+        Return the dict caching path components, emptied whenever the path
+        or the host changed since it was filled
+        """
+        cached = self._parts
+        if (cached is None
+                or cached[0] is not self.path
+                or cached[1] is not self.host):
+            cached = self._parts = (self.path, self.host, {})
+        return cached[2]
+
     def getPathPrefix(self):
         """
             Returns the path prefix path
             servers.host.cpu.total.idle
             return "servers"
         """
+        cache = self._get_path_cache()
+        if 'prefix' in cache:
+            return cache['prefix']
+
         # If we don't have a host name, assume it's just the first part of the
         # metric path
         if self.host is None:
-            return self.path.split('.')[0]
+            prefix = self.path.split('.')[0]
+        else:
+            offset = self.path.index(self.host) - 1
+            prefix = self.path[0:offset]
 
-        offset = self.path.index(self.host) - 1
-        return self.path[0:offset]
+        cache['prefix'] = prefix
+        return prefix
 
     def getCollectorPath(self):
         """
@@ -118,15 +178,22 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "cpu"
         """
+        cache = self._get_path_cache()
+        if 'collector' in cache:
+            return cache['collector']
+
         # If we don't have a host name, assume it's just the third part of the
         # metric path
         if self.host is None:
-            return self.path.split('.')[2]
+            collector = self.path.split('.')[2]
+        else:
+            offset = self.path.index(self.host)
+            offset += len(self.host) + 1
+            endoffset = self.path.index('.', offset)
+            collector = self.path[offset:endoffset]
 
-        offset = self.path.index(self.host)
-        offset += len(self.host) + 1
-        endoffset = self.path.index('.', offset)
-        return self.path[offset:endoffset]
+        cache['collector'] = collector
+        return collector
 
     def getMetricPath(self):
         """
@@ -134,14 +201,21 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "total.idle"
         """
+        cache = self._get_path_cache()
+        if 'metric' in cache:
+            return cache['metric']
+
         # If we don't have a host name, assume it's just the fourth+ part of the
         # metric path
         if self.host is None:
             path = self.path.split('.')[3:]
-            return '.'.join(path)
+            metric = '.'.join(path)
+        else:
+            prefix = '.'.join([self.getPathPrefix(), self.host,
+                               self.getCollectorPath()])
 
-        prefix = '.'.join([self.getPathPrefix(), self.host,
-                           self.getCollectorPath()])
+            offset = len(prefix) + 1
+            metric = self.path[offset:]
 
-        offset = len(prefix) + 1
-        return self.path[offset:]
+        cache['metric'] = metric
+        return metric
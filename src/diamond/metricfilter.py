@@ -0,0 +1,61 @@
+# coding=utf-8
+
+"""
+Whitelist / blacklist filtering of metric names
+"""
+
+import re
+
+# Maximum number of decisions remembered by a MetricFilter
+DECISION_CACHE_SIZE = 10000
+
+
+def compile_patterns(patterns):
+    """
+    Compile a regex, or a list of regexes merged into a single alternation.
+    Returns None when there is no pattern.
+    """
+    if not patterns:
+        return None
+    if isinstance(patterns, basestring):
+        return re.compile(patterns)
+    if len(patterns) == 1:
+        return re.compile(patterns[0])
+    return re.compile('|'.join(['(?:%s)' % p for p in patterns]))
+
+
+class MetricFilter(object):
+    """
+    Decides whether a metric name is let through, given either a whitelist
+    or a blacklist of regexes matched against the start of the name.
+
+    The set of names published is mostly the same from one interval to the
+    next, so the decision taken for each name is remembered.
+    """
+
+    def __init__(self, whitelist=None, blacklist=None):
+        self.whitelist = compile_patterns(whitelist)
+        self.blacklist = compile_patterns(blacklist)
+        self._decisions = {}
+
+    def allows(self, name):
+        """
+        Return True if the metric name should be let through
+        """
+        try:
+            return self._decisions[name]
+        except KeyError:
+            pass
+
+        if self.whitelist is not None:
+            allowed = self.whitelist.match(name) is not None
+        elif self.blacklist is not None:
+            allowed = self.blacklist.match(name) is None
+        else:
+            allowed = True
+
+        # Don't grow without bounds with ever-changing names
+        if len(self._decisions) >= DECISION_CACHE_SIZE:
+            self._decisions.clear()
+        self._decisions[name] = allowed
+        return allowed
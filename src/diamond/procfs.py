@@ -0,0 +1,139 @@
+# coding=utf-8
+
+"""
+Reading of /proc files for the system collectors.
+
+A ProcFile keeps its file open between runs: reading it again seeks back
+to the start and reads into a buffer allocated once, instead of opening,
+reading line by line and closing the file on every run. The parsers turn
+whole tables of counters into arrays of integers in one pass.
+"""
+
+import io
+import os
+from array import array
+
+# Initial size of the read buffer, grown as needed
+BUFFER_SIZE = 4096
+
+# array typecode holding 64-bit counters, or None if the platform has none
+if array('L').itemsize >= 8:
+    COUNTER_TYPECODE = 'L'
+else:
+    COUNTER_TYPECODE = None
+
+
+class ProcFile(object):
+    """
+    A file of /proc (or /sys), kept open and read whole on every read()
+    """
+
+    def __init__(self, path, size=BUFFER_SIZE):
+        self.path = path
+        self.file = None
+        self.buffer = bytearray(size)
+
+    def read(self):
+        """
+        Return the current contents of the file
+        """
+        try:
+            return self._read()
+        except (IOError, OSError):
+            # The file may have gone away and come back (a network
+            # interface, a disk), try again from a new fd
+            self.close()
+            return self._read()
+
+    def _read(self):
+        if self.file is None:
+            self.file = io.FileIO(self.path, 'r')
+        else:
+            self.file.seek(0, os.SEEK_SET)
+
+        buffer = self.buffer
+        view = memoryview(buffer)
+        size = 0
+        while True:
+            count = self.file.readinto(view[size:])
+            if not count:
+                break
+            size += count
+            if size == len(buffer):
+                # Grow the buffer, for the next reads as well
+                del view
+                buffer.extend(buffer)
+                view = memoryview(buffer)
+        return view[:size].tobytes()
+
+    def close(self):
+        """
+        Close the file, reopened by the next read()
+        """
+        if self.file is not None:
+            try:
+                self.file.close()
+            except (IOError, OSError):
+                pass
+            self.file = None
+
+
+def counters(values):
+    """
+    Return a sequence of integers as an array of 64-bit counters (or a list
+    where not available)
+    """
+    if COUNTER_TYPECODE is None:
+        return values
+    return array(COUNTER_TYPECODE, values)
+
+
+def parse_table(data, prefix=None, labels=1, min_values=1):
+    """
+    Parse a table of counters, lines of `label value value...`, into a
+    list of (label, counters). With labels > 1 the label is the tuple of
+    the first `labels` fields. Only lines starting with prefix, if given,
+    and with at least min_values unsigned integers are kept.
+    """
+    rows = []
+    for line in data.splitlines():
+        if prefix is not None and not line.startswith(prefix):
+            continue
+        fields = line.split()
+        if len(fields) < labels + min_values:
+            continue
+        try:
+            values = counters(map(int, fields[labels:]))
+        except (ValueError, OverflowError):
+            continue
+        if labels == 1:
+            rows.append((fields[0], values))
+        else:
+            rows.append((tuple(fields[:labels]), values))
+    return rows
+
+
+def parse_keyvalue(data):
+    """
+    Parse lines of `name value` (or `name: value [unit]`) into a dict of
+    name to integer value, skipping lines without an integer value
+    """
+    if ':' not in data:
+        # Two columns everywhere, as in /proc/vmstat
+        tokens = data.split()
+        if len(tokens) % 2 == 0:
+            try:
+                return dict(zip(tokens[::2], map(int, tokens[1::2])))
+            except ValueError:
+                pass
+
+    values = {}
+    for line in data.splitlines():
+        fields = line.split(None, 2)
+        if len(fields) < 2:
+            continue
+        try:
+            values[fields[0].rstrip(':')] = int(fields[1])
+        except ValueError:
+            continue
+    return values
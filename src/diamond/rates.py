@@ -0,0 +1,118 @@
+# coding=utf-8
+
+"""
+Rates of whole tables of counters, such as the fields of every cpu in
+/proc/stat, computed in one pass instead of a derivative() call per value.
+
+The previous sample is kept as a table whose rows are found by label, so
+rows may come and go between samples (hotplugged cpus, new disks). NumPy is
+used when it is installed, arrays of doubles otherwise.
+"""
+
+from array import array
+
+try:
+    import numpy
+    numpy  # workaround for pyflakes issue #13
+except ImportError:
+    numpy = None
+
+
+class RateTable(object):
+    """
+    Previous sample of a table of counters, returning the rates of the next
+    one
+    """
+
+    def __init__(self, max_value=0, use_numpy=True):
+        """
+        max_value is the value counters roll over at, 0 if they don't
+        """
+        self.max_value = max_value
+        self.numpy = use_numpy and numpy is not None
+        self.labels = None
+        self.index = {}
+        self.values = None
+
+    def update(self, labels, rows, interval=1, allow_negative=False):
+        """
+        Store a sample, a list of labels and the matching list of rows of
+        counters, and return its rates per interval as a list of lists of
+        floats. The rates of a row missing from the previous sample are 0.
+        Rows are cut to the width of the shortest one.
+        """
+        if not rows:
+            self.labels = labels
+            self.index = {}
+            self.values = None
+            return []
+        width = min(len(row) for row in rows)
+        if self.numpy:
+            return self._update_numpy(labels, rows, width, float(interval),
+                                      allow_negative)
+        return self._update_array(labels, rows, width, float(interval),
+                                  allow_negative)
+
+    def _update_numpy(self, labels, rows, width, interval, allow_negative):
+        new = numpy.array([row[:width] for row in rows], dtype=numpy.float64)
+        old = self.values
+        if (labels != self.labels and old is not None
+                and old.shape[1] == width):
+            # Rows were added, removed or moved: line the old rows up
+            aligned = new.copy()
+            for i, label in enumerate(labels):
+                j = self.index.get(label)
+                if j is not None:
+                    aligned[i] = old[j]
+            old = aligned
+        elif old is None or old.shape != new.shape:
+            old = new
+
+        delta = new - old
+        if self.max_value:
+            delta[delta < 0] += self.max_value
+        delta /= interval
+        if not allow_negative:
+            numpy.maximum(delta, 0, delta)
+
+        self._store(labels, new)
+        return delta.tolist()
+
+    def _update_array(self, labels, rows, width, interval, allow_negative):
+        old = self.values
+        if old is not None and labels != self.labels:
+            index = self.index
+            old = [index.get(label) for label in labels]
+            old = [j is not None and self.values[j] or None for j in old]
+        elif old is not None and len(old) != len(rows):
+            old = None
+
+        max_value = self.max_value
+        new = []
+        rates = []
+        for i, row in enumerate(rows):
+            row = array('d', row[:width])
+            new.append(row)
+            previous = old is not None and old[i] or None
+            if previous is None or len(previous) != width:
+                rates.append([0.0] * width)
+                continue
+            deltas = [value - previous_value for value, previous_value
+                      in zip(row, previous)]
+            if max_value:
+                deltas = [delta < 0 and delta + max_value or delta
+                          for delta in deltas]
+            if allow_negative:
+                rates.append([delta / interval for delta in deltas])
+            else:
+                rates.append([delta > 0 and delta / interval or 0.0
+                              for delta in deltas])
+
+        self._store(labels, new)
+        return rates
+
+    def _store(self, labels, values):
+        if labels != self.labels:
+            self.labels = labels
+            self.index = dict((label, i) for i, label in enumerate(labels))
+        self.values = values
@@ -11,6 +11,9 @@ but provides much more:
 * error handling (exceptions in tasks don't kill the scheduler)
 * optional to run scheduler in its own thread or separate process
 * optional to run a task in its own thread or separate process
+* optional bounded pool of persistent threads running the threaded tasks
+* optional alignment of interval tasks on wall clock multiples of their
+  interval, and lateness/drift statistics
 
 If the threading module is available, you can use the various Threaded
 variants of the scheduler and associated tasks. If threading is not
@@ -21,6 +24,10 @@ There are three Scheduler classes:
 
     Scheduler    ThreadedScheduler    ForkedScheduler
 
+ThreadedHeapScheduler is a ThreadedScheduler whose thread waits on a
+condition variable for the next task, instead of sleeping in slices, and
+wakes up as soon as an earlier task is added.
+
 You usually add new tasks to a scheduler using the add_interval_task or
 add_daytime_task methods, with the appropriate processmethod argument
 to select sequential, threaded or forked processing. NOTE: it is impossible
@@ -62,13 +69,21 @@ __all__ = [
     "Task",
     "ThreadedIntervalTask",
     "ThreadedMonthdayTask",
+    "ThreadedHeapScheduler",
     "ThreadedScheduler",
     "ThreadedSingleTask",
     "ThreadedTaskMixin",
     "ThreadedWeekdayTask",
+    "ThreadPool",
+    "TimerQueue",
     "WeekdayTask",
+    "get_stats_sources",
 ]
 
+import bisect
+import heapq
+import itertools
+import math
 import os
 import sys
 import sched
@@ -76,6 +91,17 @@ import time
 import logging
 import traceback
 import weakref
+from collections import deque
+
+
+# Schedulers and pools, whose get_stats() is published by the
+# SelfStatsCollector
+_stats_sources = weakref.WeakKeyDictionary()
+
+
+def get_stats_sources():
+    """Return the existing schedulers and thread pools."""
+    return _stats_sources.keys()
 
 
 class method:
@@ -99,8 +125,16 @@ class Scheduler:
 
     def __init__(self):
         self.running = True
+        self.name = 'Scheduler'
         self.log = logging.getLogger('diamond')
         self.sched = sched.scheduler(time.time, self.__delayfunc)
+        # Run interval tasks on multiples of their interval
+        self.align = False
+        # How late tasks start, and how far the start of interval tasks
+        # moved from their first run, modulo their interval
+        self.lateness = Histogram()
+        self.drift = Histogram()
+        _stats_sources[self] = True
 
     def __delayfunc(self, delay):
         # This delay function is basically a time.sleep() that is
@@ -159,9 +193,41 @@ class Scheduler:
         if not kw:
             kw = {}
         task = TaskClass(taskname, interval, action, args, kw, abs)
-        self.schedule_task(task, initialdelay)
+        if self.align:
+            self.schedule_task_abs(task, self.next_aligned_time(interval))
+        else:
+            self.schedule_task(task, initialdelay)
         return task
 
+    def next_aligned_time(self, interval):
+        """Return the next wall clock time that is a multiple of interval."""
+        return (math.floor(time.time() / interval) + 1) * interval
+
+    def task_started(self, task):
+        """Record the lateness of a task, and the drift of interval tasks.
+
+        Called by the tasks when they are started.
+
+        """
+        now = time.time()
+        event = getattr(task, 'event', None)
+        if event is not None:
+            self.lateness.add(max(0, now - event.time))
+        interval = getattr(task, 'interval', None)
+        if interval:
+            if task.phase is None:
+                task.phase = now % interval
+            else:
+                drift = (now - task.phase) % interval
+                self.drift.add(min(drift, interval - drift))
+
+    def get_stats(self):
+        """Return counters describing the scheduler."""
+        stats = {'tasks': len(self.sched._queue)}
+        stats.update(self.lateness.get_stats('lateness_ms'))
+        stats.update(self.drift.get_stats('drift_ms'))
+        return stats
+
     def add_single_task(self, action, taskname, initialdelay, processmethod,
                         args, kw):
         """Add a new task to the scheduler that will only be executed once."""
@@ -304,6 +370,35 @@ class Scheduler:
                 time.sleep(5)
 
 
+class Histogram(object):
+    """Distribution of durations over fixed millisecond buckets."""
+
+    BUCKETS = (10, 100, 1000, 10000, 60000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.max = 0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.BUCKETS, ms)] += 1
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    def get_stats(self, prefix):
+        """Return cumulative bucket counts, and the maximum since the last
+        call."""
+        stats = {}
+        total = 0
+        for bound, count in zip(self.BUCKETS + ('inf',), self.counts):
+            total += count
+            stats['%s.le_%s' % (prefix, bound)] = total
+        stats['%s.max' % prefix] = int(self.max)
+        self.max = 0
+        return stats
+
+
 class Task(object):
     """Abstract base class of all scheduler tasks"""
 
@@ -317,6 +412,7 @@ class Task(object):
 
     def __call__(self, schedulerref):
         """Execute the task action in the scheduler's thread."""
+        schedulerref().task_started(self)
         try:
             self.execute()
         except Exception, x:
@@ -353,6 +449,8 @@ class IntervalTask(Task):
         self.absolute = abs
         self.interval = interval
         self.duration = 0
+        # Start time of the first run, modulo interval
+        self.phase = None
 
     def execute(self):
         """ Execute the actual task."""
@@ -363,7 +461,10 @@ class IntervalTask(Task):
 
     def reschedule(self, scheduler):
         """Reschedule this task according to its interval (in seconds)."""
-        if self.absolute and self.duration:
+        if scheduler.align:
+            scheduler.schedule_task_abs(
+                self, scheduler.next_aligned_time(self.interval))
+        elif self.absolute and self.duration:
             if self.duration < self.interval:
                 scheduler.schedule_task(self, self.interval - self.duration)
             else:
@@ -463,6 +564,9 @@ try:
             Scheduler.__init__(self)
             # we require a lock around the task queue
             self._lock = threading.Lock()
+            # threaded tasks run in this ThreadPool if set, otherwise in a
+            # new thread each time
+            self.pool = None
 
         def start(self):
             """Splice off a thread in which the scheduler will run."""
@@ -477,6 +581,8 @@ try:
                 self.thread.join()
             except AttributeError:
                 pass
+            if self.pool is not None:
+                self.pool.stop()
 
         def _acquire_lock(self):
             """Lock the thread's task queue."""
@@ -486,13 +592,263 @@ try:
             """Release the lock on the thread's task queue."""
             self._lock.release()
 
+    class TimerEvent(object):
+        """An event of a TimerQueue, ordered by time, priority and then
+        insertion order."""
+
+        __slots__ = ('time', 'priority', 'seq', 'action', 'argument')
+
+        def __init__(self, time, priority, seq, action, argument):
+            self.time = time
+            self.priority = priority
+            self.seq = seq
+            self.action = action
+            self.argument = argument
+
+        def __lt__(self, other):
+            return ((self.time, self.priority, self.seq)
+                    < (other.time, other.priority, other.seq))
+
+    class TimerQueue(object):
+        """Replacement of sched.scheduler for ThreadedHeapScheduler.
+
+        Events are kept in a min-heap. run() waits on a condition variable
+        until the first event is due, and is woken up when an earlier event
+        is added or when stop() is called.
+
+        """
+
+        def __init__(self):
+            self._queue = []
+            self._cond = threading.Condition(threading.Lock())
+            self._seq = itertools.count()
+            self.running = True
+
+        def enterabs(self, time, priority, action, argument):
+            self._cond.acquire()
+            try:
+                event = TimerEvent(time, priority, self._seq.next(), action,
+                                   argument)
+                heapq.heappush(self._queue, event)
+                if self._queue[0] is event:
+                    # The next event changed, wake up run()
+                    self._cond.notify()
+                return event
+            finally:
+                self._cond.release()
+
+        def enter(self, delay, priority, action, argument):
+            return self.enterabs(time.time() + delay, priority, action,
+                                 argument)
+
+        def cancel(self, event):
+            self._cond.acquire()
+            try:
+                self._queue.remove(event)
+                heapq.heapify(self._queue)
+                self._cond.notify()
+            finally:
+                self._cond.release()
+
+        def empty(self):
+            return not self._queue
+
+        def clear(self):
+            self._cond.acquire()
+            try:
+                self._queue[:] = []
+            finally:
+                self._cond.release()
+
+        def stop(self):
+            """Make run() return."""
+            self._cond.acquire()
+            try:
+                self.running = False
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+
+        def _next(self):
+            """Wait for the next due event and remove it from the queue, or
+            return None when stopped."""
+            self._cond.acquire()
+            try:
+                while self.running:
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    delay = self._queue[0].time - time.time()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    return heapq.heappop(self._queue)
+                return None
+            finally:
+                self._cond.release()
+
+        def run(self):
+            """Execute the events as they are due, until stop()."""
+            while True:
+                event = self._next()
+                if event is None:
+                    return
+                event.action(*event.argument)
+
+    class ThreadedHeapScheduler(ThreadedScheduler):
+        """A ThreadedScheduler using a TimerQueue: tasks start on time, even
+        when added while the scheduler is waiting."""
+
+        def __init__(self):
+            ThreadedScheduler.__init__(self)
+            self.sched = TimerQueue()
+
+        def stop(self):
+            """Stop the scheduler and wait for the thread to finish."""
+            self.running = False
+            self.sched.stop()
+            ThreadedScheduler.stop(self)
+
+        def _getqueuetoptime(self):
+            return self.sched._queue[0].time
+
+        def _clearschedqueue(self):
+            self.sched.clear()
+
+        def _run(self):
+            while self.running:
+                try:
+                    self.sched.run()
+                except Exception, x:
+                    self.log.error(
+                        "ERROR DURING SCHEDULER EXECUTION %s \n %s",
+                        x,
+                        "".join(traceback.format_exception(*sys.exc_info())))
+            self._clearschedqueue()
+
+    class ThreadPool(object):
+        """A bounded pool of persistent threads executing threaded tasks.
+
+        At most `size` tasks run at once, the others wait in a queue. A
+        task still queued or running when it is due again is not queued a
+        second time.
+
+        """
+
+        def __init__(self, size, name="TaskPool"):
+            if size < 1:
+                raise ValueError("Pool size must be >0")
+            self.size = size
+            self.name = name
+            self.running = True
+            self.log = logging.getLogger('diamond')
+            self._queue = deque()
+            self._cond = threading.Condition(threading.Lock())
+            self._workers = []
+            self._idle = 0
+            # Tasks queued or running
+            self._pending = set()
+            self.overlaps = 0
+            self.queue_wait = Histogram()
+            self.run_time = Histogram()
+            _stats_sources[self] = True
+
+        def submit(self, task):
+            """Queue a task, unless it is still queued or running.
+
+            Returns False if the task was skipped.
+
+            """
+            self._cond.acquire()
+            try:
+                if not self.running:
+                    return False
+                if task in self._pending:
+                    self.overlaps += 1
+                    self.log.warn("Task %s is still running, skipping this "
+                                  "run", task.name)
+                    return False
+                self._pending.add(task)
+                self._queue.append((time.time(), task))
+                if (len(self._queue) > self._idle
+                        and len(self._workers) < self.size):
+                    worker = threading.Thread(
+                        target=self._work,
+                        name='%s-%d' % (self.name, len(self._workers)))
+                    worker.setDaemon(True)
+                    self._workers.append(worker)
+                    worker.start()
+                self._cond.notify()
+                return True
+            finally:
+                self._cond.release()
+
+        def _work(self):
+            while True:
+                self._cond.acquire()
+                try:
+                    while self.running and not self._queue:
+                        self._idle += 1
+                        self._cond.wait()
+                        self._idle -= 1
+                    if not self._queue:
+                        return
+                    queued, task = self._queue.popleft()
+                    start = time.time()
+                    self.queue_wait.add(start - queued)
+                finally:
+                    self._cond.release()
+
+                try:
+                    task.threadedcall()
+                finally:
+                    self._cond.acquire()
+                    try:
+                        self.run_time.add(time.time() - start)
+                        self._pending.discard(task)
+                    finally:
+                        self._cond.release()
+
+        def stop(self):
+            """Run the queued tasks and wait for the threads to finish."""
+            self._cond.acquire()
+            try:
+                self.running = False
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+            for worker in self._workers:
+                worker.join()
+
+        def get_stats(self):
+            """Return counters describing the pool."""
+            self._cond.acquire()
+            try:
+                stats = {
+                    'threads': len(self._workers),
+                    'busy': len(self._workers) - self._idle,
+                    'queued': len(self._queue),
+                    'overlaps': self.overlaps,
+                }
+                stats.update(self.queue_wait.get_stats('queue_wait_ms'))
+                stats.update(self.run_time.get_stats('run_time_ms'))
+                return stats
+            finally:
+                self._cond.release()
+
     class ThreadedTaskMixin:
         """A mixin class to make a Task execute in a separate thread."""
 
         def __call__(self, schedulerref):
-            """Execute the task action in its own thread."""
-            threading.Thread(target=self.threadedcall).start()
-            self.reschedule(schedulerref())
+            """Execute the task action in its own thread, or in the thread
+            pool of the scheduler."""
+            scheduler = schedulerref()
+            scheduler.task_started(self)
+            if getattr(scheduler, 'pool', None) is not None:
+                scheduler.pool.submit(self)
+            else:
+                threading.Thread(target=self.threadedcall).start()
+            self.reschedule(scheduler)
 
         def threadedcall(self):
             # This method is run within its own thread, so we have to
@@ -566,6 +922,7 @@ if hasattr(os, "fork"):
 
         def __call__(self, schedulerref):
             """Execute the task action in its own process."""
+            schedulerref().task_started(self)
             pid = os.fork()
             if pid == 0:
                 # we are the child
@@ -7,6 +7,7 @@ import logging
 import traceback
 import configobj
 import inspect
+import zlib
 
 # Path Fix
 sys.path.append(
@@ -16,10 +17,12 @@ sys.path.append(
 
 import diamond
 
-from diamond.collector import Collector
+from diamond.collector import Collector, str_to_bool
 from diamond.handler.Handler import Handler
-from diamond.scheduler import ThreadedScheduler
+from diamond.scheduler import ThreadedHeapScheduler, ThreadedScheduler
+from diamond.scheduler import ThreadPool
 from diamond.util import load_class_from_name
+from diamond.worker import CollectorWorker, PipeHandler, WorkerPool
 
 
 class Server(object):
@@ -36,7 +39,16 @@ class Server(object):
         self.handlers = []
         self.modules = {}
         self.tasks = {}
+        self.collector_workers = {}
         self.collector_paths = []
+        # Worker processes running the collectors, when [server] workers is
+        # set, and the index of this process among them (None in the main
+        # process)
+        self.worker_count = 0
+        self.worker_pool = None
+        self.worker_index = None
+        self.parent_pid = None
+        self.collectors = {}
         # Initialize Scheduler
         self.scheduler = ThreadedScheduler()
 
@@ -62,6 +74,24 @@ class Server(object):
 
         self.config = config
 
+    def init_scheduler(self):
+        """
+        Set up the scheduler according to the server config
+        """
+        engine = self.config['server'].get('scheduler_engine', 'sched')
+        if engine == 'heap' and not self.tasks:
+            self.scheduler = ThreadedHeapScheduler()
+        elif engine not in ('heap', 'sched'):
+            self.log.error("Unknown scheduler_engine %s, using sched", engine)
+
+        self.scheduler.align = str_to_bool(
+            self.config['server'].get('align_intervals', False))
+
+        # Pool of threads running the Threaded collectors
+        threads = int(self.config['server'].get('collector_threads', 16))
+        if threads > 0 and self.scheduler.pool is None:
+            self.scheduler.pool = ThreadPool(threads, 'CollectorPool')
+
     def load_handler(self, fqcn):
         """
         Load Handler class named fqcn
@@ -75,6 +105,42 @@ class Server(object):
         self.log.debug("Loaded Handler: %s", fqcn)
         return cls
 
+    def get_handler_config(self, cls):
+        """
+        Return the config of the Handler class cls
+        """
+        # Initialize Handler config
+        handler_config = configobj.ConfigObj()
+        # Merge default Handler default config
+        handler_config.merge(self.config['handlers']['default'])
+        # Check if Handler config exists
+        if cls.__name__ in self.config['handlers']:
+            # Merge Handler config section
+            handler_config.merge(self.config['handlers'][cls.__name__])
+
+        # Check for config file in config directory
+        configfile = os.path.join(
+            self.config['server']['handlers_config_path'],
+            cls.__name__) + '.conf'
+        if os.path.exists(configfile):
+            # Merge Collector config file
+            handler_config.merge(configobj.ConfigObj(configfile))
+
+        return handler_config
+
+    def reload_handlers(self):
+        """
+        Pass the reloaded config to the handlers
+        """
+        for handler in self.handlers:
+            try:
+                handler.reload_config(
+                    self.get_handler_config(handler.__class__))
+            except Exception:
+                self.log.error("Failed to reload the config of handler %s. %s",
+                               handler.__class__.__name__,
+                               traceback.format_exc())
+
     def load_handlers(self):
         """
         Load handlers
@@ -88,25 +154,8 @@ class Server(object):
                 # Load Handler Class
                 cls = self.load_handler(h)
 
-                # Initialize Handler config
-                handler_config = configobj.ConfigObj()
-                # Merge default Handler default config
-                handler_config.merge(self.config['handlers']['default'])
-                # Check if Handler config exists
-                if cls.__name__ in self.config['handlers']:
-                    # Merge Handler config section
-                    handler_config.merge(self.config['handlers'][cls.__name__])
-
-                # Check for config file in config directory
-                configfile = os.path.join(
-                    self.config['server']['handlers_config_path'],
-                    cls.__name__) + '.conf'
-                if os.path.exists(configfile):
-                    # Merge Collector config file
-                    handler_config.merge(configobj.ConfigObj(configfile))
-
                 # Initialize Handler class
-                self.handlers.append(cls(handler_config))
+                self.handlers.append(cls(self.get_handler_config(cls)))
 
             except (ImportError, SyntaxError):
                 # Log Error
@@ -267,6 +316,99 @@ class Server(object):
         # Return collector
         return collector
 
+    def get_collector_option(self, cls, name, default=None):
+        """
+        Return an option of the config of the collector class cls, merged
+        as the collector does, without instantiating it
+        """
+        collectors = self.config.get('collectors', {})
+        configs = [collectors.get('default', {}),
+                   collectors.get(cls.__name__, {})]
+        configfile = os.path.join(
+            self.config['server']['collectors_config_path'],
+            cls.__name__) + '.conf'
+        if os.path.exists(configfile):
+            configs.append(configobj.ConfigObj(configfile))
+        value = default
+        for config in configs:
+            value = config.get(name, value)
+        return value
+
+    def get_collector_worker(self, cls):
+        """
+        Return the index of the worker process running the collector class
+        cls, None when it runs in the main process
+        """
+        if self.worker_count < 1:
+            return None
+        worker = str(self.get_collector_option(cls, 'worker', '')).strip()
+        if worker == 'main':
+            return None
+        if worker:
+            try:
+                index = int(worker)
+            except ValueError:
+                index = -1
+            if index >= 0:
+                return index % self.worker_count
+            if self.worker_index is None:
+                # Logged once, by the main process
+                self.log.error("Invalid worker %r for collector %s, "
+                               "expecting an index from 0 or main. Placing "
+                               "it by its name.", worker, cls.__name__)
+        # Spread the collectors over the workers, the same way on restarts
+        return (zlib.crc32(cls.__name__) & 0xffffffff) % self.worker_count
+
+    def init_collectors(self, classes):
+        """
+        Initialize and schedule the collectors run by this process
+        """
+        for cls in classes:
+            if self.get_collector_worker(cls) != self.worker_index:
+                continue
+            # Initialize Collector
+            c = self.init_collector(cls)
+            # Schedule Collector
+            self.schedule_collector(c)
+
+    def start_workers(self):
+        """
+        Start the worker processes running the collectors, if configured.
+        Changing their number takes a restart.
+        """
+        self.worker_count = int(self.config['server'].get('workers', 0))
+        if self.worker_count < 1:
+            return
+        # Their metrics are read once there are handlers for them
+        self.worker_pool = WorkerPool(self.worker_count, self.run_worker,
+                                      self.handlers)
+        self.worker_pool.start_workers()
+
+    def run_worker(self, index, fd):
+        """
+        Main of a worker process: run the collectors of its share with its
+        own scheduler, sending their metrics to the main process on fd
+        """
+        self.worker_index = index
+        self.parent_pid = os.getppid()
+        self.worker_pool = None
+        self.tasks = {}
+        self.collector_workers = {}
+        # A worker restarted after the handlers were loaded inherits them:
+        # drop their connections, which then end when the main process
+        # closes them. They are kept referenced, so that nothing they
+        # buffered is flushed from here when they are freed.
+        for handler in self.handlers:
+            handler.close_inherited()
+        self.inherited_handlers = self.handlers
+        self.handlers = [PipeHandler(fd, flush_frames=True)]
+        self.scheduler = ThreadedScheduler()
+        self.init_scheduler()
+
+        self.init_collectors(self.collectors.values())
+
+        self.mainloop()
+
     def schedule_collector(self, c, interval_task=True):
         """
         Schedule collector
@@ -292,6 +434,8 @@ class Server(object):
                 self.scheduler.cancel(self.tasks[name])
                 # Log
                 self.log.debug("Canceled task: %s", name)
+            if name in self.collector_workers:
+                self.collector_workers.pop(name).stop()
 
             method = diamond.scheduler.method.sequential
 
@@ -299,7 +443,16 @@ class Server(object):
                 if c.config['method'] == 'Threaded':
                     method = diamond.scheduler.method.threaded
                 elif c.config['method'] == 'Forked':
-                    method = diamond.scheduler.method.forked
+                    # The collector runs in a long-lived worker process,
+                    # keeping its state between runs, and the metrics are
+                    # handled here from a thread waiting on the worker
+                    worker = CollectorWorker(
+                        c, func, args,
+                        max_runs=int(c.config.get('worker_max_runs', 0)))
+                    self.collector_workers[name] = worker
+                    func = worker.run
+                    args = None
+                    method = diamond.scheduler.method.threaded
 
             # Schedule Collector
             if interval_task:
@@ -334,12 +487,7 @@ class Server(object):
 
         # Load config
         self.load_config()
-
-        # Load handlers
-        if 'handlers_path' in self.config['server']:
-            handlers_path = self.config['server']['handlers_path']
-            self.load_include_path([handlers_path])
-        self.load_handlers()
+        self.init_scheduler()
 
         # Load collectors
 
@@ -353,13 +501,22 @@ class Server(object):
         self.load_include_path(self.collector_paths)
 
         collectors = self.load_collectors(self.collector_paths)
+        self.collectors = collectors
+
+        # Start the worker processes running the collectors, before there
+        # are handlers, whose connections and files they would inherit
+        self.start_workers()
+
+        # Load handlers
+        if 'handlers_path' in self.config['server']:
+            handlers_path = self.config['server']['handlers_path']
+            self.load_include_path([handlers_path])
+        self.load_handlers()
+        if self.worker_pool is not None:
+            self.worker_pool.start_reader()
 
         # Setup Collectors
-        for cls in collectors.values():
-            # Initialize Collector
-            c = self.init_collector(cls)
-            # Schedule Collector
-            self.schedule_collector(c)
+        self.init_collectors(collectors.values())
 
         # Start main loop
         self.mainloop()
@@ -383,6 +540,7 @@ class Server(object):
 
         # Load config
         self.load_config()
+        self.init_scheduler()
 
         # Load collectors
         if os.path.dirname(file) == '':
@@ -429,6 +587,14 @@ class Server(object):
             time.sleep(1)
             time_since_reload += 1
 
+            # Restart the worker processes that exited
+            if self.worker_pool is not None:
+                self.worker_pool.check()
+            # Worker processes exit along with the main process
+            if (self.parent_pid is not None
+                    and os.getppid() != self.parent_pid):
+                break
+
             # Check if its time to reload collectors
             if (reload
                     and time_since_reload
@@ -436,15 +602,15 @@ class Server(object):
                 self.log.debug("Reloading config.")
                 self.load_config()
                 # Log
+                self.log.debug("Reloading handlers.")
+                self.reload_handlers()
+                # Log
                 self.log.debug("Reloading collectors.")
                 # Load collectors
                 collectors = self.load_collectors(self.collector_paths)
+                self.collectors.update(collectors)
                 # Setup any Collectors that were loaded
-                for cls in collectors.values():
-                    # Initialize Collector
-                    c = self.init_collector(cls)
-                    # Schedule Collector
-                    self.schedule_collector(c)
+                self.init_collectors(collectors.values())
 
                 # Reset reload timer
                 time_since_reload = 0
@@ -457,6 +623,8 @@ class Server(object):
         self.log.debug('Stopping task scheduler.')
         # Stop scheduler
         self.scheduler.stop()
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
         # Log
         self.log.info('Stopped task scheduler.')
         # Log
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+"""
+Benchmark of diamond.jsonstream against json.load, on index stats of
+elasticsearch of many indices, as the elasticsearch collector reads them
+
+    python src/diamond/test/benchjsonstream.py [indices]
+
+Not part of the unit tests, run it by hand when changing diamond.jsonstream.
+The peak RSS of each way is measured in a child process of its own.
+"""
+
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', '..')))
+
+from diamond import jsonstream
+
+INDEX_PATHS = ['docs.count', 'docs.deleted', 'store.size_in_bytes',
+               '*.*total', '*.*time_in_millis']
+
+STATS = {
+    'docs': {'count': 4, 'deleted': 0},
+    'store': {'size_in_bytes': 2674, 'throttle_time_in_millis': 0},
+    'indexing': {'index_total': 4, 'index_time_in_millis': 10,
+                 'index_current': 0, 'delete_total': 0,
+                 'delete_time_in_millis': 0, 'delete_current': 0},
+    'get': {'total': 1, 'time_in_millis': 0, 'exists_total': 1,
+            'exists_time_in_millis': 0, 'missing_total': 0,
+            'missing_time_in_millis': 0, 'current': 0},
+    'search': {'query_total': 21, 'query_time_in_millis': 35,
+               'query_current': 0, 'fetch_total': 3,
+               'fetch_time_in_millis': 1, 'fetch_current': 0},
+}
+
+
+def write_stats(path, count):
+    indices = {}
+    for i in xrange(count):
+        indices['logstash-%05d' % i] = {'primaries': STATS, 'total': STATS}
+    f = open(path, 'w')
+    json.dump({'_all': {'primaries': STATS, 'total': STATS},
+               'indices': indices}, f, indent=2)
+    f.close()
+
+
+def bench(label, func):
+    pid = os.fork()
+    if pid == 0:
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print "%-34s %6.2fs  %7d KB peak RSS" % (label, elapsed, rss)
+        sys.stdout.flush()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 10000
+
+    path = tempfile.mktemp()
+    write_stats(path, count)
+    print "%d indices, %d bytes" % (count, os.path.getsize(path))
+
+    all_paths = []
+    for path_ in INDEX_PATHS:
+        all_paths.append(['_all', 'primaries'] + path_.split('.'))
+        all_paths.append(['indices', '*', 'primaries'] + path_.split('.'))
+    some_paths = [['indices', 'logstash-0000*', 'primaries'] +
+                  path_.split('.') for path_ in INDEX_PATHS]
+    try:
+        bench('json.load', lambda: json.load(open(path)))
+        bench('jsonstream.load',
+              lambda: jsonstream.load(open(path), all_paths))
+        bench('jsonstream.load, 10 indices',
+              lambda: jsonstream.load(open(path), some_paths))
+    finally:
+        os.unlink(path)
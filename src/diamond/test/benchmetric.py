@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+"""
+Micro-benchmark for Metric creation and formatting
+
+    python src/diamond/test/benchmetric.py [count]
+
+Not part of the unit tests, run it by hand when changing diamond.metric
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', '..')))
+
+from diamond.metric import Metric
+
+
+def bench(label, func, count):
+    start = time.time()
+    func(count)
+    elapsed = time.time() - start
+    print "%-24s %9d metrics in %6.2fs  %10.0f metrics/s" % (
+        label, count, elapsed, count / elapsed)
+
+
+def create(count):
+    for i in xrange(count):
+        Metric('servers.host.cpu.total.idle', i, timestamp=1234567890,
+               precision=2, host='host', metric_type='GAUGE')
+
+
+def create_and_format(count):
+    for i in xrange(count):
+        str(Metric('servers.host.cpu.total.idle', i, timestamp=1234567890,
+                   precision=2, host='host', metric_type='GAUGE'))
+
+
+def format_shared(count):
+    # Several handlers formatting the same metric
+    metric = Metric('servers.host.cpu.total.idle', 0.5,
+                    timestamp=1234567890, precision=2, host='host')
+    for i in xrange(count):
+        str(metric)
+
+
+def path_components(count):
+    metric = Metric('servers.host.cpu.total.idle', 0.5,
+                    timestamp=1234567890, precision=2, host='host')
+    for i in xrange(count):
+        metric.getPathPrefix()
+        metric.getCollectorPath()
+        metric.getMetricPath()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 1000000
+
+    bench('create', create, count)
+    bench('create and format', create_and_format, count)
+    bench('format shared metric', format_shared, count)
+    bench('path components', path_components, count)
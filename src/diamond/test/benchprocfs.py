@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+"""
+Benchmark of diamond.procfs against opening and splitting the /proc files
+on every read, as the system collectors used to
+
+    python src/diamond/test/benchprocfs.py [count]
+
+Not part of the unit tests, run it by hand when changing diamond.procfs.
+Run it under `strace -c -f` to compare the syscalls.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', '..')))
+
+from diamond.procfs import ProcFile, parse_keyvalue, parse_table
+
+
+def open_table(path):
+    rows = []
+    f = open(path)
+    for line in f:
+        fields = line.split()
+        rows.append((fields[0], [int(v) for v in fields[1:]
+                                 if v.isdigit()]))
+    f.close()
+    return rows
+
+
+def open_keyvalue(path):
+    values = {}
+    f = open(path)
+    for line in f:
+        fields = line.split()
+        values[fields[0]] = int(fields[1])
+    f.close()
+    return values
+
+
+def bench(label, func, count):
+    start = time.time()
+    for i in xrange(count):
+        func()
+    elapsed = time.time() - start
+    print "%-28s %7d reads in %6.2fs  %8.1f us/read" % (
+        label, count, elapsed, elapsed * 1000000 / count)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 10000
+
+    for path, parse, parse_open in [
+            ('/proc/stat', parse_table, open_table),
+            ('/proc/diskstats', parse_table, open_table),
+            ('/proc/meminfo', parse_keyvalue, open_keyvalue),
+            ('/proc/vmstat', parse_keyvalue, open_keyvalue)]:
+        if not os.access(path, os.R_OK):
+            continue
+        proc_file = ProcFile(path)
+        bench('open %s' % path, lambda: parse_open(path), count)
+        bench('procfs %s' % path, lambda: parse(proc_file.read()), count)
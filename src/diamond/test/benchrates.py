@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+"""
+Benchmark of diamond.rates against a Collector.derivative() call per value,
+as the cpu collector used to
+
+    python src/diamond/test/benchrates.py [cpus] [count]
+
+Not part of the unit tests, run it by hand when changing diamond.rates.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', '..')))
+
+import configobj
+
+from diamond.collector import Collector, MAX_COUNTER
+from diamond.rates import RateTable
+
+FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+          'steal', 'guest', 'guest_nice']
+
+
+def get_collector():
+    config = configobj.ConfigObj()
+    config['server'] = {}
+    config['server']['collectors_config_path'] = ''
+    config['collectors'] = {}
+    config['collectors']['default'] = {'hostname': 'localhost'}
+    return Collector(config, [])
+
+
+def bench(label, func, samples):
+    start = time.time()
+    for labels, rows in samples:
+        func(labels, rows)
+    elapsed = time.time() - start
+    print "%-24s %7d samples in %6.2fs  %8.1f us/sample" % (
+        label, len(samples), elapsed, elapsed * 1000000 / len(samples))
+
+
+if __name__ == "__main__":
+    cpus = len(sys.argv) > 1 and int(sys.argv[1]) or 64
+    count = len(sys.argv) > 2 and int(sys.argv[2]) or 1000
+
+    labels = ['cpu%d' % i for i in range(cpus)]
+    samples = [(labels, [[n * (i + j) for j in range(len(FIELDS))]
+                         for i in range(cpus)])
+               for n in range(count)]
+
+    collector = get_collector()
+
+    def per_value(labels, rows):
+        for cpu, row in zip(labels, rows):
+            for field, value in zip(FIELDS, row):
+                collector.derivative('%s.%s' % (cpu, field), value,
+                                     MAX_COUNTER)
+
+    bench('derivative()', per_value, samples)
+    for use_numpy in (False, True):
+        table = RateTable(MAX_COUNTER, use_numpy=use_numpy)
+        if use_numpy and not table.numpy:
+            continue
+        bench('RateTable(numpy=%s)' % use_numpy,
+              lambda labels, rows: table.update(labels, rows, 10), samples)
@@ -3,6 +3,7 @@
 ################################################################################
 
 from test import unittest
+from mock import Mock, patch
 import configobj
 
 from diamond.collector import Collector
@@ -32,3 +33,113 @@ class BaseCollectorTest(unittest.TestCase):
         }
         c = Collector(config, [])
         self.assertEquals('custom.localhost', c.get_hostname())
+
+    def get_config(self, **collector_config):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+        }
+        config['collectors']['Collector'] = collector_config
+        return config
+
+    def test_get_metric_path(self):
+        c = Collector(self.get_config(path='cpu'), [])
+        self.assertEquals('servers.custom.localhost.cpu.total.idle',
+                          c.get_metric_path('total.idle'))
+        self.assertEquals('instances.vm1.cpu.total.idle',
+                          c.get_metric_path('total.idle', instance='vm1'))
+
+    def test_get_metric_path_dot_path(self):
+        c = Collector(self.get_config(path='.', path_suffix='suffix'), [])
+        self.assertEquals('servers.custom.localhost.suffix.total.idle',
+                          c.get_metric_path('total.idle'))
+        self.assertEquals('instances.vm1.total.idle',
+                          c.get_metric_path('total.idle', instance='vm1'))
+
+    def test_get_metric_path_is_cached(self):
+        c = Collector(self.get_config(path='cpu'), [])
+        path = c.get_metric_path('total.idle')
+        c.config['path'] = 'changed'
+        self.assertTrue(path is c.get_metric_path('total.idle'))
+
+    def test_publish_many(self):
+        handler = Mock()
+        c = Collector(self.get_config(path='cpu'), [handler])
+        c.publish_many({'total.idle': 1, 'total.user': 2})
+
+        self.assertEqual(handler._process.call_count, 0)
+        self.assertEqual(handler._process_batch.call_count, 1)
+        metrics = handler._process_batch.call_args[0][0]
+        self.assertEqual(
+            sorted((m.path, m.value) for m in metrics),
+            [('servers.custom.localhost.cpu.total.idle', 1),
+             ('servers.custom.localhost.cpu.total.user', 2)])
+
+    def test_derivative_table(self):
+        c = Collector(self.get_config(path='cpu', interval=10), [])
+        c.derivative_table('cpu', ['total'], [[100, 200]])
+        self.assertEqual(
+            c.derivative_table('cpu', ['total'], [[150, 400]]),
+            [[5.0, 20.0]])
+        self.assertEqual(
+            c.derivative_table('cpu', ['total'], [[160, 500]],
+                               time_delta=False),
+            [[10.0, 100.0]])
+
+    @patch('diamond.collector.monotonic')
+    def test_derivative_measured_interval(self, monotonic):
+        c = Collector(self.get_config(path='cpu', interval=10), [])
+        values = iter([100, 150, 250])
+        c.collect = lambda: c.publish_counter('total.idle',
+                                              values.next())
+        handler = Mock()
+        c.handlers = [handler]
+
+        monotonic.return_value = 1000.0
+        c._run()
+        # A run late by 10 seconds
+        monotonic.return_value = 1020.0
+        c._run()
+        self.assertEqual(handler._process.call_args[0][0].value, 2.5)
+
+        # Outside of a run, the configured interval
+        c.collect()
+        self.assertEqual(handler._process.call_args[0][0].value, 10)
+
+    @patch('diamond.collector.monotonic')
+    def test_derivative_table_measured_interval(self, monotonic):
+        c = Collector(self.get_config(path='cpu', interval=10), [])
+        results = []
+        values = iter([100, 150])
+        c.collect = lambda: results.append(
+            c.derivative_table('cpu', ['total'], [[values.next()]]))
+
+        monotonic.return_value = 1000.0
+        c._run()
+        monotonic.return_value = 1025.0
+        c._run()
+        self.assertEqual(results[-1], [[2.0]])
+
+    def test_sample_timestamp(self):
+        handler = Mock()
+        c = Collector(self.get_config(path='cpu', sample_timestamp=True),
+                      [handler])
+        c.collect = lambda: c.publish('total.idle', 1)
+
+        with patch('time.time', Mock(return_value=1234567890.5)):
+            c._run()
+        self.assertEqual(handler._process.call_args[0][0].timestamp,
+                         1234567890)
+
+    def test_publish_many_filtered(self):
+        handler = Mock()
+        c = Collector(self.get_config(path='cpu',
+                                      metrics_blacklist='total'), [handler])
+        c.publish_many([('total.idle', 1), ('total.user', 2)])
+        c.publish('cpu0.idle', 3)
+
+        self.assertEqual(handler._process_batch.call_count, 0)
+        self.assertEqual(handler._process.call_count, 1)
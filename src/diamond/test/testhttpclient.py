@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import BaseHTTPServer
+import gzip
+import os
+import SocketServer
+import threading
+import time
+import urllib2
+
+from StringIO import StringIO
+
+from test import unittest
+from mock import patch
+
+from diamond.httpclient import HTTPClient
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/moved')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/missing':
+            return self.send_body('not here', 404)
+
+        if self.path == '/close':
+            # Without telling the client
+            self.close_connection = 1
+
+        body = self.path + ' ' + self.headers.get('authorization', '')
+        if 'proxy-authorization' in self.headers:
+            body += ' ' + self.headers['proxy-authorization']
+        if 'gzip' in self.headers.get('accept-encoding', ''):
+            data = StringIO()
+            f = gzip.GzipFile(fileobj=data, mode='wb')
+            f.write(body)
+            f.close()
+            return self.send_body(data.getvalue(), 200, gzip=True)
+        self.send_body(body, 200)
+
+    def send_body(self, body, code, gzip=False):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        if gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    connections = 0
+
+
+class TestHTTPClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.client = HTTPClient(timeout=5, proxies={})
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keeps_connection(self):
+        for i in range(3):
+            response = self.client.urlopen(self.url + '/a')
+            self.assertEqual(response.read(), '/a ')
+            self.assertEqual(response.getcode(), 200)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_gzip(self):
+        response = self.client.urlopen(self.url + '/gzip')
+        self.assertEqual(response.info().getheader('content-encoding'),
+                         'gzip')
+        self.assertEqual(response.read(), '/gzip ')
+
+    def test_read_in_chunks(self):
+        response = self.client.urlopen(self.url + '/chunks')
+        data = ''
+        while True:
+            chunk = response.read(2)
+            if not chunk:
+                break
+            data += chunk
+        self.assertEqual(data, '/chunks ')
+        # The connection is back in the pool
+        self.assertEqual(len(self.client.idle.values()[0]), 1)
+
+    def test_request_and_basic_auth(self):
+        request = urllib2.Request(self.url.replace('//', '//user:pass@') +
+                                  '/auth')
+        response = self.client.urlopen(request)
+        self.assertEqual(response.read(), '/auth Basic dXNlcjpwYXNz')
+
+    def test_redirect(self):
+        response = self.client.urlopen(self.url + '/redirect')
+        self.assertEqual(response.read(), '/moved ')
+        self.assertEqual(response.geturl(), self.url + '/moved')
+
+    def test_http_error(self):
+        try:
+            self.client.urlopen(self.url + '/missing')
+        except urllib2.HTTPError, e:
+            self.assertEqual(e.code, 404)
+            self.assertEqual(e.read(), 'not here')
+        else:
+            self.fail('no HTTPError raised')
+
+    def test_timeout(self):
+        self.assertRaises(urllib2.URLError, self.client.urlopen,
+                          self.url + '/slow', timeout=0.1)
+
+    def test_retries_closed_connection(self):
+        self.client.urlopen(self.url + '/a').read()
+        # Closed while idle
+        self.client.idle.values()[0][0].sock.close()
+        self.assertEqual(self.client.urlopen(self.url + '/b').read(), '/b ')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_retries_connection_closed_by_server(self):
+        self.assertEqual(self.client.urlopen(self.url + '/close').read(),
+                         '/close ')
+        time.sleep(0.1)
+        self.assertEqual(self.client.urlopen(self.url + '/b').read(), '/b ')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_no_retry_on_timeout(self):
+        self.client.urlopen(self.url + '/a').read()
+        self.assertRaises(urllib2.URLError, self.client.urlopen,
+                          self.url + '/slow', timeout=0.1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_no_retry_post(self):
+        self.client.urlopen(self.url + '/close').read()
+        time.sleep(0.1)
+        self.assertRaises(urllib2.URLError, self.client.urlopen,
+                          self.url + '/b', data='posted')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_proxy(self):
+        client = HTTPClient(timeout=5, proxies={
+            'http': self.url.replace('//', '//user:pass@')})
+        try:
+            response = client.urlopen('http://example.invalid/a?b=c')
+            self.assertEqual(response.read(),
+                             'http://example.invalid/a?b=c  '
+                             'Basic dXNlcjpwYXNz')
+        finally:
+            client.close()
+
+    def test_no_proxy(self):
+        client = HTTPClient(timeout=5, proxies={
+            'http': 'http://127.0.0.1:1'})
+        try:
+            with patch.dict(os.environ, {'no_proxy': '127.0.0.1'}):
+                response = client.urlopen(self.url + '/a')
+            self.assertEqual(response.read(), '/a ')
+        finally:
+            client.close()
+
+    def test_fetch_all(self):
+        urls = [self.url + '/%d' % i for i in range(20)]
+        urls.append(self.url + '/missing')
+        results = self.client.fetch_all(urls, parallelism=4)
+
+        self.assertEqual([result for result, error in results[:-1]],
+                         ['/%d ' % i for i in range(20)])
+        self.assertEqual(results[-1][0], None)
+        self.assertEqual(results[-1][1].code, 404)
+        self.assertTrue(self.server.connections <= 4)
+
+    def test_fetch_all_parse(self):
+        results = self.client.fetch_all([self.url + '/a'],
+                                        parse=lambda r: r.read().upper())
+        self.assertEqual(results, [('/A ', None)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import json
+
+from StringIO import StringIO
+
+from test import unittest
+
+from diamond import jsonstream
+
+DOC = {
+    'nodes': {
+        'abc': {
+            'name': 'node "1" {of [2]}',
+            'jvm': {'mem': {'heap_used_in_bytes': 10,
+                            'heap_used': '10b',
+                            'pools': {'young': {'used_in_bytes': 1}}}},
+            'fs': {'data': [{'disk_reads': 3}, {'disk_reads': 4}]},
+        },
+    },
+    'indices': {
+        'logs-1': {'primaries': {'docs': {'count': 5, 'deleted': 0}},
+                   'total': {'docs': {'count': 10, 'deleted': 0}}},
+        'logs-2': {'primaries': {'docs': {'count': -2.5e3, 'deleted': None}},
+                   'total': {'docs': {'count': True, 'deleted': False}}},
+        'users': {'primaries': {'docs': {'count': 7, 'deleted': 1}}},
+    },
+}
+
+
+class TestLoad(unittest.TestCase):
+
+    def load(self, paths, doc=DOC):
+        text = json.dumps(doc, indent=2)
+        results = []
+        # Blocks of one byte at a time up to the whole document at once
+        for size in (1, 2, 3, 7, 50, 1000, jsonstream.READ_SIZE):
+            results.append(jsonstream.load(StringIO(text), paths, size))
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+        return results[0]
+
+    def test_whole(self):
+        self.assertEqual(self.load(['*']), DOC)
+
+    def test_paths(self):
+        self.assertEqual(self.load([
+            'nodes.*.jvm.mem.*_in_bytes',
+            ('nodes', '*', 'fs', 'data', '0'),
+            'indices.*.primaries.docs.count',
+        ]), {
+            'nodes': {'abc': {
+                'jvm': {'mem': {'heap_used_in_bytes': 10}},
+                'fs': {'data': [{'disk_reads': 3}]},
+            }},
+            'indices': {
+                'logs-1': {'primaries': {'docs': {'count': 5}}},
+                'logs-2': {'primaries': {'docs': {'count': -2.5e3}}},
+                'users': {'primaries': {'docs': {'count': 7}}},
+            },
+        })
+
+    def test_patterns(self):
+        self.assertEqual(self.load([
+            ('indices', 'logs-*', 'total'),
+            ('indices', 'users', 'primaries', 'docs', 'deleted'),
+        ]), {
+            'indices': {
+                'logs-1': {'total': {'docs': {'count': 10, 'deleted': 0}}},
+                'logs-2': {'total': {'docs': {'count': True,
+                                              'deleted': False}}},
+                'users': {'primaries': {'docs': {'deleted': 1}}},
+            },
+        })
+
+    def test_strings(self):
+        doc = {'a': u'é\\"}]', 'b': ['{', '"', '\\']}
+        self.assertEqual(self.load(['a']), {})
+        self.assertEqual(self.load(['nodes.*.name']),
+                         {'nodes': {'abc': {'name': 'node "1" {of [2]}'}}})
+        self.assertEqual(self.load(['a'], doc), {'a': doc['a']})
+        self.assertEqual(self.load(['b'], doc), {'b': doc['b']})
+
+    def test_invalid(self):
+        for text in ['', '{"a": 1', '{"a": [1, 2}', '{"a": tru}',
+                     '{"a": 1} 2']:
+            for size in (1, 1000):
+                self.assertRaises(ValueError, jsonstream.load,
+                                  StringIO(text), ['b'], size)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,12 @@
 
 from test import unittest
 
+try:
+    import cPickle as pickle
+    pickle  # workaround for pyflakes issue #13
+except ImportError:
+    import pickle as pickle
+
 from diamond.metric import Metric
 
 
@@ -102,3 +108,33 @@ class TestMetric(unittest.TestCase):
                 message = 'Actual %s, expected %s' % (actual_value,
                                                       expected_value)
                 self.assertEqual(actual_value, expected_value, message)
+
+    def test_repr_is_updated_when_modified(self):
+        metric = Metric('servers.host.cpu.total.idle', 1, timestamp=123)
+        self.assertEqual(str(metric), 'servers.host.cpu.total.idle 1 123\n')
+
+        metric.value = 2
+        metric.precision = 1
+        self.assertEqual(str(metric), 'servers.host.cpu.total.idle 2.0 123\n')
+
+    def test_path_components_are_updated_when_modified(self):
+        metric = Metric('servers.com.example.www.cpu.total.idle', 0,
+                        host='com.example.www')
+        self.assertEqual(metric.getMetricPath(), 'total.idle')
+
+        metric.path = 'servers.com.example.www.memory.free'
+        self.assertEqual(metric.getCollectorPath(), 'memory')
+        self.assertEqual(metric.getMetricPath(), 'free')
+
+    def test_pickle(self):
+        metric = Metric('servers.com.example.www.cpu.total.idle', 0.5,
+                        timestamp=123, precision=2, host='com.example.www',
+                        metric_type='GAUGE', ttl=20)
+        str(metric)
+
+        for protocol in xrange(0, pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(metric, protocol))
+            for name in ('path', 'value', 'raw_value', 'timestamp',
+                         'precision', 'host', 'metric_type', 'ttl'):
+                self.assertEqual(getattr(copy, name), getattr(metric, name))
+            self.assertEqual(str(copy), str(metric))
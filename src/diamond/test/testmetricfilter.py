@@ -0,0 +1,38 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import unittest
+
+from diamond.metricfilter import MetricFilter
+
+
+class TestMetricFilter(unittest.TestCase):
+
+    def test_no_patterns(self):
+        f = MetricFilter()
+        self.assertTrue(f.allows('cpu.total.idle'))
+
+    def test_whitelist(self):
+        f = MetricFilter(whitelist='cpu\.total')
+        self.assertTrue(f.allows('cpu.total.idle'))
+        self.assertFalse(f.allows('cpu.cpu0.idle'))
+
+    def test_blacklist(self):
+        f = MetricFilter(blacklist='cpu\.total')
+        self.assertFalse(f.allows('cpu.total.idle'))
+        self.assertTrue(f.allows('cpu.cpu0.idle'))
+
+    def test_pattern_list(self):
+        f = MetricFilter(blacklist=['cpu\.total', '.*\.idle$'])
+        self.assertFalse(f.allows('cpu.total.user'))
+        self.assertFalse(f.allows('cpu.cpu0.idle'))
+        self.assertTrue(f.allows('cpu.cpu0.user'))
+
+    def test_decisions_are_cached(self):
+        f = MetricFilter(whitelist='cpu\.total')
+        self.assertTrue(f.allows('cpu.total.idle'))
+        f.whitelist = None
+        f.blacklist = None
+        self.assertTrue(f.allows('cpu.total.idle'))
+        self.assertTrue(f.allows('cpu.cpu0.idle'))
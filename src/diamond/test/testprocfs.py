@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import errno
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import Mock
+
+from diamond.procfs import ProcFile, parse_keyvalue, parse_table
+
+
+class TestProcFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'stat')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        # Rewrite in place, like /proc files change under an open fd
+        f = open(self.path, 'r+' if os.path.exists(self.path) else 'w')
+        f.write(data)
+        f.truncate()
+        f.close()
+
+    def test_read_again(self):
+        self.write('cpu 1 2 3\n')
+        proc_file = ProcFile(self.path)
+        self.assertEqual(proc_file.read(), 'cpu 1 2 3\n')
+        fd = proc_file.file.fileno()
+
+        self.write('cpu 4 5 6\n')
+        self.assertEqual(proc_file.read(), 'cpu 4 5 6\n')
+        # from the same fd
+        self.assertEqual(proc_file.file.fileno(), fd)
+
+    def test_grows_buffer(self):
+        data = ''.join('line %d\n' % i for i in range(100))
+        self.write(data)
+        proc_file = ProcFile(self.path, size=16)
+        self.assertEqual(proc_file.read(), data)
+        self.assertTrue(len(proc_file.buffer) >= len(data))
+        self.assertEqual(proc_file.read(), data)
+
+    def test_reopens(self):
+        self.write('a 1\n')
+        proc_file = ProcFile(self.path)
+        # The fd went stale
+        proc_file.file = Mock()
+        proc_file.file.seek.side_effect = IOError(errno.ENODEV, 'gone')
+        self.assertEqual(proc_file.read(), 'a 1\n')
+        self.assertTrue(proc_file.file.fileno() > 0)
+
+    def test_missing_file(self):
+        proc_file = ProcFile(os.path.join(self.dir, 'missing'))
+        self.assertRaises(IOError, proc_file.read)
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_parse_table(self):
+        data = ('cpu  10 20 30\n'
+                'cpu0 1 2 3\n'
+                'intr 4 5\n'
+                'cpu1 x 2 3\n')
+        rows = parse_table(data, prefix='cpu')
+        self.assertEqual([(label, list(values)) for label, values in rows],
+                         [('cpu', [10, 20, 30]), ('cpu0', [1, 2, 3])])
+
+    def test_parse_table_labels(self):
+        data = ('   8       0 sda 1 2 3 4\n'
+                '   8       1 sda1 1 2\n')
+        rows = parse_table(data, labels=3, min_values=4)
+        self.assertEqual([(label, list(values)) for label, values in rows],
+                         [(('8', '0', 'sda'), [1, 2, 3, 4])])
+
+    def test_parse_table_counters(self):
+        rows = parse_table('cpu %d\n' % (2 ** 64 - 1))
+        self.assertEqual(rows[0][1][0], 2 ** 64 - 1)
+
+    def test_parse_keyvalue(self):
+        data = ('MemTotal:       16328720 kB\n'
+                'HugePages_Total:       0\n'
+                'pgpgin 1234\n'
+                'broken\n')
+        self.assertEqual(parse_keyvalue(data), {
+            'MemTotal': 16328720,
+            'HugePages_Total': 0,
+            'pgpgin': 1234,
+        })
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import unittest, run_only
+
+from diamond.rates import RateTable
+
+try:
+    import numpy
+    numpy  # workaround for pyflakes issue #13
+except ImportError:
+    numpy = None
+
+
+def run_only_if_numpy_is_available(func):
+    return run_only(func, lambda: numpy is not None)
+
+
+class TestRateTable(unittest.TestCase):
+
+    use_numpy = False
+
+    def get_table(self, max_value=0):
+        return RateTable(max_value, use_numpy=self.use_numpy)
+
+    def test_first_sample(self):
+        table = self.get_table()
+        self.assertEqual(table.update(['cpu0'], [[10, 20]]), [[0.0, 0.0]])
+
+    def test_rates(self):
+        table = self.get_table()
+        table.update(['cpu0', 'cpu1'], [[10, 20], [30, 40]])
+        self.assertEqual(
+            table.update(['cpu0', 'cpu1'], [[20, 40], [30, 100]], 10),
+            [[1.0, 2.0], [0.0, 6.0]])
+
+    def test_rollover(self):
+        table = self.get_table(max_value=100)
+        table.update(['a'], [[90]])
+        self.assertEqual(table.update(['a'], [[10]]), [[20.0]])
+
+    def test_negative(self):
+        table = self.get_table()
+        table.update(['a'], [[90]])
+        self.assertEqual(table.update(['a'], [[10]]), [[0.0]])
+        table.update(['a'], [[90]])
+        self.assertEqual(table.update(['a'], [[10]], allow_negative=True),
+                         [[-80.0]])
+
+    def test_rows_change(self):
+        table = self.get_table()
+        table.update(['cpu0', 'cpu1'], [[10], [20]])
+        # cpu0 went away, cpu2 came in
+        self.assertEqual(table.update(['cpu1', 'cpu2'], [[25], [100]]),
+                         [[5.0], [0.0]])
+        self.assertEqual(table.update(['cpu1', 'cpu2'], [[30], [101]]),
+                         [[5.0], [1.0]])
+
+    def test_width(self):
+        table = self.get_table()
+        table.update(['a', 'b'], [[1, 2, 3], [1, 2]])
+        self.assertEqual(table.update(['a', 'b'], [[2, 3, 4], [3, 4]]),
+                         [[1.0, 1.0], [2.0, 2.0]])
+
+    def test_empty(self):
+        table = self.get_table()
+        self.assertEqual(table.update([], []), [])
+        self.assertEqual(table.update(['a'], [[1]]), [[0.0]])
+
+
+class TestRateTableNumpy(TestRateTable):
+    # Same tests, with numpy when it is installed
+
+    use_numpy = True
+
+    @run_only_if_numpy_is_available
+    def test_uses_numpy(self):
+        self.assertTrue(self.get_table().numpy)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import threading
+import time
+
+from test import unittest
+from mock import patch
+
+from diamond.scheduler import Histogram, ThreadPool, ThreadedIntervalTask
+from diamond.scheduler import IntervalTask, Scheduler
+from diamond.scheduler import ThreadedHeapScheduler, TimerQueue
+from diamond.scheduler import method
+
+
+class BlockingAction(object):
+    """
+    Task action waiting for release() before returning
+    """
+
+    def __init__(self, concurrency=1):
+        # Set once `concurrency` calls are running
+        self.started = threading.Event()
+        self.concurrency = concurrency
+        self.event = threading.Event()
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        self.lock.acquire()
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.lock.release()
+        if self.running == self.concurrency:
+            self.started.set()
+        self.event.wait(5)
+        self.lock.acquire()
+        self.running -= 1
+        self.lock.release()
+
+    def release(self):
+        self.event.set()
+
+
+class TestThreadPool(unittest.TestCase):
+
+    def get_task(self, name, action):
+        return ThreadedIntervalTask(name, 10, action, [], {})
+
+    def test_bounded(self):
+        pool = ThreadPool(2)
+        action = BlockingAction(2)
+        tasks = [self.get_task('task%d' % i, action) for i in range(5)]
+
+        for task in tasks:
+            self.assertTrue(pool.submit(task))
+        action.started.wait(5)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['threads'], 2)
+        self.assertEqual(stats['queued'], 3)
+
+        action.release()
+        pool.stop()
+        self.assertEqual(action.calls, 5)
+        self.assertEqual(action.max_running, 2)
+        stats = pool.get_stats()
+        self.assertEqual(stats['queue_wait_ms.le_inf'], 5)
+        self.assertEqual(stats['run_time_ms.le_inf'], 5)
+
+    def test_overlap(self):
+        pool = ThreadPool(4)
+        action = BlockingAction()
+        task = self.get_task('slow', action)
+
+        self.assertTrue(pool.submit(task))
+        action.started.wait(5)
+        # Still running, the next run is skipped
+        self.assertFalse(pool.submit(task))
+        self.assertEqual(pool.get_stats()['overlaps'], 1)
+
+        action.release()
+        pool.stop()
+        self.assertEqual(action.calls, 1)
+
+    def test_reuses_threads(self):
+        pool = ThreadPool(4)
+        calls = []
+        task = self.get_task('quick', lambda: calls.append(1))
+
+        for i in range(10):
+            self.assertTrue(pool.submit(task))
+            # Wait for the worker to be idle again
+            timeout = time.time() + 5
+            while ((len(calls) <= i or pool.get_stats()['busy'])
+                   and time.time() < timeout):
+                time.sleep(0.001)
+
+        pool.stop()
+        self.assertEqual(len(calls), 10)
+        self.assertEqual(pool.get_stats()['threads'], 1)
+
+
+class TestTimerQueue(unittest.TestCase):
+
+    def start(self, queue):
+        thread = threading.Thread(target=queue.run)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def test_order(self):
+        queue = TimerQueue()
+        calls = []
+        now = time.time()
+        queue.enterabs(now + 0.02, 0, calls.append, (2,))
+        queue.enterabs(now, 1, calls.append, (1,))
+        queue.enterabs(now, 0, calls.append, (0,))
+        event = queue.enterabs(now, 0, calls.append, ('cancelled',))
+        queue.enter(0.05, 0, queue.stop, ())
+        queue.cancel(event)
+
+        queue.run()
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_wake_on_insert(self):
+        queue = TimerQueue()
+        done = threading.Event()
+        queue.enter(60, 0, done.set, ())
+        thread = self.start(queue)
+        time.sleep(0.05)
+
+        # An earlier event doesn't wait for the one a minute from now
+        start = time.time()
+        queue.enter(0, 0, done.set, ())
+        done.wait(5)
+        self.assertTrue(done.isSet())
+        self.assertTrue(time.time() - start < 1)
+
+        queue.stop()
+        thread.join(5)
+        self.assertFalse(thread.isAlive())
+        self.assertEqual(len(queue._queue), 1)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_next_aligned_time(self):
+        scheduler = Scheduler()
+        patch_time = patch('time.time', return_value=1234567.5)
+        patch_time.start()
+        try:
+            self.assertEqual(scheduler.next_aligned_time(10), 1234570)
+            self.assertEqual(scheduler.next_aligned_time(60), 1234620)
+        finally:
+            patch_time.stop()
+
+    def test_drift(self):
+        scheduler = Scheduler()
+        task = IntervalTask('task', 10, None)
+        patch_time = patch('time.time')
+        time_mock = patch_time.start()
+        try:
+            for now in (1003, 1013.5, 1022, 1031):
+                time_mock.return_value = now
+                scheduler.task_started(task)
+        finally:
+            patch_time.stop()
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['drift_ms.le_1000'], 2)
+        self.assertEqual(stats['drift_ms.max'], 2000)
+
+    def test_heap_scheduler_aligned(self):
+        scheduler = ThreadedHeapScheduler()
+        scheduler.align = True
+        starts = []
+        done = threading.Event()
+
+        def action():
+            starts.append(time.time())
+            if len(starts) == 2:
+                done.set()
+
+        scheduler.start()
+        try:
+            scheduler.add_interval_task(action, 'aligned', 0, 1,
+                                        method.sequential, None, None)
+            done.wait(5)
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(len(starts), 2)
+        for start in starts:
+            self.assertTrue(start - int(start) < 0.2)
+        self.assertEqual(int(starts[1]) - int(starts[0]), 1)
+        self.assertEqual(scheduler.get_stats()['lateness_ms.le_inf'], 2)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram()
+        for seconds in (0.005, 0.05, 0.05, 2, 120):
+            histogram.add(seconds)
+
+        self.assertEqual(histogram.get_stats('run_time_ms'), {
+            'run_time_ms.le_10': 1,
+            'run_time_ms.le_100': 3,
+            'run_time_ms.le_1000': 3,
+            'run_time_ms.le_10000': 4,
+            'run_time_ms.le_60000': 4,
+            'run_time_ms.le_inf': 5,
+            'run_time_ms.max': 120000,
+        })
+        # The maximum is reset once read
+        self.assertEqual(histogram.get_stats('run_time_ms')['run_time_ms.max'],
+                         0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import zlib
+
+from test import unittest
+from mock import Mock
+
+import configobj
+
+from diamond.server import Server
+
+
+class ExampleCollector(object):
+    pass
+
+
+class OtherCollector(object):
+    pass
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        config = configobj.ConfigObj()
+        config['server'] = {'collectors_config_path': '/nonexistent'}
+        config['collectors'] = {'default': {}}
+        self.server = Server(config)
+        self.server.worker_count = 4
+        self.server.log = Mock()
+
+    def get_worker(self, cls, worker=None):
+        if worker is not None:
+            self.server.config['collectors'][cls.__name__] = {
+                'worker': worker}
+        return self.server.get_collector_worker(cls)
+
+    def placed(self, cls):
+        return (zlib.crc32(cls.__name__) & 0xffffffff) % 4
+
+    def test_collector_worker(self):
+        self.assertEqual(self.get_worker(ExampleCollector),
+                         self.placed(ExampleCollector))
+        self.assertEqual(self.get_worker(ExampleCollector, '2'), 2)
+        self.assertEqual(self.get_worker(ExampleCollector, '6'), 2)
+        self.assertEqual(self.get_worker(ExampleCollector, 'main'), None)
+        self.assertEqual(self.server.log.error.call_count, 0)
+
+    def test_collector_worker_invalid(self):
+        for worker in ('2a', 'first', '-1'):
+            self.assertEqual(self.get_worker(ExampleCollector, worker),
+                             self.placed(ExampleCollector))
+        self.assertEqual(self.server.log.error.call_count, 3)
+
+    def test_init_collectors(self):
+        self.get_worker(ExampleCollector, '1')
+        self.get_worker(OtherCollector, 'main')
+        self.server.init_collector = Mock()
+        self.server.schedule_collector = Mock()
+
+        # Only the collectors run by the process are instantiated
+        self.server.worker_index = 1
+        self.server.init_collectors([ExampleCollector, OtherCollector])
+        self.server.init_collector.assert_called_once_with(ExampleCollector)
+
+        self.server.init_collector.reset_mock()
+        self.server.worker_index = None
+        self.server.init_collectors([ExampleCollector, OtherCollector])
+        self.server.init_collector.assert_called_once_with(OtherCollector)
+
+if __name__ == "__main__":
+    unittest.main()
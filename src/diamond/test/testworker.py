@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import os
+import signal
+import time
+
+from test import unittest
+import configobj
+
+from diamond.collector import Collector
+from diamond.handler.Handler import Handler
+from diamond.metric import Metric
+from diamond.worker import CollectorWorker, PipeHandler, WorkerPool
+from diamond.worker import decode_metrics, encode_metric
+
+
+class ListHandler(Handler):
+    """
+    Handler keeping the metrics it processes
+    """
+
+    def __init__(self):
+        Handler.__init__(self, configobj.ConfigObj())
+        self.metrics = []
+        self.flushes = 0
+
+    def process(self, metric):
+        self.metrics.append(metric)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class CounterCollector(Collector):
+    """
+    Publishes a counter growing by 100 on every run, and exits or hangs on
+    the runs listed in the config
+    """
+
+    def __init__(self, *args, **kwargs):
+        Collector.__init__(self, *args, **kwargs)
+        self.runs = 0
+
+    def collect(self):
+        self.runs += 1
+        if self.runs in self.config.get('exit_on', []):
+            os._exit(1)
+        if self.runs in self.config.get('hang_on', []):
+            time.sleep(5)
+        self.publish_counter('requests', self.runs * 100)
+        self.publish('pid', os.getpid())
+
+
+def publish_pid(index, fd):
+    """
+    Worker process target publishing its pid once
+    """
+    handler = PipeHandler(fd, flush_frames=True)
+    handler._process(Metric('workers.%d.pid' % index, os.getpid()))
+    handler._flush()
+    while True:
+        time.sleep(1)
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def get_collector(handler, **collector_config):
+    config = configobj.ConfigObj()
+    config['server'] = {}
+    config['server']['collectors_config_path'] = ''
+    config['collectors'] = {}
+    config['collectors']['default'] = {
+        'hostname': 'localhost',
+        'interval': 10,
+        # The runs follow each other without waiting for the interval
+        'measured_interval': False,
+    }
+    config['collectors']['CounterCollector'] = collector_config
+    return CounterCollector(config, [handler])
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_round_trip(self):
+        metrics = [
+            Metric('servers.host.cpu.total.idle', 12, timestamp=1234567890),
+            Metric('servers.host.cpu.total.user', 0.25, raw_value=1234,
+                   timestamp=1234567891, precision=2, host='host',
+                   metric_type='GAUGE', ttl=30),
+            Metric('servers.host.net.bytes', 2 ** 70, raw_value=1.5,
+                   timestamp=1234567892),
+        ]
+        decoded = decode_metrics(''.join(encode_metric(m) for m in metrics))
+
+        self.assertEqual(len(decoded), 3)
+        for metric, copy in zip(metrics, decoded):
+            self.assertEqual(copy.__getstate__(), metric.__getstate__())
+        self.assertTrue(isinstance(decoded[0].value, int))
+        self.assertEqual(decoded[2].value, float(2 ** 70))
+
+
+class TestCollectorWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.workers = []
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def get_worker(self, handler, timeout=None, max_runs=0,
+                   **collector_config):
+        worker = CollectorWorker(get_collector(handler, **collector_config),
+                                 timeout=timeout, max_runs=max_runs)
+        self.workers.append(worker)
+        return worker
+
+    def get_values(self, handler, name):
+        return [m.value for m in handler.metrics if m.path.endswith(name)]
+
+    def test_keeps_state(self):
+        handler = ListHandler()
+        worker = self.get_worker(handler)
+
+        for i in range(3):
+            worker.run()
+
+        # Rates are computed from the values of the previous runs
+        self.assertEqual(self.get_values(handler, 'requests'),
+                         [0, 10.0, 10.0])
+        # in a single child process
+        pids = self.get_values(handler, 'pid')
+        self.assertEqual(len(set(pids)), 1)
+        self.assertNotEqual(pids[0], os.getpid())
+        self.assertEqual(handler.flushes, 3)
+        self.assertEqual(worker.get_stats(),
+                         {'runs': 3, 'restarts': 0, 'metrics': 6})
+
+    def test_restarts_dead_worker(self):
+        handler = ListHandler()
+        worker = self.get_worker(handler, exit_on=[2])
+
+        for i in range(3):
+            worker.run()
+
+        # The second run died, the third one ran in a new child
+        self.assertEqual(self.get_values(handler, 'requests'), [0, 0])
+        self.assertEqual(len(set(self.get_values(handler, 'pid'))), 2)
+        self.assertEqual(worker.restarts, 1)
+
+    def test_kills_hung_worker(self):
+        handler = ListHandler()
+        worker = self.get_worker(handler, timeout=0.5, hang_on=[2])
+
+        worker.run()
+        start = time.time()
+        worker.run()
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(worker.pid, None)
+
+        worker.run()
+        self.assertEqual(self.get_values(handler, 'requests'), [0, 0])
+        self.assertEqual(worker.restarts, 1)
+
+    def test_max_runs(self):
+        handler = ListHandler()
+        worker = self.get_worker(handler, max_runs=2)
+
+        for i in range(3):
+            worker.run()
+
+        pids = self.get_values(handler, 'pid')
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = ListHandler()
+        self.pool = WorkerPool(2, publish_pid, [self.handler])
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def get_pids(self, index):
+        return [m.value for m in self.handler.metrics
+                if m.path == 'workers.%d.pid' % index]
+
+    def test_forwards_metrics(self):
+        self.assertTrue(wait_for(lambda: self.handler.flushes == 2))
+        for worker in self.pool.workers:
+            self.assertEqual(self.get_pids(worker.index), [worker.pid])
+            self.assertEqual(worker.metrics, 1)
+
+    def test_restarts_workers(self):
+        worker = self.pool.workers[0]
+        self.assertTrue(wait_for(lambda: self.get_pids(0)))
+        pid = worker.pid
+        os.kill(pid, signal.SIGKILL)
+        self.assertTrue(wait_for(lambda: not worker.is_alive()))
+
+        self.pool.check()
+        self.assertTrue(wait_for(lambda: len(self.get_pids(0)) == 2))
+        self.assertEqual(self.get_pids(0), [pid, worker.pid])
+        self.assertEqual(worker.restarts, 1)
+        self.assertEqual(self.pool.workers[1].restarts, 0)
+
+    def test_stats(self):
+        worker = self.pool.workers[0]
+        self.assertTrue(wait_for(lambda: self.get_pids(0)))
+        self.assertEqual(worker.get_stats(), {'restarts': 0, 'metrics': 1})
+        time.sleep(0.05)
+        stats = worker.get_stats()
+        self.assertEqual(stats['metrics_per_second'], 0)
+        if os.path.exists('/proc/%d/stat' % worker.pid):
+            self.assertTrue(0 <= stats['cpu_percent'] < 200)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,8 +2,61 @@
 
 import os
 import sys
+import time
 import inspect
 
+try:
+    import ctypes
+    import ctypes.util
+    ctypes  # workaround for pyflakes issue #13
+except ImportError:
+    ctypes = None
+
+# clockid_t of CLOCK_MONOTONIC on Linux
+CLOCK_MONOTONIC = 1
+
+
+def _get_clock_gettime():
+    if ctypes is None or not sys.platform.startswith('linux'):
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec())) != 0:
+            continue
+
+        def monotonic():
+            # A timespec per call, collectors run in several threads
+            value = timespec()
+            clock_gettime(CLOCK_MONOTONIC, ctypes.byref(value))
+            return value.tv_sec + value.tv_nsec * 1e-9
+        return monotonic
+    return None
+
+
+def _get_monotonic():
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    clock = _get_clock_gettime()
+    if clock is not None:
+        return clock
+    # No monotonic clock, the time of day may jump
+    return time.time
+
+# Time in seconds of a clock that never goes backwards, to measure elapsed
+# time
+monotonic = _get_monotonic()
+
 
 def get_diamond_version():
     try:
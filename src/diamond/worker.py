@@ -0,0 +1,733 @@
+# coding=utf-8
+
+"""
+Collectors running in worker processes.
+
+A CollectorWorker forks a child process the first time its collector runs
+and keeps it: the collector, and with it the last values derivative()
+computes rates from, lives on in the child between runs. On every run the
+parent asks the child to collect, and the child streams the published
+metrics back over a pipe, in a compact binary framing, to be handed to the
+handlers of the parent.
+
+A child that dies, or does not finish a run in time, is killed and a new
+one is forked on the next run. Children exit when the parent closes their
+command pipe, or dies.
+
+A WorkerPool shards the collectors across processes running their own
+scheduler (`[server] workers`), to use more than one core. The collectors
+of a WorkerProcess publish to a PipeHandler, and a thread of the parent
+hands the metrics of all the workers to the handlers. Workers that exit are
+restarted by WorkerPool.check().
+"""
+
+import errno
+import logging
+import os
+import select
+import signal
+import struct
+import threading
+import time
+import traceback
+import weakref
+
+from configobj import ConfigObj
+
+from diamond.handler.Handler import Handler
+from diamond.metric import Metric
+
+# Frame header: kind, payload length
+FRAME = struct.Struct('!BI')
+
+# Parent to child: run the collector
+FRAME_COLLECT = 1
+# Child to parent: encoded metrics, and end of the run
+FRAME_METRICS = 2
+FRAME_DONE = 3
+# Worker process to parent: a collector run ended, flush the handlers
+FRAME_FLUSH = 4
+
+# Metric record: flags, precision, timestamp, value, raw_value, ttl, length
+# of the path, length of the host, followed by the path and the host.
+# Values are packed as 64-bit integers or doubles, according to the flags.
+RECORD = struct.Struct('!BBq8s8sdHH')
+INT64 = struct.Struct('!q')
+DOUBLE = struct.Struct('!d')
+
+FLAG_GAUGE = 0x01
+FLAG_INT_VALUE = 0x02
+FLAG_RAW_VALUE = 0x04
+FLAG_INT_RAW_VALUE = 0x08
+FLAG_TTL = 0x10
+FLAG_HOST = 0x20
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# Size of the metrics buffer the child sends as a frame
+MAX_FRAME_SIZE = 65536
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+# fds of the pipes of all the workers of this process, closed in the
+# children so a worker's pipes are only held by the parent and its child
+_worker_fds = set()
+_fork_lock = threading.Lock()
+
+# Workers, whose get_stats() is published by the SelfStatsCollector
+_stats_sources = weakref.WeakKeyDictionary()
+
+
+def get_stats_sources():
+    """
+    Return the existing workers
+    """
+    return _stats_sources.keys()
+
+
+def _fork(child, fds=()):
+    """
+    Fork a process running child(), with fds and the pipes of the other
+    workers closed. Returns the pid of the child. Called with _fork_lock
+    held.
+    """
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    status = 0
+    try:
+        try:
+            for fd in _worker_fds.union(fds):
+                os.close(fd)
+            _worker_fds.clear()
+            _stats_sources.clear()
+            # The parent stops the children, and is the only one to
+            # handle signals
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Locks of the logging handlers may have been held by other
+            # threads of the parent when it forked
+            for ref in logging._handlerList:
+                handler = ref()
+                if handler is not None:
+                    handler.createLock()
+            child()
+        except Exception:
+            logging.getLogger('diamond').error(traceback.format_exc())
+            status = 1
+    finally:
+        os._exit(status)
+
+
+def _kill(pid):
+    """
+    Kill a child process and wait for it
+    """
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    try:
+        os.waitpid(pid, 0)
+    except OSError:
+        pass
+
+
+def _close(fds):
+    """
+    Close pipes of workers
+    """
+    _fork_lock.acquire()
+    try:
+        for fd in fds:
+            _worker_fds.discard(fd)
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+    finally:
+        _fork_lock.release()
+
+
+def get_cpu_time(pid):
+    """
+    Return the CPU time used by a process, in seconds, None if unknown
+    """
+    try:
+        f = open('/proc/%d/stat' % pid)
+        try:
+            stat = f.read()
+        finally:
+            f.close()
+    except IOError:
+        return None
+    # The command name, in parentheses, may contain spaces
+    fields = stat[stat.rindex(')') + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS)
+
+
+def _pack_number(value):
+    """
+    Return (is_int, packed) for a number
+    """
+    if (isinstance(value, (int, long)) and not isinstance(value, bool)
+            and INT64_MIN <= value <= INT64_MAX):
+        return True, INT64.pack(value)
+    return False, DOUBLE.pack(value)
+
+
+def encode_metric(metric):
+    """
+    Encode a Metric as a binary record
+    """
+    flags = 0
+    if metric.metric_type == 'GAUGE':
+        flags |= FLAG_GAUGE
+
+    is_int, value = _pack_number(metric.value)
+    if is_int:
+        flags |= FLAG_INT_VALUE
+
+    raw_value = '\0' * 8
+    if isinstance(metric.raw_value, (int, long, float)):
+        flags |= FLAG_RAW_VALUE
+        is_int, raw_value = _pack_number(metric.raw_value)
+        if is_int:
+            flags |= FLAG_INT_RAW_VALUE
+
+    ttl = 0.0
+    if metric.ttl is not None:
+        flags |= FLAG_TTL
+        ttl = float(metric.ttl)
+
+    path = metric.path
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    host = ''
+    if metric.host is not None:
+        flags |= FLAG_HOST
+        host = metric.host
+        if isinstance(host, unicode):
+            host = host.encode('utf-8')
+
+    return RECORD.pack(flags, metric.precision, metric.timestamp, value,
+                       raw_value, ttl, len(path), len(host)) + path + host
+
+
+def decode_metrics(data):
+    """
+    Decode the records of a metrics frame into a list of Metrics
+    """
+    metrics = []
+    offset = 0
+    size = len(data)
+    record_size = RECORD.size
+    while offset < size:
+        (flags, precision, timestamp, value, raw_value, ttl, path_len,
+         host_len) = RECORD.unpack_from(data, offset)
+        offset += record_size
+        path = data[offset:offset + path_len]
+        offset += path_len
+        host = None
+        if flags & FLAG_HOST:
+            host = data[offset:offset + host_len]
+            offset += host_len
+
+        if flags & FLAG_INT_VALUE:
+            value = INT64.unpack(value)[0]
+        else:
+            value = DOUBLE.unpack(value)[0]
+        if not flags & FLAG_RAW_VALUE:
+            raw_value = None
+        elif flags & FLAG_INT_RAW_VALUE:
+            raw_value = INT64.unpack(raw_value)[0]
+        else:
+            raw_value = DOUBLE.unpack(raw_value)[0]
+        if not flags & FLAG_TTL:
+            ttl = None
+        if flags & FLAG_GAUGE:
+            metric_type = 'GAUGE'
+        else:
+            metric_type = 'COUNTER'
+
+        metrics.append(Metric(path, value, raw_value=raw_value,
+                              timestamp=timestamp, precision=precision,
+                              host=host, metric_type=metric_type, ttl=ttl))
+    return metrics
+
+
+def write_frame(fd, kind, payload=''):
+    """
+    Write a frame to a pipe
+    """
+    data = FRAME.pack(kind, len(payload)) + payload
+    while data:
+        try:
+            written = os.write(fd, data)
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        data = data[written:]
+
+
+def _read(fd, size, deadline):
+    """
+    Read size bytes from a pipe, before the deadline if one is given.
+    Returns None on end of file or timeout.
+    """
+    chunks = []
+    while size > 0:
+        if deadline is not None:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return None
+            # poll() rather than select(), whose fds must be below 1024
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            try:
+                if not poller.poll(timeout * 1000):
+                    return None
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+        try:
+            chunk = os.read(fd, size)
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def read_frame(fd, deadline=None):
+    """
+    Read a frame from a pipe. Returns (kind, payload), or None on end of
+    file or when the deadline passed.
+    """
+    header = _read(fd, FRAME.size, deadline)
+    if header is None:
+        return None
+    kind, length = FRAME.unpack(header)
+    payload = ''
+    if length:
+        payload = _read(fd, length, deadline)
+        if payload is None:
+            return None
+    return kind, payload
+
+
+class WorkerError(Exception):
+    pass
+
+
+class PipeHandler(Handler):
+    """
+    Handler of the collectors of a worker process, sending the metrics to
+    the parent. With flush_frames, flushing is forwarded to the parent.
+    """
+
+    def __init__(self, fd, flush_frames=False):
+        Handler.__init__(self, ConfigObj())
+        self.fd = fd
+        self.flush_frames = flush_frames
+        self.buffer = []
+        self.buffer_size = 0
+
+    def process(self, metric):
+        record = encode_metric(metric)
+        self.buffer.append(record)
+        self.buffer_size += len(record)
+        if self.buffer_size >= MAX_FRAME_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            payload = ''.join(self.buffer)
+            self.buffer = []
+            self.buffer_size = 0
+            write_frame(self.fd, FRAME_METRICS, payload)
+        if self.flush_frames:
+            write_frame(self.fd, FRAME_FLUSH)
+
+
+class CollectorWorker(object):
+    """
+    Runs a collector in a long-lived child process, handing the metrics it
+    publishes to the handlers of the collector in this process
+    """
+
+    def __init__(self, collector, action=None, args=None, timeout=None,
+                 max_runs=0):
+        """
+        Create a worker calling action(*args), collector._run() by default,
+        in the child. A run not finished within timeout seconds (the
+        collector interval by default) kills the child. The child is
+        replaced after max_runs runs, if not 0.
+        """
+        self.log = logging.getLogger('diamond')
+        self.collector = collector
+        self.action = action or collector._run
+        self.args = args or ()
+        self.name = collector.__class__.__name__
+        self.handlers = collector.handlers
+        if timeout is None:
+            timeout = int(collector.config['interval'])
+        self.timeout = timeout
+        self.max_runs = max_runs
+
+        self.pid = None
+        self.command_fd = None
+        self.metrics_fd = None
+        # Runs of the current child
+        self.child_runs = 0
+        # Counters
+        self.runs = 0
+        self.restarts = 0
+        self.metrics = 0
+
+        _stats_sources[self] = True
+
+    def run(self):
+        """
+        Run the collector in the child, and process the metrics it sends
+        """
+        try:
+            try:
+                if self.pid is None:
+                    self.start()
+                write_frame(self.command_fd, FRAME_COLLECT)
+                deadline = time.time() + self.timeout
+                while True:
+                    frame = read_frame(self.metrics_fd, deadline)
+                    if frame is None:
+                        if time.time() >= deadline:
+                            raise WorkerError("run timed out after %ss"
+                                              % self.timeout)
+                        raise WorkerError("worker process exited")
+                    kind, payload = frame
+                    if kind == FRAME_DONE:
+                        break
+                    metrics = decode_metrics(payload)
+                    self.metrics += len(metrics)
+                    for handler in self.handlers:
+                        handler._process_batch(metrics)
+            except (WorkerError, OSError), e:
+                self.log.error("%s: %s, restarting it", self.name, e)
+                self.stop()
+            except Exception:
+                self.log.error(traceback.format_exc())
+                self.stop()
+        finally:
+            for handler in self.handlers:
+                handler._flush()
+
+        self.runs += 1
+        self.child_runs += 1
+        if self.max_runs and self.child_runs >= self.max_runs:
+            self.stop()
+
+    def start(self):
+        """
+        Fork the child process
+        """
+        if self.runs:
+            self.restarts += 1
+
+        _fork_lock.acquire()
+        try:
+            command_r, command_w = os.pipe()
+            metrics_r, metrics_w = os.pipe()
+            pid = _fork(lambda: self._child(command_r, metrics_w),
+                        (command_w, metrics_r))
+            os.close(command_r)
+            os.close(metrics_w)
+            _worker_fds.update((command_w, metrics_r))
+        finally:
+            _fork_lock.release()
+
+        self.pid = pid
+        self.command_fd = command_w
+        self.metrics_fd = metrics_r
+        self.child_runs = 0
+        self.log.debug("%s: started worker process %d", self.name, pid)
+
+    def stop(self):
+        """
+        Kill the child process
+        """
+        if self.pid is None:
+            return
+        _close((self.command_fd, self.metrics_fd))
+        _kill(self.pid)
+        self.pid = None
+        self.command_fd = None
+        self.metrics_fd = None
+
+    def _child(self, command_fd, metrics_fd):
+        """
+        Main loop of the child: collect on every command of the parent
+        """
+        pipe = PipeHandler(metrics_fd)
+        self.collector.handlers = [pipe]
+        while read_frame(command_fd) is not None:
+            try:
+                self.action(*self.args)
+            except Exception:
+                self.log.error(traceback.format_exc())
+            pipe._flush()
+            write_frame(metrics_fd, FRAME_DONE)
+
+    def get_stats(self):
+        """
+        Return the counters of the worker
+        """
+        return {
+            'runs': self.runs,
+            'restarts': self.restarts,
+            'metrics': self.metrics,
+        }
+
+
+class WorkerProcess(object):
+    """
+    Child process running target(index, fd), which sends frames of metrics
+    to the parent on fd
+    """
+
+    def __init__(self, index, target):
+        self.log = logging.getLogger('diamond')
+        self.index = index
+        self.name = 'worker%d' % index
+        self.target = target
+
+        self.pid = None
+        self.metrics_fd = None
+        # Counters
+        self.restarts = 0
+        self.metrics = 0
+        # Time, CPU time and metrics count at the last get_stats()
+        self._last_stats = None
+
+        _stats_sources[self] = True
+
+    def start(self):
+        """
+        Fork the worker process
+        """
+        if self.pid is not None:
+            return
+        _fork_lock.acquire()
+        try:
+            metrics_r, metrics_w = os.pipe()
+            pid = _fork(lambda: self.target(self.index, metrics_w),
+                        (metrics_r,))
+            os.close(metrics_w)
+            _worker_fds.add(metrics_r)
+        finally:
+            _fork_lock.release()
+
+        self.pid = pid
+        self.metrics_fd = metrics_r
+        self._last_stats = None
+        self.log.info("%s: started worker process %d", self.name, pid)
+
+    def is_alive(self):
+        """
+        Return whether the worker process is running, reaping it if it
+        exited
+        """
+        if self.pid is None:
+            return False
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except OSError:
+            pid, status = self.pid, 0
+        if pid == 0:
+            return True
+        self.log.error("%s: worker process %d exited with status %d",
+                       self.name, self.pid, status)
+        self.pid = None
+        return False
+
+    def stop(self):
+        """
+        Kill the worker process
+        """
+        if self.pid is not None:
+            _kill(self.pid)
+            self.pid = None
+
+    def get_stats(self):
+        """
+        Return the counters of the worker, and its CPU usage (in percent of
+        a core) and metric rate since the previous call
+        """
+        stats = {
+            'restarts': self.restarts,
+            'metrics': self.metrics,
+        }
+        pid = self.pid
+        if pid is None:
+            return stats
+        now = time.time()
+        cpu_time = get_cpu_time(pid)
+        last = self._last_stats
+        self._last_stats = (now, cpu_time, self.metrics)
+        if last is not None and now > last[0]:
+            elapsed = now - last[0]
+            stats['metrics_per_second'] = (self.metrics - last[2]) / elapsed
+            if cpu_time is not None and last[1] is not None:
+                stats['cpu_percent'] = 100.0 * (cpu_time - last[1]) / elapsed
+        return stats
+
+
+class WorkerPool(object):
+    """
+    Worker processes running target(index, fd), whose metrics are handed
+    to handlers by a thread of this process
+    """
+
+    def __init__(self, size, target, handlers):
+        self.log = logging.getLogger('diamond')
+        self.workers = [WorkerProcess(i, target) for i in range(size)]
+        self.handlers = handlers
+        self.running = False
+        # Worker by metrics pipe, and pipes to close, owned by the reader
+        self._fds = {}
+        self._closing = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the workers, and the thread reading their metrics
+        """
+        self.start_workers()
+        self.start_reader()
+
+    def start_workers(self):
+        """
+        Start the workers. Their metrics wait in the pipes until the reader
+        thread is started.
+        """
+        self.running = True
+        for worker in self.workers:
+            self._start_worker(worker)
+
+    def start_reader(self):
+        """
+        Start the thread handing the metrics of the workers to the handlers
+        """
+        self._thread = threading.Thread(target=self._read_loop,
+                                        name='WorkerPoolReader')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def check(self):
+        """
+        Restart the workers that exited
+        """
+        for worker in self.workers:
+            if self.running and not worker.is_alive():
+                worker.restarts += 1
+                self._start_worker(worker)
+
+    def stop(self):
+        """
+        Stop the workers and the reader thread
+        """
+        self.running = False
+        for worker in self.workers:
+            worker.stop()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self._lock.acquire()
+        try:
+            _close(self._fds.keys() + self._closing)
+            self._fds = {}
+            self._closing = []
+        finally:
+            self._lock.release()
+
+    def _start_worker(self, worker):
+        self._lock.acquire()
+        try:
+            # The pipe of the previous process is closed by the reader, a
+            # process it forked may still hold it open
+            if worker.metrics_fd is not None:
+                self._fds.pop(worker.metrics_fd, None)
+                self._closing.append(worker.metrics_fd)
+                worker.metrics_fd = None
+            worker.start()
+            self._fds[worker.metrics_fd] = worker
+        finally:
+            self._lock.release()
+
+    def _read_loop(self):
+        """
+        Hand the metrics sent by the workers to the handlers
+        """
+        while self.running:
+            self._lock.acquire()
+            try:
+                _close(self._closing)
+                self._closing = []
+                fds = self._fds.keys()
+            finally:
+                self._lock.release()
+
+            # poll() rather than select(), whose fds must be below 1024
+            poller = select.poll()
+            for fd in fds:
+                poller.register(fd, select.POLLIN)
+            try:
+                ready = poller.poll(1000)
+            except (select.error, OSError), e:
+                if e.args[0] != errno.EINTR:
+                    self.log.error("WorkerPool: %s", e)
+                    time.sleep(1)
+                continue
+
+            for fd, event in ready:
+                try:
+                    self._read(fd)
+                except Exception:
+                    self.log.error(traceback.format_exc())
+
+    def _read(self, fd):
+        worker = self._fds.get(fd)
+        if worker is None:
+            return
+        frame = read_frame(fd)
+        if frame is None:
+            # The worker exited, check() restarts it
+            self._lock.acquire()
+            try:
+                if self._fds.pop(fd, None) is not None:
+                    worker.metrics_fd = None
+                    self._closing.append(fd)
+            finally:
+                self._lock.release()
+            return
+
+        kind, payload = frame
+        if kind == FRAME_METRICS:
+            metrics = decode_metrics(payload)
+            worker.metrics += len(metrics)
+            for handler in self.handlers:
+                handler._process_batch(metrics)
+        elif kind == FRAME_FLUSH:
+            for handler in self.handlers:
+                handler._flush()